@@ -0,0 +1,92 @@
+"""Trips, stops and daily summaries per device
+
+Revision ID: analytics_summaries
+Revises: device_last_position
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'analytics_summaries'
+down_revision = 'device_last_position'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('device_analytics_state',
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('dirty_since', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('device_id')
+    )
+    op.create_index(op.f('ix_device_analytics_state_dirty_since'), 'device_analytics_state', ['dirty_since'], unique=False)
+
+    op.create_table('trips',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('end_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('start_lat', sa.Float(), nullable=False),
+        sa.Column('start_lon', sa.Float(), nullable=False),
+        sa.Column('end_lat', sa.Float(), nullable=False),
+        sa.Column('end_lon', sa.Float(), nullable=False),
+        sa.Column('distance_m', sa.Float(), nullable=False),
+        sa.Column('moving_s', sa.Float(), nullable=False),
+        sa.Column('max_speed_mps', sa.Float(), nullable=False),
+        sa.Column('point_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_trips_id'), 'trips', ['id'], unique=False)
+    op.create_index('ix_trips_device_id_start_time', 'trips', ['device_id', 'start_time'], unique=False)
+
+    op.create_table('stops',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('end_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=False),
+        sa.Column('lon', sa.Float(), nullable=False),
+        sa.Column('point_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stops_id'), 'stops', ['id'], unique=False)
+    op.create_index('ix_stops_device_id_start_time', 'stops', ['device_id', 'start_time'], unique=False)
+
+    op.create_table('device_daily_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('distance_m', sa.Float(), nullable=False),
+        sa.Column('moving_s', sa.Float(), nullable=False),
+        sa.Column('stopped_s', sa.Float(), nullable=False),
+        sa.Column('trip_count', sa.Integer(), nullable=False),
+        sa.Column('stop_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_device_daily_summary_id'), 'device_daily_summary', ['id'], unique=False)
+    op.create_index('ix_device_daily_summary_device_id_day', 'device_daily_summary', ['device_id', 'day'], unique=True)
+
+    # Historique existant : chaque appareil est marqué depuis son premier
+    # point, le calcul complet est fait par python -m app.analytics ou la
+    # tâche de fond
+    op.execute(
+        "INSERT INTO device_analytics_state (device_id, dirty_since, version) "
+        "SELECT device_id, MIN(timestamp), 1 FROM gps_data GROUP BY device_id"
+    )
+
+def downgrade() -> None:
+    op.drop_index('ix_device_daily_summary_device_id_day', table_name='device_daily_summary')
+    op.drop_index(op.f('ix_device_daily_summary_id'), table_name='device_daily_summary')
+    op.drop_table('device_daily_summary')
+    op.drop_index('ix_stops_device_id_start_time', table_name='stops')
+    op.drop_index(op.f('ix_stops_id'), table_name='stops')
+    op.drop_table('stops')
+    op.drop_index('ix_trips_device_id_start_time', table_name='trips')
+    op.drop_index(op.f('ix_trips_id'), table_name='trips')
+    op.drop_table('trips')
+    op.drop_index(op.f('ix_device_analytics_state_dirty_since'), table_name='device_analytics_state')
+    op.drop_table('device_analytics_state')
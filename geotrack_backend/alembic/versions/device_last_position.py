@@ -0,0 +1,37 @@
+"""Latest position per device for the fleet view
+
+Revision ID: device_last_position
+Revises: gps_data_geohash
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'device_last_position'
+down_revision = 'gps_data_geohash'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('device_last_position',
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=False),
+        sa.Column('lon', sa.Float(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('device_id')
+    )
+    # Initialisation depuis l'historique : (device_id, timestamp) est unique,
+    # donc un seul point par appareil à son timestamp maximal
+    op.execute(
+        "INSERT INTO device_last_position (device_id, lat, lon, timestamp) "
+        "SELECT g.device_id, g.lat, g.lon, g.timestamp FROM gps_data g "
+        "JOIN (SELECT device_id, MAX(timestamp) AS timestamp FROM gps_data GROUP BY device_id) latest "
+        "ON g.device_id = latest.device_id AND g.timestamp = latest.timestamp"
+    )
+
+def downgrade() -> None:
+    op.drop_table('device_last_position')
@@ -0,0 +1,59 @@
+"""Geofences, per-device geofence state and enter/exit events
+
+Revision ID: geofences
+Revises: analytics_summaries
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'geofences'
+down_revision = 'analytics_summaries'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('geofences',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('polygon', sa.Text(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_geofences_id'), 'geofences', ['id'], unique=False)
+
+    op.create_table('device_geofence_state',
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('inside', sa.Text(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('device_id')
+    )
+
+    op.create_table('geofence_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('geofence_id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('event', sa.String(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=False),
+        sa.Column('lon', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_geofence_events_id'), 'geofence_events', ['id'], unique=False)
+    op.create_index('ix_geofence_events_device_id_timestamp', 'geofence_events', ['device_id', 'timestamp'], unique=False)
+    op.create_index('ix_geofence_events_geofence_id_timestamp', 'geofence_events', ['geofence_id', 'timestamp'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_geofence_events_geofence_id_timestamp', table_name='geofence_events')
+    op.drop_index('ix_geofence_events_device_id_timestamp', table_name='geofence_events')
+    op.drop_index(op.f('ix_geofence_events_id'), table_name='geofence_events')
+    op.drop_table('geofence_events')
+    op.drop_table('device_geofence_state')
+    op.drop_index(op.f('ix_geofences_id'), table_name='geofences')
+    op.drop_table('geofences')
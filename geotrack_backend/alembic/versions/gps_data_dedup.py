@@ -0,0 +1,27 @@
+"""Unique (device_id, timestamp) on gps_data
+
+Revision ID: gps_data_dedup
+Revises: initial
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'gps_data_dedup'
+down_revision = 'initial'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Supprimer les doublons existants en gardant la première ligne reçue
+    op.execute(
+        "DELETE FROM gps_data WHERE id NOT IN ("
+        "SELECT MIN(id) FROM gps_data GROUP BY device_id, timestamp)"
+    )
+    op.create_index('ix_gps_data_device_id_timestamp', 'gps_data', ['device_id', 'timestamp'], unique=True)
+
+def downgrade() -> None:
+    op.drop_index('ix_gps_data_device_id_timestamp', table_name='gps_data')
@@ -0,0 +1,48 @@
+"""Geohash column and spatial index on gps_data
+
+Revision ID: gps_data_geohash
+Revises: gps_data_partitioning
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.geo import encode
+
+
+# revision identifiers, used by Alembic.
+revision = 'gps_data_geohash'
+down_revision = 'gps_data_partitioning'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+def upgrade() -> None:
+    op.add_column('gps_data', sa.Column('geohash', sa.String(), nullable=True))
+
+    # Calcul des geohash existants par paquets (l'encodage est fait en Python).
+    # Pagination par curseur sur id : chaque paquet reprend l'index de la clé
+    # primaire là où le précédent s'est arrêté, sans relire la table
+    bind = op.get_bind()
+    select_batch = sa.text(
+        "SELECT id, timestamp, lat, lon FROM gps_data WHERE id > :last_id ORDER BY id LIMIT :limit"
+    )
+    update = sa.text("UPDATE gps_data SET geohash = :geohash WHERE id = :id AND timestamp = :timestamp")
+    last_id = 0
+    while True:
+        rows = bind.execute(select_batch, {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        bind.execute(update, [
+            {"id": row.id, "timestamp": row.timestamp, "geohash": encode(row.lat, row.lon)}
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+    op.create_index('ix_gps_data_geohash_timestamp', 'gps_data', ['geohash', 'timestamp'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index('ix_gps_data_geohash_timestamp', table_name='gps_data')
+    op.drop_column('gps_data', 'geohash')
@@ -0,0 +1,121 @@
+"""Monthly partitions for gps_data and per-minute rollup table
+
+Revision ID: gps_data_partitioning
+Revises: gps_data_timestamp_index
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'gps_data_partitioning'
+down_revision = 'gps_data_timestamp_index'
+branch_labels = None
+depends_on = None
+
+GPS_DATA_INDEXES = ['ix_gps_data_id', 'ix_gps_data_device_id', 'ix_gps_data_timestamp', 'ix_gps_data_device_id_timestamp']
+
+def upgrade() -> None:
+    # Historique résumé (un point par appareil et par minute), voir app/maintenance.py
+    op.create_table('gps_data_minute',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=False),
+        sa.Column('lon', sa.Float(), nullable=False),
+        sa.Column('point_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_gps_data_minute_id'), 'gps_data_minute', ['id'], unique=False)
+    op.create_index(op.f('ix_gps_data_minute_bucket'), 'gps_data_minute', ['bucket'], unique=False)
+    op.create_index('ix_gps_data_minute_device_id_bucket', 'gps_data_minute', ['device_id', 'bucket'], unique=True)
+
+    # Partitionnement natif : PostgreSQL uniquement, SQLite garde une table unique
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("SET LOCAL timezone = 'UTC'")
+    op.execute("ALTER TABLE gps_data RENAME TO gps_data_unpartitioned")
+    op.execute("ALTER TABLE gps_data_unpartitioned RENAME CONSTRAINT gps_data_pkey TO gps_data_unpartitioned_pkey")
+    for index in GPS_DATA_INDEXES:
+        op.execute(f"ALTER INDEX {index} RENAME TO {index.replace('ix_gps_data', 'ix_gps_data_unpartitioned')}")
+    # La séquence des ids est reprise par la nouvelle table
+    op.execute("ALTER SEQUENCE gps_data_id_seq OWNED BY NONE")
+
+    # La clé de partition doit faire partie de la clé primaire et des index uniques
+    op.execute("""
+        CREATE TABLE gps_data (
+            id INTEGER NOT NULL DEFAULT nextval('gps_data_id_seq'),
+            device_id VARCHAR NOT NULL,
+            lat DOUBLE PRECISION NOT NULL,
+            lon DOUBLE PRECISION NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            synced BOOLEAN,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.create_index('ix_gps_data_id', 'gps_data', ['id'], unique=False)
+    op.create_index('ix_gps_data_device_id', 'gps_data', ['device_id'], unique=False)
+    op.create_index('ix_gps_data_timestamp', 'gps_data', ['timestamp'], unique=False)
+    op.create_index('ix_gps_data_device_id_timestamp', 'gps_data', ['device_id', 'timestamp'], unique=True)
+
+    # Une partition par mois, du plus ancien point jusqu'à deux mois d'avance ;
+    # la partition par défaut reçoit les horodatages hors plage
+    op.execute("""
+        DO $$
+        DECLARE m timestamptz;
+        BEGIN
+            m := date_trunc('month', COALESCE((SELECT min(timestamp) FROM gps_data_unpartitioned), now()));
+            WHILE m < date_trunc('month', now()) + interval '3 months' LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF gps_data FOR VALUES FROM (%L) TO (%L)',
+                               'gps_data_' || to_char(m, 'YYYY_MM'), m, m + interval '1 month');
+                m := m + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+    op.execute("CREATE TABLE gps_data_default PARTITION OF gps_data DEFAULT")
+
+    op.execute(
+        "INSERT INTO gps_data (id, device_id, lat, lon, timestamp, synced, created_at) "
+        "SELECT id, device_id, lat, lon, timestamp, synced, created_at FROM gps_data_unpartitioned"
+    )
+    op.execute("DROP TABLE gps_data_unpartitioned")
+    op.execute("ALTER SEQUENCE gps_data_id_seq OWNED BY gps_data.id")
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # Retour à une table unique (les partitions détachées ne sont pas reprises)
+        op.execute("ALTER TABLE gps_data RENAME TO gps_data_partitioned")
+        for index in GPS_DATA_INDEXES:
+            op.execute(f"ALTER INDEX {index} RENAME TO {index.replace('ix_gps_data', 'ix_gps_data_partitioned')}")
+        op.execute("ALTER SEQUENCE gps_data_id_seq OWNED BY NONE")
+        op.execute("""
+            CREATE TABLE gps_data (
+                id INTEGER NOT NULL DEFAULT nextval('gps_data_id_seq'),
+                device_id VARCHAR NOT NULL,
+                lat DOUBLE PRECISION NOT NULL,
+                lon DOUBLE PRECISION NOT NULL,
+                timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                synced BOOLEAN,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                CONSTRAINT gps_data_pkey PRIMARY KEY (id)
+            )
+        """)
+        op.execute(
+            "INSERT INTO gps_data (id, device_id, lat, lon, timestamp, synced, created_at) "
+            "SELECT id, device_id, lat, lon, timestamp, synced, created_at FROM gps_data_partitioned"
+        )
+        op.execute("DROP TABLE gps_data_partitioned")
+        op.execute("ALTER SEQUENCE gps_data_id_seq OWNED BY gps_data.id")
+        op.create_index('ix_gps_data_id', 'gps_data', ['id'], unique=False)
+        op.create_index('ix_gps_data_device_id', 'gps_data', ['device_id'], unique=False)
+        op.create_index('ix_gps_data_timestamp', 'gps_data', ['timestamp'], unique=False)
+        op.create_index('ix_gps_data_device_id_timestamp', 'gps_data', ['device_id', 'timestamp'], unique=True)
+
+    op.drop_index('ix_gps_data_minute_device_id_bucket', table_name='gps_data_minute')
+    op.drop_index(op.f('ix_gps_data_minute_bucket'), table_name='gps_data_minute')
+    op.drop_index(op.f('ix_gps_data_minute_id'), table_name='gps_data_minute')
+    op.drop_table('gps_data_minute')
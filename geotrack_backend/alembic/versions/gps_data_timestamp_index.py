@@ -0,0 +1,25 @@
+"""Timestamp index for keyset pagination on gps_data
+
+Revision ID: gps_data_timestamp_index
+Revises: user_pin_lookup
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'gps_data_timestamp_index'
+down_revision = 'user_pin_lookup'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Les pages d'un appareil utilisent ix_gps_data_device_id_timestamp
+    # (parcouru en ordre inverse pour le tri DESC) ; cet index couvre la
+    # liste tous appareils confondus
+    op.create_index(op.f('ix_gps_data_timestamp'), 'gps_data', ['timestamp'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_gps_data_timestamp'), table_name='gps_data')
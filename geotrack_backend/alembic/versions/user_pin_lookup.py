@@ -0,0 +1,25 @@
+"""Indexed PIN fingerprint on users
+
+Revision ID: user_pin_lookup
+Revises: gps_data_dedup
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'user_pin_lookup'
+down_revision = 'gps_data_dedup'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Renseignée à la prochaine connexion ou au prochain changement de PIN
+    op.add_column('users', sa.Column('pin_lookup', sa.String(), nullable=True))
+    op.create_index(op.f('ix_users_pin_lookup'), 'users', ['pin_lookup'], unique=False)
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_pin_lookup'), table_name='users')
+    op.drop_column('users', 'pin_lookup')
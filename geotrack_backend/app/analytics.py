@@ -0,0 +1,420 @@
+"""Trajets, arrêts et agrégats journaliers par appareil.
+
+Calculés à partir des points GPS, lus dans l'ordre chronologique par
+paquets de ANALYTICS_CHUNK_POINTS : entre deux points consécutifs, la
+vitesse moyenne (distance haversine / durée) classe l'intervalle en
+mouvement (>= STOP_SPEED_MPS) ou à l'arrêt. Une suite d'intervalles à
+l'arrêt d'au moins STOP_MIN_DWELL_S secondes est un arrêt ; tout ce qui
+se trouve entre deux arrêts est un trajet.
+
+L'ingestion marque l'appareil à recalculer (device_analytics_state, voir
+ingest.mark_analytics_dirty). Le calcul reprend au début du dernier segment,
+qui peut encore s'allonger, ou plus tôt pour des points arrivés en retard ;
+il est lancé par la tâche de fond de l'application, avant la lecture d'un
+rapport (si le retard est court, voir ANALYTICS_INLINE_MAX_POINTS), ou à la
+main :
+    python -m app.analytics
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.orm import Session
+
+from . import config  # noqa: F401  (.env chargé avant les autres modules)
+from .concurrency import run_in_threadpool
+from .database import SessionLocal
+from .geo import haversine_array
+from .metrics import counter, summary
+from .models import DeviceAnalyticsState, DeviceDailySummary, GPSData, Stop, Trip
+from .shared import shared_state
+from .track import to_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+STOP_SPEED_MPS = float(os.getenv("STOP_SPEED_MPS", 1.0))
+STOP_MIN_DWELL_S = float(os.getenv("STOP_MIN_DWELL_S", 300))
+ANALYTICS_CHUNK_POINTS = int(os.getenv("ANALYTICS_CHUNK_POINTS", 50000))
+# Tâche de fond : appareils à recalculer toutes les N secondes (0 = désactivée)
+ANALYTICS_REFRESH_INTERVAL_S = float(os.getenv("ANALYTICS_REFRESH_INTERVAL_S", 60))
+ANALYTICS_REFRESH_DEVICES = int(os.getenv("ANALYTICS_REFRESH_DEVICES", 100))
+# Avant un rapport : recalcul dans la requête seulement s'il relit au plus
+# N points ; au-delà (historique complet après migration, long rattrapage)
+# le rapport sert les agrégats enregistrés et la tâche de fond recalcule
+ANALYTICS_INLINE_MAX_POINTS = int(os.getenv("ANALYTICS_INLINE_MAX_POINTS", ANALYTICS_CHUNK_POINTS))
+
+points_processed = counter("analytics_points_processed_total", "Points relus pour le calcul des trajets et arrêts")
+refresh_seconds = summary("analytics_refresh_seconds", "Durée du recalcul d'un appareil")
+
+REFRESH_LEASE_KEY = "analytics:refresh"
+
+# SQLite : un seul recalcul à la fois dans le processus (un seul écrivain) ;
+# PostgreSQL : verrou consultatif par appareil seulement, partagé entre processus
+_refresh_lock = threading.Lock()
+
+
+def distances_m(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # Distance haversine entre points consécutifs
+    return haversine_array(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def segment(t: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+            stop_speed: float = STOP_SPEED_MPS, min_dwell: float = STOP_MIN_DWELL_S) -> List[dict]:
+    # Découpe une trace (secondes epoch croissantes) en segments contigus :
+    # chacun couvre les points first..last inclus, et partage son premier
+    # point avec le dernier du segment précédent
+    n = len(t)
+    if n < 2:
+        return []
+    dt = np.diff(t)
+    dist = distances_m(lat, lon)
+    speed = dist / np.maximum(dt, 1e-6)
+    still = speed < stop_speed
+
+    # Suites d'intervalles de même nature ; une suite à l'arrêt assez longue est un arrêt
+    change = np.flatnonzero(still[1:] != still[:-1]) + 1
+    run_start = np.r_[0, change]
+    run_end = np.r_[change, n - 1]
+    run_stop = still[run_start] & (t[run_end] - t[run_start] >= min_dwell)
+
+    # Suites consécutives qui ne sont pas des arrêts : un seul trajet
+    first_run = np.r_[0, np.flatnonzero(run_stop[1:] != run_stop[:-1]) + 1]
+    first = run_start[first_run]
+    last = np.r_[first[1:], n - 1]
+    is_stop = run_stop[first_run]
+
+    distance = np.add.reduceat(dist, first)
+    moving = np.add.reduceat(np.where(still, 0.0, dt), first)
+    max_speed = np.maximum.reduceat(speed, first)
+    lat_sum = np.r_[0.0, np.cumsum(lat)]
+    lon_sum = np.r_[0.0, np.cumsum(lon)]
+    count = last - first + 1
+
+    return [
+        {
+            "kind": "stop" if is_stop[i] else "trip",
+            "first": int(first[i]),
+            "last": int(last[i]),
+            "distance_m": float(distance[i]),
+            "moving_s": float(moving[i]),
+            "max_speed_mps": float(max_speed[i]),
+            "lat": float((lat_sum[last[i] + 1] - lat_sum[first[i]]) / count[i]),
+            "lon": float((lon_sum[last[i] + 1] - lon_sum[first[i]]) / count[i]),
+        }
+        for i in range(len(first))
+    ]
+
+
+def _to_datetime(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # Horodatage sans fuseau de SQLite considéré comme UTC
+    return moment.astimezone(timezone.utc) if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def utc_date(moment: datetime) -> date:
+    return _as_utc(moment).date()
+
+
+def split_by_day(start: datetime, end: datetime) -> List[Tuple[date, float]]:
+    # Durée de [start, end] répartie sur les jours UTC traversés, en secondes
+    start, end = _as_utc(start), _as_utc(end)
+    day = start.date()
+    parts = []
+    while True:
+        midnight = datetime.combine(day + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        parts.append((day, max((min(end, midnight) - start).total_seconds(), 0.0)))
+        if end <= midnight:
+            return parts
+        start, day = midnight, day + timedelta(days=1)
+
+
+def _segment_row(device_id: str, seg: dict, t: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+    first, last = seg["first"], seg["last"]
+    if seg["kind"] == "stop":
+        return Stop, {
+            "device_id": device_id,
+            "start_time": _to_datetime(t[first]),
+            "end_time": _to_datetime(t[last]),
+            "lat": seg["lat"],
+            "lon": seg["lon"],
+            "point_count": last - first + 1,
+        }
+    return Trip, {
+        "device_id": device_id,
+        "start_time": _to_datetime(t[first]),
+        "end_time": _to_datetime(t[last]),
+        "start_lat": float(lat[first]),
+        "start_lon": float(lon[first]),
+        "end_lat": float(lat[last]),
+        "end_lon": float(lon[last]),
+        "distance_m": seg["distance_m"],
+        "moving_s": seg["moving_s"],
+        "max_speed_mps": seg["max_speed_mps"],
+        "point_count": last - first + 1,
+    }
+
+
+def _latest_segment_start(db: Session, device_id: str, before: Optional[datetime] = None,
+                          strict: bool = False) -> Optional[datetime]:
+    starts = []
+    for model in (Trip, Stop):
+        query = select(func.max(model.start_time)).where(model.device_id == device_id)
+        if before is not None:
+            query = query.where(model.start_time < before if strict else model.start_time <= before)
+        starts.append(db.execute(query).scalar())
+    starts = [start for start in starts if start is not None]
+    return max(starts) if starts else None
+
+
+def reopen_from(db: Session, device_id: str, dirty_since: datetime) -> Optional[datetime]:
+    # Début du recalcul (None : tout l'historique de l'appareil)
+    last = _latest_segment_start(db, device_id)
+    if last is None:
+        return None
+    if dirty_since >= last:
+        return last
+    # Points en retard : le segment qui les contient et le précédent
+    containing = _latest_segment_start(db, device_id, before=dirty_since)
+    if containing is None:
+        return None
+    return _latest_segment_start(db, device_id, before=containing, strict=True) or containing
+
+
+def _store_segments(db: Session, device_id: str, segments: List[dict], t, lat, lon):
+    rows: Dict[type, List[dict]] = {Trip: [], Stop: []}
+    for seg in segments:
+        # Suite à l'arrêt trop courte en tête de trace : ni trajet ni arrêt
+        if seg["kind"] == "trip" and seg["moving_s"] == 0:
+            continue
+        model, row = _segment_row(device_id, seg, t, lat, lon)
+        rows[model].append(row)
+    for model, values in rows.items():
+        if values:
+            db.execute(model.__table__.insert(), values)
+
+
+def rebuild_segments(db: Session, device_id: str, since: Optional[datetime]) -> int:
+    # Remplace les trajets/arrêts commençant à `since` ou après, en relisant
+    # les points par paquets ; le dernier segment d'un paquet, encore ouvert,
+    # est reporté sur le paquet suivant
+    for model in (Trip, Stop):
+        query = delete(model).where(model.device_id == device_id)
+        if since is not None:
+            query = query.where(model.start_time >= since)
+        db.execute(query)
+
+    query = select(GPSData.timestamp, GPSData.lat, GPSData.lon).where(GPSData.device_id == device_id)
+    if since is not None:
+        query = query.where(GPSData.timestamp >= since)
+    query = query.order_by(GPSData.timestamp).execution_options(yield_per=ANALYTICS_CHUNK_POINTS)
+
+    processed = 0
+    carry_t, carry_lat, carry_lon = np.empty(0), np.empty(0), np.empty(0)
+    for chunk in db.execute(query).partitions():
+        processed += len(chunk)
+        timestamps, lats, lons = zip(*chunk)
+        t = np.concatenate((carry_t, to_epoch_seconds(timestamps)))
+        lat = np.concatenate((carry_lat, np.array(lats, dtype=np.float64)))
+        lon = np.concatenate((carry_lon, np.array(lons, dtype=np.float64)))
+        segments = segment(t, lat, lon)
+        if len(segments) > 1:
+            _store_segments(db, device_id, segments[:-1], t, lat, lon)
+            start = segments[-1]["first"]
+            t, lat, lon = t[start:], lat[start:], lon[start:]
+        carry_t, carry_lat, carry_lon = t, lat, lon
+    _store_segments(db, device_id, segment(carry_t, carry_lat, carry_lon), carry_t, carry_lat, carry_lon)
+    points_processed.inc(processed)
+    return processed
+
+
+def rebuild_daily(db: Session, device_id: str, since: Optional[datetime]):
+    # Agrégats des jours touchés, à partir des trajets et arrêts (peu de
+    # lignes). Un segment qui passe minuit est réparti entre les jours :
+    # durée à l'arrêt exacte, distance et temps en mouvement d'un trajet au
+    # prorata de sa durée sur chaque jour ; il n'est compté (trip_count,
+    # stop_count) que le jour de son début
+    first_day = utc_date(since) if since is not None else None
+    query = delete(DeviceDailySummary).where(DeviceDailySummary.device_id == device_id)
+    if first_day is not None:
+        query = query.where(DeviceDailySummary.day >= first_day)
+    db.execute(query)
+
+    days: Dict[date, dict] = {}
+
+    def day_of(day: date) -> dict:
+        if day not in days:
+            days[day] = {"device_id": device_id, "day": day, "distance_m": 0.0, "moving_s": 0.0,
+                         "stopped_s": 0.0, "trip_count": 0, "stop_count": 0}
+        return days[day]
+
+    day_start = None
+    if first_day is not None:
+        day_start = datetime.combine(first_day, time.min, tzinfo=timezone.utc if since.tzinfo is not None else None)
+    trips = select(Trip.start_time, Trip.end_time, Trip.distance_m, Trip.moving_s).where(Trip.device_id == device_id)
+    stops = select(Stop.start_time, Stop.end_time).where(Stop.device_id == device_id)
+    if day_start is not None:
+        # Segments commencés avant mais qui débordent sur les jours recalculés
+        trips = trips.where(Trip.end_time >= day_start)
+        stops = stops.where(Stop.end_time >= day_start)
+
+    def rebuilt(day: date) -> bool:
+        # Les jours antérieurs à first_day sont conservés tels quels
+        return first_day is None or day >= first_day
+
+    for start_time, end_time, distance_m, moving_s in db.execute(trips):
+        parts = split_by_day(start_time, end_time)
+        total = sum(seconds for _, seconds in parts)
+        for day, seconds in parts:
+            if rebuilt(day):
+                share = seconds / total if total > 0 else 1.0
+                summary_row = day_of(day)
+                summary_row["distance_m"] += distance_m * share
+                summary_row["moving_s"] += moving_s * share
+        if rebuilt(parts[0][0]):
+            day_of(parts[0][0])["trip_count"] += 1
+    for start_time, end_time in db.execute(stops):
+        parts = split_by_day(start_time, end_time)
+        for day, seconds in parts:
+            if rebuilt(day):
+                day_of(day)["stopped_s"] += seconds
+        if rebuilt(parts[0][0]):
+            day_of(parts[0][0])["stop_count"] += 1
+    if days:
+        db.execute(DeviceDailySummary.__table__.insert(), [days[day] for day in sorted(days)])
+
+
+def _try_lock(db: Session, device_id: str) -> bool:
+    if db.get_bind().dialect.name == "postgresql":
+        return db.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                          {"key": f"analytics:{device_id}"}).scalar()
+    return True
+
+
+def _more_points_than(db: Session, device_id: str, since: Optional[datetime], limit: int) -> bool:
+    # Parcours borné de l'index (device_id, timestamp), sans tout compter
+    query = select(GPSData.timestamp).where(GPSData.device_id == device_id)
+    if since is not None:
+        query = query.where(GPSData.timestamp >= since)
+    return db.execute(query.offset(limit).limit(1)).first() is not None
+
+
+def _serialized(db: Session):
+    if db.get_bind().dialect.name == "sqlite":
+        return _refresh_lock
+    return contextlib.nullcontext()
+
+
+def refresh_device(db: Session, device_id: str, max_points: Optional[int] = None) -> Optional[int]:
+    # Recalcule un appareil marqué ; retourne le nombre de points relus
+    # (None si rien à faire, si un autre processus s'en occupe ou s'il y
+    # aurait plus de `max_points` points à relire)
+    with _serialized(db):
+        state = db.get(DeviceAnalyticsState, device_id)
+        if state is None or state.dirty_since is None:
+            return None
+        if not _try_lock(db, device_id):
+            return None
+        dirty_since, version = state.dirty_since, state.version
+        started = datetime.now(timezone.utc)
+        try:
+            since = reopen_from(db, device_id, dirty_since)
+            if max_points is not None and _more_points_than(db, device_id, since, max_points):
+                # Libère le verrou consultatif ; l'appareil reste marqué
+                db.rollback()
+                return None
+            processed = rebuild_segments(db, device_id, since)
+            rebuild_daily(db, device_id, since)
+            # Un lot reçu pendant le calcul a changé la version : l'appareil reste marqué
+            db.execute(
+                update(DeviceAnalyticsState)
+                .where(DeviceAnalyticsState.device_id == device_id, DeviceAnalyticsState.version == version)
+                .values(dirty_since=None, refreshed_at=started)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        refresh_seconds.observe((datetime.now(timezone.utc) - started).total_seconds())
+        return processed
+
+
+def dirty_devices(db: Session, limit: int = ANALYTICS_REFRESH_DEVICES) -> List[str]:
+    return list(db.execute(
+        select(DeviceAnalyticsState.device_id)
+        .where(DeviceAnalyticsState.dirty_since.is_not(None))
+        .order_by(DeviceAnalyticsState.dirty_since)
+        .limit(limit)
+    ).scalars())
+
+
+def refresh_dirty(limit: int = ANALYTICS_REFRESH_DEVICES) -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        refreshed = {}
+        for device_id in dirty_devices(db, limit):
+            processed = refresh_device(db, device_id)
+            if processed is not None:
+                refreshed[device_id] = processed
+        return refreshed
+    finally:
+        db.close()
+
+
+class AnalyticsRefresher:
+    # Tâche de fond de l'application : recalcul périodique des appareils marqués
+    def __init__(self, interval: float = ANALYTICS_REFRESH_INTERVAL_S):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Plusieurs workers : un seul recalcul par intervalle (bail partagé)
+            if not await run_in_threadpool(shared_state.acquire, REFRESH_LEASE_KEY, self.interval):
+                continue
+            try:
+                await run_in_threadpool(refresh_dirty)
+            except Exception:
+                logger.exception("Échec du recalcul des trajets et arrêts")
+
+
+analytics_refresher = AnalyticsRefresher()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=ANALYTICS_REFRESH_DEVICES)
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    print(json.dumps(refresh_dirty(args.limit)))
+
+
+if __name__ == "__main__":
+    main()
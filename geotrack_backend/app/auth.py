@@ -1,33 +1,90 @@
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, status, Request
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from jose import JWTError
+from fastapi import Depends, HTTPException, status, Request
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+import hashlib
+import hmac
 import os
+import time
 from datetime import datetime
 
+from .concurrency import run_in_threadpool
 from .models import User
 from .database import get_db
+from .cache import TTLCache
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Utiliser sha256 pour le PIN
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+# Clé de l'empreinte indexée du PIN (User.pin_lookup)
+PIN_LOOKUP_KEY = os.getenv("PIN_LOOKUP_KEY", SECRET_KEY)
+
+# Jetons déjà vérifiés (jeton -> email), conservés au plus jusqu'à leur `exp`,
+# et id des utilisateurs par email : une synchronisation répétée d'un même
+# appareil ne refait ni la vérification HS256 ni la requête User
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+token_cache = TTLCache("token", maxsize=int(os.getenv("TOKEN_CACHE_SIZE", 10000)), ttl=TOKEN_CACHE_TTL)
+user_id_cache = TTLCache("user_id", maxsize=int(os.getenv("TOKEN_CACHE_SIZE", 10000)), ttl=TOKEN_CACHE_TTL)
+
+security = HTTPBearer()
+
+class CurrentUser(NamedTuple):
+    id: int
+    email: str
+
+# Utiliser sha256 pour le PIN. passlib et jose.jwt (qui charge les backends
+# de cryptographie) sont importés au premier usage, pas au démarrage
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["sha256_crypt"], deprecated="auto")
 
 def verify_pin(plain_pin, hashed_pin):
-    return pwd_context.verify(plain_pin, hashed_pin)
+    return pwd_context().verify(plain_pin, hashed_pin)
 
 def get_pin_hash(pin):
-    return pwd_context.hash(pin)
+    return pwd_context().hash(pin)
 
-def authenticate_user(db: Session, pin: str):
-    users = db.query(User).all()
-    for user in users:
-        if verify_pin(pin, user.hashed_pin):
-            return user
+def get_pin_lookup(pin: str) -> str:
+    # Empreinte HMAC déterministe : permet de retrouver l'utilisateur par index
+    # sans lancer sha256_crypt sur chaque compte
+    return hmac.new(PIN_LOOKUP_KEY.encode(), pin.encode(), hashlib.sha256).hexdigest()
+
+def set_user_pin(user: User, pin: str):
+    user.hashed_pin = get_pin_hash(pin)
+    user.pin_lookup = get_pin_lookup(pin)
+
+def authenticate_user(db: Session, pin: str, email: Optional[str] = None):
+    if email is not None:
+        user = db.query(User).filter(User.email == email).first()
+    else:
+        user = (
+            db.query(User)
+            .filter(User.pin_lookup == get_pin_lookup(pin))
+            .order_by(User.id)
+            .first()
+        )
+    if user is not None:
+        # Une seule vérification coûteuse par tentative
+        if not verify_pin(pin, user.hashed_pin):
+            return None
+        if user.pin_lookup is None:
+            user.pin_lookup = get_pin_lookup(pin)
+            db.commit()
+        return user
+
+    # Comptes créés avant l'empreinte : parcours limité à ceux qui n'en ont pas,
+    # l'empreinte est enregistrée à la première connexion réussie
+    if email is None:
+        for user in db.query(User).filter(User.pin_lookup.is_(None)):
+            if verify_pin(pin, user.hashed_pin):
+                user.pin_lookup = get_pin_lookup(pin)
+                db.commit()
+                return user
     return None
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -37,10 +94,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def verify_token(token: str):
+    email = token_cache.get(token)
+    if email is not None:
+        return email
+    from jose import jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -50,10 +112,34 @@ def verify_token(token: str):
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        # Le jeton ne doit pas survivre dans le cache à son expiration
+        ttl = min(TOKEN_CACHE_TTL, payload["exp"] - time.time()) if "exp" in payload else TOKEN_CACHE_TTL
+        if ttl > 0:
+            token_cache.set(token, email, ttl=ttl)
         return email
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+
+def get_current_user_email(token: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    return verify_token(token.credentials)
+
+async def get_current_user(
+    email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+) -> CurrentUser:
+    user_id = user_id_cache.get(email)
+    if user_id is None:
+        user_id = await run_in_threadpool(
+            lambda: db.query(User.id).filter(User.email == email).scalar()
+        )
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Utilisateur non trouvé"
+            )
+        user_id_cache.set(email, user_id)
+    return CurrentUser(id=user_id, email=email)
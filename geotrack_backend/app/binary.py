@@ -0,0 +1,104 @@
+import struct
+from datetime import datetime, timezone
+from typing import List, Sequence
+
+import numpy as np
+
+# Format binaire des lots GPS (POST /data/batch, Content-Type BINARY_MEDIA_TYPE),
+# little-endian :
+#
+#   en-tête    "GT", version (u8), réservé (u8)
+#   puis un bloc par appareil :
+#     longueur de device_id (u8), device_id (UTF-8)
+#     nombre de points n (u32), timestamp de base en ms epoch UTC (i64),
+#     lat et lon de base en 1e-7 degré (i32, i32)
+#     n écarts de temps en ms (i32), n écarts de lat, n écarts de lon (i32)
+#
+# Chaque écart est relatif au point précédent (le premier à la base) : 12
+# octets par point, et les colonnes se décodent d'un bloc avec NumPy
+BINARY_MEDIA_TYPE = "application/vnd.geotrack.batch"
+MAGIC = b"GT"
+VERSION = 1
+COORD_SCALE = 10_000_000
+MAX_EPOCH_MS = 253402300799999  # 9999-12-31T23:59:59.999Z
+
+HEADER = struct.Struct("<2sBB")
+BLOCK = struct.Struct("<Iqii")
+DELTAS = np.dtype("<i4")
+
+
+class BinaryFormatError(ValueError):
+    pass
+
+
+def decode_batch(payload: bytes) -> List[dict]:
+    if len(payload) < HEADER.size:
+        raise BinaryFormatError("en-tête incomplet")
+    magic, version, _ = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise BinaryFormatError("signature inconnue")
+    if version != VERSION:
+        raise BinaryFormatError(f"version {version} non prise en charge")
+
+    points = []
+    offset = HEADER.size
+    while offset < len(payload):
+        name_length = payload[offset]
+        offset += 1
+        device_id = payload[offset:offset + name_length]
+        if len(device_id) != name_length or not name_length:
+            raise BinaryFormatError("device_id invalide")
+        try:
+            device_id = device_id.decode("utf-8")
+        except UnicodeDecodeError:
+            raise BinaryFormatError("device_id invalide")
+        offset += name_length
+
+        if offset + BLOCK.size > len(payload):
+            raise BinaryFormatError("bloc incomplet")
+        count, base_ms, base_lat, base_lon = BLOCK.unpack_from(payload, offset)
+        offset += BLOCK.size
+        size = 3 * count * DELTAS.itemsize
+        if offset + size > len(payload):
+            raise BinaryFormatError("nombre de points incohérent")
+        columns = np.frombuffer(payload, dtype=DELTAS, count=3 * count, offset=offset).reshape(3, count)
+        offset += size
+
+        # Reconstitution des valeurs absolues : somme cumulée des écarts
+        absolute = np.cumsum(columns, axis=1, dtype=np.int64)
+        epoch_ms = absolute[0] + base_ms
+        if count and (epoch_ms.min() < 0 or epoch_ms.max() > MAX_EPOCH_MS):
+            raise BinaryFormatError("timestamp hors limites")
+        seconds = (epoch_ms / 1000).tolist()
+        lats = ((absolute[1] + base_lat) / COORD_SCALE).tolist()
+        lons = ((absolute[2] + base_lon) / COORD_SCALE).tolist()
+        points += [
+            {"device_id": device_id, "lat": lat, "lon": lon, "timestamp": datetime.fromtimestamp(second, timezone.utc)}
+            for second, lat, lon in zip(seconds, lats, lons)
+        ]
+    return points
+
+
+def encode_block(device_id: str, timestamps: Sequence[datetime], lats: Sequence[float], lons: Sequence[float]) -> bytes:
+    name = device_id.encode("utf-8")
+    if not 0 < len(name) < 256:
+        raise ValueError("device_id doit faire de 1 à 255 octets")
+    ms = np.array([
+        round((ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)).timestamp() * 1000)
+        for ts in timestamps
+    ], dtype=np.int64)
+    lat = np.round(np.asarray(lats, dtype=np.float64) * COORD_SCALE).astype(np.int64)
+    lon = np.round(np.asarray(lons, dtype=np.float64) * COORD_SCALE).astype(np.int64)
+    base = (int(ms[0]), int(lat[0]), int(lon[0])) if len(ms) else (0, 0, 0)
+    deltas = np.stack([np.diff(values, prepend=values[:1]) for values in (ms, lat, lon)]) if len(ms) else np.empty((3, 0))
+    if deltas.size and np.abs(deltas).max() > np.iinfo(DELTAS).max:
+        raise ValueError("écart trop grand entre deux points consécutifs")
+    return (
+        bytes([len(name)]) + name
+        + BLOCK.pack(len(ms), *base)
+        + deltas.astype(DELTAS).tobytes()
+    )
+
+
+def encode_batch(blocks: Sequence[bytes]) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, 0) + b"".join(blocks)
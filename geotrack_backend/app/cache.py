@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+import orjson
+
+from .metrics import counter
+from .shared import shared_state
+
+
+class TTLCache:
+    # Cache LRU borné dont les entrées expirent après `ttl` secondes.
+    # shared=True : avec un backend partagé (SHARED_STATE_URL), les entrées
+    # vivent dans ce backend, communes à tous les workers ; `maxsize` ne
+    # s'applique alors qu'au cache local. Les valeurs y sont stockées en JSON
+    # (orjson) ; `dumps`/`loads` pour celles qui n'en sont pas (modèles,
+    # octets). Les tuples sont relus comme des listes, NaN comme None
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl: float = 60,
+        shared: bool = False,
+        dumps: Callable[[Any], bytes] = orjson.dumps,
+        loads: Callable[[bytes], Any] = orjson.loads,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._dumps = dumps
+        self._loads = loads
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._backend = shared_state if shared and shared_state.remote else None
+        self._prefix = f"cache:{name}:"
+        self._hits = counter(f"{name}_cache_hits_total", f"Lectures servies par le cache {name}")
+        self._misses = counter(f"{name}_cache_misses_total", f"Lectures absentes du cache {name}")
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if self._backend is not None:
+            return self.get_many([key]).get(key)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits.inc()
+                    return value
+                del self._data[key]
+        self._misses.inc()
+        return None
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        # Une seule lecture (un aller-retour avec un backend partagé) ; les
+        # clés absentes ou expirées ne sont pas dans le résultat
+        keys = list(keys)
+        found = {}
+        if self._backend is not None:
+            values = self._backend.get_many([f"{self._prefix}{key}" for key in keys])
+            found = {key: self._loads(value) for key, value in zip(keys, values) if value is not None}
+        else:
+            now = time.monotonic()
+            with self._lock:
+                for key in keys:
+                    entry = self._data.get(key)
+                    if entry is None:
+                        continue
+                    if entry[1] > now:
+                        self._data.move_to_end(key)
+                        found[key] = entry[0]
+                    else:
+                        del self._data[key]
+        self._hits.inc(len(found))
+        self._misses.inc(len(keys) - len(found))
+        return found
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if self._backend is not None:
+            self._backend.set_many({
+                f"{self._prefix}{key}": self._dumps(value)
+                for key, value in items.items()
+            }, ttl)
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        if self._backend is not None:
+            self._backend.delete(f"{self._prefix}{key}")
+            return
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        if self._backend is not None:
+            self._backend.delete_prefix(self._prefix)
+            return
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
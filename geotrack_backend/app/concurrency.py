@@ -0,0 +1,31 @@
+import cProfile
+import functools
+from typing import Callable, TypeVar
+
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+from .profiling import current_profile
+
+T = TypeVar("T")
+
+
+async def run_in_threadpool(func: Callable[..., T], *args, **kwargs) -> T:
+    # starlette.concurrency.run_in_threadpool pour le travail synchrone de
+    # l'application (SQLAlchemy, hachage...). Pendant une requête profilée
+    # (app/profiling.py), l'appel est profilé dans le thread qui l'exécute :
+    # cProfile ne suit que le thread qui l'active
+    profile = current_profile.get()
+    if profile is None:
+        return await _run_in_threadpool(func, *args, **kwargs)
+
+    @functools.wraps(func)
+    def run(*call_args, **call_kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*call_args, **call_kwargs)
+        finally:
+            profiler.disable()
+            profile.add_worker(profiler)
+
+    return await _run_in_threadpool(run, *args, **kwargs)
@@ -0,0 +1,10 @@
+"""Chargement du fichier .env, avant tout autre module de l'application.
+
+Les modules lisent leur configuration (os.getenv) à l'import : chaque point
+d'entrée importe celui-ci en premier (create_app, python -m app.serve,
+app.migrate, app.analytics, app.maintenance). Les variables déjà définies
+dans l'environnement ne sont pas remplacées.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
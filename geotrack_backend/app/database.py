@@ -1,23 +1,242 @@
 import os
-from sqlalchemy import create_engine
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from .cache import TTLCache
+from .metrics import gauge, histogram, summary
+from .profiling import record_slow_query
 
 # Utiliser SQLite pour le développement
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nexor_geotrack.db")
 
-# Configuration pour SQLite
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Nécessaire pour SQLite
+# Pool de connexions (PostgreSQL ; la taille s'applique aussi à SQLite fichier)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+
+# PRAGMAs appliqués à chaque connexion SQLite : en WAL les lectures ne
+# bloquent plus les écritures, et busy_timeout fait attendre un écrivain
+# au lieu de lever "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+# Requêtes plus longues que SLOW_QUERY_MS : journalisées avec leur plan
+# d'exécution (0 = désactivé). Le plan d'une même requête n'est recalculé
+# qu'une fois par EXPLAIN_CACHE_TTL secondes
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 500))
+EXPLAIN_CACHE_TTL = float(os.getenv("EXPLAIN_CACHE_TTL", 300))
+
+pool_checkout_seconds = summary("db_pool_checkout_seconds", "Attente pour obtenir une connexion du pool")
+query_seconds = histogram(
+    "db_query_duration_seconds", "Durée des requêtes SQL par opération et table", ("operation", "table"),
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class QueryStats:
+    # Requêtes SQL d'une requête HTTP : nombre et durée cumulée
+    __slots__ = ("path", "count", "seconds")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Posée par le middleware de métriques pour la durée d'une requête HTTP ;
+# run_in_threadpool copie le contexte, les requêtes exécutées dans le pool
+# de threads alimentent donc le même objet
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+_STATEMENT_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+\"?(\w+)", re.IGNORECASE)
+
+
+def statement_labels(statement: str):
+    # Étiquettes à faible cardinalité : premier mot-clé et première table citée
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else "?"
+    match = _STATEMENT_TABLE.search(statement)
+    return operation, match.group(1) if match else ""
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Début porté par le contexte d'exécution : rien ne traîne si la requête échoue
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    query_seconds.labels(*statement_labels(statement)).observe(elapsed)
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        plan = [] if executemany else explain(conn, statement, parameters)
+        record_slow_query(statement, elapsed, stats.path if stats is not None else None, plan)
+
+
+explain_cache = TTLCache("explain", maxsize=256, ttl=EXPLAIN_CACHE_TTL)
+
+
+def explain(conn, statement: str, parameters) -> List[str]:
+    # Plan (sans exécution) via un curseur DBAPI distinct : ni événements
+    # SQLAlchemy, ni interférence avec le résultat de la requête mesurée.
+    # Les paramètres servent au plan mais ne sont pas conservés
+    plan = explain_cache.get(statement)
+    if plan is not None:
+        return plan
+    if statement_labels(statement)[0] not in EXPLAINABLE:
+        return []
+    sqlite = conn.dialect.name == "sqlite"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        # PostgreSQL : un EXPLAIN en échec ne doit pas annuler la transaction en cours
+        if not sqlite:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(("EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN ") + statement, parameters)
+            plan = [" ".join(str(value) for value in row) for row in cursor.fetchall()]
+            if not sqlite:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as e:
+            plan = [f"EXPLAIN impossible : {e}"]
+            if not sqlite:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+    explain_cache.set(statement, plan)
+    return plan
+
+
+class MeteredQueuePool(QueuePool):
+    # QueuePool qui mesure le temps passé à attendre une connexion libre
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_seconds.observe(time.perf_counter() - start)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def create_db_engine(database_url: str = DATABASE_URL):
+    url = make_url(database_url)
+
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # Base en mémoire : une seule connexion partagée
+            engine = create_engine(
+                database_url,
+                connect_args={"check_same_thread": False},
+                poolclass=StaticPool,
+            )
+        else:
+            engine = create_engine(
+                database_url,
+                connect_args={"check_same_thread": False},  # Nécessaire pour SQLite
+                poolclass=MeteredQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+            )
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    else:
+        engine = create_engine(
+            database_url,
+            # Session en UTC : un horodatage sans fuseau est enregistré comme
+            # UTC, comme partout dans l'application (ingest._utc)
+            connect_args={"options": "-c timezone=utc"},
+            poolclass=MeteredQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+class LazySessionmaker(sessionmaker):
+    # Crée le moteur à la première session si le lifespan de l'application
+    # ne l'a pas encore fait (scripts, tests)
+    def __call__(self, **local_kw):
+        if _engine is None and "bind" not in local_kw:
+            get_engine()
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+# Moteur créé au premier usage (lifespan de l'application, première session) :
+# importer ce module ne charge ni le pilote ni le pool
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_db_engine()
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def dispose_engine():
+    # Ferme les connexions du pool ; le moteur reste utilisable
+    if _engine is not None:
+        _engine.dispose()
+
+
+def _pool_checked_out() -> int:
+    # Pool du moteur par défaut seulement : un moteur créé à part (tests,
+    # scripts) ne prend pas la place de celui de l'application
+    pool = _engine.pool if _engine is not None else None
+    return pool.checkedout() if isinstance(pool, QueuePool) else 0
+
+
+gauge("db_pool_checked_out", "Connexions utilisées", _pool_checked_out)
+gauge("db_pool_saturation", "Part du pool utilisée (0-1)",
+      lambda: _pool_checked_out() / (DB_POOL_SIZE + DB_MAX_OVERFLOW))
+
+
+def __getattr__(name: str):
+    # `from app.database import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
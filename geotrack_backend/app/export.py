@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import select
+
+from .database import SessionLocal
+from .models import GPSData
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "geojson": "application/geo+json",
+}
+
+
+def iter_points(device_id: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    # Session dédiée : elle doit rester ouverte pendant tout le streaming,
+    # indépendamment du cycle de vie de la requête
+    db = SessionLocal()
+    try:
+        query = select(GPSData.device_id, GPSData.lat, GPSData.lon, GPSData.timestamp)
+        if device_id:
+            query = query.where(GPSData.device_id == device_id)
+        if start is not None:
+            query = query.where(GPSData.timestamp >= start)
+        if end is not None:
+            query = query.where(GPSData.timestamp < end)
+        # Parcours de l'index (device_id, timestamp) ; yield_per active un
+        # curseur côté serveur (PostgreSQL) et lit par paquets
+        query = query.order_by(GPSData.device_id, GPSData.timestamp)
+        result = db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def stream_ndjson(partitions) -> Iterator[str]:
+    for rows in partitions:
+        yield "".join(
+            json.dumps({
+                "device_id": device_id,
+                "lat": lat,
+                "lon": lon,
+                "timestamp": timestamp.isoformat(),
+            }) + "\n"
+            for device_id, lat, lon, timestamp in rows
+        )
+
+
+def stream_csv(partitions) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["device_id", "lat", "lon", "timestamp"])
+    for rows in partitions:
+        for device_id, lat, lon, timestamp in rows:
+            writer.writerow([device_id, lat, lon, timestamp.isoformat()])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _line_header(device_id: str) -> str:
+    properties = json.dumps({"device_id": device_id})
+    return f'{{"type":"Feature","properties":{properties},"geometry":{{"type":"LineString","coordinates":['
+
+
+def _point_feature(device_id: str, coords: str) -> str:
+    properties = json.dumps({"device_id": device_id})
+    return f'{{"type":"Feature","properties":{properties},"geometry":{{"type":"Point","coordinates":{coords}}}}}'
+
+
+def stream_geojson(partitions) -> Iterator[str]:
+    # Une Feature LineString par appareil, écrite au fil de l'eau. Le premier
+    # point est gardé en attente : un appareil avec un seul point donne un Point
+    yield '{"type":"FeatureCollection","features":['
+    current = None
+    pending = None
+    first_feature = True
+    for rows in partitions:
+        chunk = []
+        for device_id, lat, lon, _ in rows:
+            coords = f"[{lon},{lat}]"
+            if device_id != current:
+                if pending is not None:
+                    chunk.append(_point_feature(current, pending))
+                elif current is not None:
+                    chunk.append("]}}")
+                if not first_feature:
+                    chunk.append(",")
+                first_feature = False
+                current = device_id
+                pending = coords
+            elif pending is not None:
+                chunk.append(_line_header(device_id) + pending + "," + coords)
+                pending = None
+            else:
+                chunk.append("," + coords)
+        yield "".join(chunk)
+    if pending is not None:
+        yield _point_feature(current, pending)
+    elif current is not None:
+        yield "]}}"
+    yield "]}"
+
+
+EXPORTERS = {
+    "ndjson": stream_ndjson,
+    "csv": stream_csv,
+    "geojson": stream_geojson,
+}
@@ -0,0 +1,118 @@
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+# Geohash : le monde est découpé récursivement en cellules ; deux points
+# proches partagent en général un long préfixe, ce qui permet d'utiliser un
+# index B-tree ordinaire comme index spatial (recherche par plages de préfixes)
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12  # cellules d'environ 4 cm x 2 cm
+EARTH_RADIUS_M = 6371008.8
+
+BBox = Tuple[float, float, float, float]  # min_lat, min_lon, max_lat, max_lon
+
+
+def _grid_bits(precision: int) -> Tuple[int, int]:
+    # 5 bits par caractère, alternés longitude / latitude en commençant par la longitude
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+
+def _cell_index(lat: float, lon: float, precision: int) -> Tuple[int, int]:
+    lon_bits, lat_bits = _grid_bits(precision)
+    lon_index = int((lon + 180.0) / 360.0 * (1 << lon_bits))
+    lat_index = int((lat + 90.0) / 180.0 * (1 << lat_bits))
+    return (
+        min(max(lon_index, 0), (1 << lon_bits) - 1),
+        min(max(lat_index, 0), (1 << lat_bits) - 1),
+    )
+
+
+def _from_index(lon_index: int, lat_index: int, precision: int) -> str:
+    lon_bits, lat_bits = _grid_bits(precision)
+    chars = []
+    value = 0
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            lon_bits -= 1
+            value = (value << 1) | ((lon_index >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((lat_index >> lat_bits) & 1)
+        if bit % 5 == 4:
+            chars.append(GEOHASH_ALPHABET[value])
+            value = 0
+    return "".join(chars)
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    return _from_index(*_cell_index(lat, lon, precision), precision)
+
+
+def _cells(bbox: BBox, precision: int) -> Tuple[range, range]:
+    min_lat, min_lon, max_lat, max_lon = bbox
+    min_lon_index, min_lat_index = _cell_index(min_lat, min_lon, precision)
+    max_lon_index, max_lat_index = _cell_index(max_lat, max_lon, precision)
+    return range(min_lon_index, max_lon_index + 1), range(min_lat_index, max_lat_index + 1)
+
+
+def cover(boxes: List[BBox], max_cells: int = 32) -> List[str]:
+    # Préfixes geohash qui recouvrent les rectangles : la précision la plus
+    # fine qui reste sous `max_cells` cellules. Les candidats sont ensuite
+    # filtrés exactement
+    best = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        count = 0
+        for bbox in boxes:
+            lon_range, lat_range = _cells(bbox, precision)
+            count += len(lon_range) * len(lat_range)
+        if count > max_cells:
+            break
+        best = sorted({
+            _from_index(lon_index, lat_index, precision)
+            for bbox in boxes
+            for lon_range, lat_range in [_cells(bbox, precision)]
+            for lon_index in lon_range
+            for lat_index in lat_range
+        })
+    return best
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    # Plus petite chaîne supérieure à tous les geohash commençant par `prefix`
+    return prefix + "~"
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_array(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    # Distance haversine élément par élément entre deux séries de positions
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_boxes(lat: float, lon: float, radius_m: float) -> List[BBox]:
+    # Rectangle(s) englobant le cercle ; coupé en deux s'il traverse l'antiméridien
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    if min_lat <= -90.0 or max_lat >= 90.0 or cos_lat <= 0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat))
+    if dlon >= 180.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180.0:
+        return [(min_lat, min_lon + 360.0, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon - 360.0)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
@@ -0,0 +1,289 @@
+"""Zones (geofences) et détection des entrées/sorties à l'ingestion.
+
+Les polygones de toutes les zones sont gardés en mémoire dans une grille de
+GEOFENCE_GRID_DEG degrés : chaque zone est rangée dans les cellules que
+couvre son rectangle englobant, et un point n'est testé (lancer de rayon
+vectorisé avec NumPy, sur tout le lot à la fois) que contre les zones de
+sa cellule. Les zones qui couvriraient plus de GEOFENCE_MAX_CELLS cellules
+sont gardées à part et filtrées sur leur rectangle.
+
+L'ensemble des zones où se trouve chaque appareil est conservé dans
+device_geofence_state ; chaque changement produit des événements enter/exit
+(geofence_events). Les points plus anciens que le dernier point évalué
+(renvois, points en retard) ne produisent pas d'événement.
+"""
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .metrics import counter, gauge, summary
+from .models import DeviceGeofenceState, Geofence, GeofenceEvent
+from .track import to_epoch_seconds
+
+GEOFENCE_GRID_DEG = float(os.getenv("GEOFENCE_GRID_DEG", 0.01))
+GEOFENCE_MAX_CELLS = int(os.getenv("GEOFENCE_MAX_CELLS", 256))
+# Délai maximal avant qu'un processus voie une zone modifiée par un autre
+GEOFENCE_RELOAD_S = float(os.getenv("GEOFENCE_RELOAD_S", 5))
+MAX_POLYGON_VERTICES = int(os.getenv("MAX_POLYGON_VERTICES", 1000))
+
+# Date d'un état créé avant son premier point évalué (colonne non nulle)
+NO_POINT_YET = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+events_recorded = counter("geofence_events_total", "Entrées/sorties de zone détectées", ("event",))
+evaluate_seconds = summary("geofence_evaluate_seconds", "Durée de l'évaluation des zones pour un lot")
+
+
+def validate_polygon(polygon: Sequence[Sequence[float]]) -> Optional[str]:
+    # Message d'erreur, ou None si le polygone est utilisable
+    if len(polygon) < 3:
+        return "Le polygone doit avoir au moins 3 sommets"
+    if len(polygon) > MAX_POLYGON_VERTICES:
+        return f"Le polygone a trop de sommets (maximum {MAX_POLYGON_VERTICES})"
+    for lat, lon in polygon:
+        if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+            return f"Sommet hors limites : [{lat}, {lon}]"
+    return None
+
+
+def _edge_width(vertices: int) -> int:
+    # Nombre d'arêtes arrondi à la puissance de 2 supérieure (au moins 8)
+    return max(8, 1 << (vertices - 1).bit_length())
+
+
+class GeofenceIndex:
+    # Index immuable, reconstruit en entier quand les zones changent. Les
+    # arêtes sont rangées dans une matrice par largeur (_edge_width) ; les
+    # arêtes de bourrage, d'un sommet vers lui-même, ne croisent aucun rayon
+    def __init__(self, fences: Iterable[Tuple[int, Sequence[Sequence[float]]]],
+                 cell_deg: float = GEOFENCE_GRID_DEG, max_cells: int = GEOFENCE_MAX_CELLS):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._large: List[int] = []
+        ids, bboxes, widths, rows = [], [], [], []
+        edges: Dict[int, List[np.ndarray]] = {}
+        for position, (fence_id, polygon) in enumerate(fences):
+            vertices = np.asarray(polygon, dtype=np.float64)
+            width = _edge_width(len(vertices))
+            # Arêtes [lat1, lon1, lat2, lon2], fermeture implicite du dernier sommet au premier
+            fence_edges = np.empty((width, 4))
+            fence_edges[:, :2] = fence_edges[:, 2:] = vertices[0]
+            fence_edges[:len(vertices), :2] = vertices
+            fence_edges[:len(vertices), 2:] = np.roll(vertices, -1, axis=0)
+            rows.append(len(edges.setdefault(width, [])))
+            edges[width].append(fence_edges)
+            widths.append(width)
+            ids.append(fence_id)
+            bbox = (*vertices.min(axis=0), *vertices.max(axis=0))
+            bboxes.append(bbox)
+
+            min_row, min_col = self._cell(bbox[0], bbox[1])
+            max_row, max_col = self._cell(bbox[2], bbox[3])
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > max_cells:
+                self._large.append(position)
+                continue
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    self._cells.setdefault((row, col), []).append(position)
+
+        self._ids = np.array(ids, dtype=np.int64)
+        self._bbox = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        self._width = np.array(widths, dtype=np.int64)
+        self._row = np.array(rows, dtype=np.int64)
+        self._edges = {width: np.stack(matrices) for width, matrices in edges.items()}
+        self.ids = frozenset(ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _candidates(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Paires (point, zone) à tester : zones de la cellule du point et grandes zones
+        rows = np.floor(lat / self.cell_deg).astype(np.int64).tolist()
+        cols = np.floor(lon / self.cell_deg).astype(np.int64).tolist()
+        points: List[int] = []
+        positions: List[int] = []
+        for index, key in enumerate(zip(rows, cols)):
+            cell = self._cells.get(key)
+            if cell:
+                points.extend([index] * len(cell))
+                positions.extend(cell)
+        points = np.array(points, dtype=np.int64)
+        positions = np.array(positions, dtype=np.int64)
+        if self._large:
+            everyone = np.arange(len(lat))
+            points = np.concatenate((points, np.repeat(everyone, len(self._large))))
+            positions = np.concatenate((positions, np.tile(self._large, len(lat))))
+        return points, positions
+
+    def locate(self, lat: np.ndarray, lon: np.ndarray) -> List[Set[int]]:
+        # Zones contenant chaque point : toutes les paires candidates du lot
+        # sont testées d'un coup, une opération NumPy par largeur de matrice
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        located: List[Set[int]] = [set() for _ in range(len(lat))]
+        if not len(self._ids) or not len(lat):
+            return located
+        points, positions = self._candidates(lat, lon)
+        bbox = self._bbox[positions]
+        plat, plon = lat[points], lon[points]
+        keep = (plat >= bbox[:, 0]) & (plat <= bbox[:, 2]) & (plon >= bbox[:, 1]) & (plon <= bbox[:, 3])
+        points, positions, plat, plon = points[keep], positions[keep], plat[keep, None], plon[keep, None]
+
+        widths = self._width[positions]
+        for width, matrix in self._edges.items():
+            selected = np.flatnonzero(widths == width)
+            if not len(selected):
+                continue
+            edges = matrix[self._row[positions[selected]]]
+            lat1, lon1, lat2, lon2 = edges[..., 0], edges[..., 1], edges[..., 2], edges[..., 3]
+            y, x = plat[selected], plon[selected]
+            # Lancer de rayon vers l'est : nombre impair d'arêtes croisées = intérieur
+            crosses = (lat1 > y) != (lat2 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                edge_lon = lon1 + (y - lat1) * (lon2 - lon1) / (lat2 - lat1)
+            inside = np.count_nonzero(crosses & (x < edge_lon), axis=1) % 2 == 1
+            for index, fence_id in zip(points[selected[inside]].tolist(),
+                                       self._ids[positions[selected[inside]]].tolist()):
+                located[index].add(fence_id)
+        return located
+
+
+class GeofenceRegistry:
+    # Index partagé par les requêtes du processus. Les routes de zones
+    # l'invalident ; les autres processus voient le changement à la
+    # vérification suivante de la signature de la table (au plus toutes les
+    # GEOFENCE_RELOAD_S secondes, une requête agrégée sur geofences)
+    def __init__(self, reload_interval: float = GEOFENCE_RELOAD_S):
+        self.reload_interval = reload_interval
+        self._index = GeofenceIndex([])
+        self._signature = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = None
+            self._checked_at = None
+
+    def _fresh(self) -> bool:
+        return self._checked_at is not None and time.monotonic() - self._checked_at < self.reload_interval
+
+    def get(self, db: Session) -> GeofenceIndex:
+        if self._fresh():
+            return self._index
+        with self._lock:
+            if self._fresh():
+                return self._index
+            # Création (max id), suppression (count) ou modification (somme des versions)
+            signature = tuple(db.execute(
+                select(func.count(), func.max(Geofence.id), func.sum(Geofence.version))
+            ).one())
+            if signature != self._signature:
+                self._index = GeofenceIndex(
+                    (fence_id, json.loads(polygon))
+                    for fence_id, polygon in db.execute(select(Geofence.id, Geofence.polygon))
+                )
+                self._signature = signature
+            self._checked_at = time.monotonic()
+            return self._index
+
+
+geofences = GeofenceRegistry()
+gauge("geofences_indexed", "Zones présentes dans l'index en mémoire", geofences.__len__)
+
+
+def evaluate(db: Session, rows: Iterable[dict]) -> int:
+    # Entrées/sorties produites par les points d'un lot (dicts device_id,
+    # lat, lon, timestamp) ; retourne le nombre d'événements enregistrés
+    index = geofences.get(db)
+    if not len(index):
+        return 0
+    start = time.perf_counter()
+
+    rows = list(rows)
+    seconds = to_epoch_seconds([row["timestamp"] for row in rows]).tolist()
+    # Ordre chronologique par appareil, dans un ordre fixe d'appareils
+    order = sorted(range(len(rows)), key=lambda i: (rows[i]["device_id"], seconds[i]))
+    ordered = [(rows[i], seconds[i]) for i in order]
+    located = index.locate(
+        np.fromiter((row["lat"] for row, _ in ordered), dtype=np.float64, count=len(ordered)),
+        np.fromiter((row["lon"] for row, _ in ordered), dtype=np.float64, count=len(ordered)),
+    )
+
+    # Deux lots simultanés d'un même appareil ne produisent pas deux fois la
+    # même entrée (PostgreSQL) : l'état de chaque appareil est d'abord créé
+    # s'il manque (ON CONFLICT DO NOTHING attend le commit d'une création
+    # concurrente), puis verrouillé par FOR UPDATE, qui ne verrouille que des
+    # lignes existantes. Ordre fixe des appareils : pas d'interblocage
+    table = DeviceGeofenceState.__table__
+    insert_fn = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    device_ids = sorted({row["device_id"] for row in rows})
+    db.execute(
+        insert_fn(table).on_conflict_do_nothing(index_elements=["device_id"]),
+        [{"device_id": device_id, "inside": "[]", "timestamp": NO_POINT_YET} for device_id in device_ids],
+    )
+    states = db.execute(
+        select(DeviceGeofenceState.device_id, DeviceGeofenceState.inside, DeviceGeofenceState.timestamp)
+        .where(DeviceGeofenceState.device_id.in_(device_ids))
+        .order_by(DeviceGeofenceState.device_id)
+        .with_for_update()
+    ).all()
+    state_seconds = to_epoch_seconds([state.timestamp for state in states]).tolist()
+    # Les zones supprimées depuis sont oubliées, sans événement de sortie
+    current: Dict[str, Tuple[Set[int], Optional[float]]] = {
+        state.device_id: (set(json.loads(state.inside)) & index.ids, last_seen)
+        for state, last_seen in zip(states, state_seconds)
+    }
+
+    events = []
+    changed = {}
+    for (row, moment), fence_ids in zip(ordered, located):
+        inside, last_seen = current.get(row["device_id"], (set(), None))
+        # Point en retard sur le plus récent déjà évalué : ignoré, sinon il
+        # produirait une sortie (puis une nouvelle entrée) qui n'a pas eu lieu
+        if last_seen is not None and moment <= last_seen:
+            continue
+        for event, ids in (("exit", inside - fence_ids), ("enter", fence_ids - inside)):
+            events.extend({
+                "geofence_id": fence_id,
+                "device_id": row["device_id"],
+                "event": event,
+                "timestamp": row["timestamp"],
+                "lat": row["lat"],
+                "lon": row["lon"],
+            } for fence_id in sorted(ids))
+        current[row["device_id"]] = (fence_ids, moment)
+        changed[row["device_id"]] = {
+            "device_id": row["device_id"],
+            "inside": json.dumps(sorted(fence_ids)),
+            "timestamp": row["timestamp"],
+        }
+
+    if changed:
+        stmt = insert_fn(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["device_id"],
+            set_={"inside": stmt.excluded.inside, "timestamp": stmt.excluded.timestamp},
+        )
+        db.execute(stmt, [changed[device_id] for device_id in sorted(changed)])
+    if events:
+        db.execute(GeofenceEvent.__table__.insert(), events)
+        for event in events:
+            events_recorded.labels(event["event"]).inc()
+    evaluate_seconds.observe(time.perf_counter() - start)
+    return len(events)
@@ -0,0 +1,165 @@
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+from sqlalchemy import case, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .geo import encode
+from .geofence import evaluate as evaluate_geofences
+from .models import Device, DeviceAnalyticsState, DeviceLastPosition, GPSData, SyncLog
+from .schemas import GPSDataRequest
+from .metrics import counter
+
+points_inserted = counter("gps_points_inserted_total", "Points GPS enregistrés")
+duplicates_dropped = counter("gps_duplicates_dropped_total", "Points GPS ignorés car déjà reçus")
+sync_logs = counter("sync_logs_total", "Synchronisations journalisées (SyncLog) par statut", ("status",))
+
+
+def insert_ignore(db: Session, table, index_elements: List[str]):
+    # INSERT ... ON CONFLICT DO NOTHING selon le dialecte
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+    if dialect == "postgresql":
+        return pg_insert(table).on_conflict_do_nothing(index_elements=index_elements)
+    return insert(table)
+
+
+def upsert_devices(db: Session, device_ids: Iterable[str]):
+    # Une seule requête pour tous les appareils du lot
+    wanted = set(device_ids)
+    if not wanted:
+        return
+    existing = {
+        row.device_id
+        for row in db.query(Device.device_id).filter(Device.device_id.in_(wanted))
+    }
+    missing = [{"device_id": device_id} for device_id in sorted(wanted - existing)]
+    if missing:
+        # ON CONFLICT : un autre lot a pu créer l'appareil entre-temps
+        db.execute(insert_ignore(db, Device.__table__, ["device_id"]), missing)
+
+
+def insert_points(db: Session, points: List[GPSDataRequest]) -> List[dict]:
+    return insert_rows(db, [
+        {"device_id": p.device_id, "lat": p.lat, "lon": p.lon, "timestamp": p.timestamp}
+        for p in points
+    ])
+
+
+def insert_rows(db: Session, points: List[dict]) -> List[dict]:
+    # Insère en ignorant les points déjà reçus pour (device_id, timestamp) ;
+    # retourne les points réellement créés, tels que relus par RETURNING,
+    # avec leur id (les seuls à diffuser). Chaque point est un dict
+    # device_id, lat, lon, timestamp (déjà validé, JSON ou format binaire)
+    if not points:
+        return []
+
+    # Doublons à l'intérieur du lot : on garde la première occurrence
+    rows = {}
+    for p in points:
+        key = (p["device_id"], p["timestamp"])
+        if key not in rows:
+            rows[key] = {**p, "synced": True, "geohash": encode(p["lat"], p["lon"])}
+
+    table = GPSData.__table__
+    stmt = insert_ignore(db, table, ["device_id", "timestamp"]).returning(
+        table.c.id, table.c.device_id, table.c.lat, table.c.lon, table.c.timestamp,
+    )
+    inserted = db.execute(stmt, list(rows.values())).all()
+
+    points_inserted.inc(len(inserted))
+    duplicates_dropped.inc(len(points) - len(inserted))
+    if not inserted:
+        return []
+    update_last_positions(db, rows.values())
+    # Seuls les points réellement créés : un lot rejoué ne relance pas le calcul
+    mark_analytics_dirty(db, inserted)
+    # Entrées/sorties de zones, dans la même transaction que les points
+    evaluate_geofences(db, rows.values())
+
+    # Lignes relues telles quelles, sans les rapprocher du lot par leur
+    # horodatage : la base peut le rendre dans un autre fuseau
+    return [dict(row._mapping) for row in sorted(inserted, key=lambda row: row.id)]
+
+
+def _utc(timestamp: datetime) -> datetime:
+    # Horodatage sans fuseau considéré comme UTC (comparaison dans un même lot)
+    return timestamp if timestamp.tzinfo is not None else timestamp.replace(tzinfo=timezone.utc)
+
+
+def update_last_positions(db: Session, rows: Iterable[dict]):
+    # Le point le plus récent du lot pour chaque appareil ; la ligne n'est
+    # remplacée que s'il est plus récent que la position enregistrée, ce qui
+    # ignore les points anciens rejoués après une période hors ligne
+    latest = {}
+    for row in rows:
+        current = latest.get(row["device_id"])
+        if current is None or _utc(row["timestamp"]) > _utc(current["timestamp"]):
+            latest[row["device_id"]] = row
+    values = [
+        {"device_id": device_id, "lat": row["lat"], "lon": row["lon"], "timestamp": row["timestamp"]}
+        # Ordre fixe : évite les interblocages entre lots concurrents (PostgreSQL)
+        for device_id, row in sorted(latest.items())
+    ]
+
+    table = DeviceLastPosition.__table__
+    insert_fn = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_fn(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["device_id"],
+        set_={
+            "lat": stmt.excluded.lat,
+            "lon": stmt.excluded.lon,
+            "timestamp": stmt.excluded.timestamp,
+            "updated_at": func.now(),
+        },
+        where=table.c.timestamp < stmt.excluded.timestamp,
+    )
+    db.execute(stmt, values)
+
+
+def mark_analytics_dirty(db: Session, rows: Iterable):
+    # Plus ancien point reçu par appareil : les trajets/arrêts seront
+    # recalculés à partir de là (voir analytics.refresh_device)
+    earliest = {}
+    for row in rows:
+        current = earliest.get(row.device_id)
+        if current is None or _utc(row.timestamp) < _utc(current):
+            earliest[row.device_id] = row.timestamp
+    values = [
+        {"device_id": device_id, "dirty_since": timestamp, "version": 1}
+        for device_id, timestamp in sorted(earliest.items())
+    ]
+
+    table = DeviceAnalyticsState.__table__
+    insert_fn = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_fn(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["device_id"],
+        set_={
+            "dirty_since": case(
+                (table.c.dirty_since.is_(None), stmt.excluded.dirty_since),
+                (stmt.excluded.dirty_since < table.c.dirty_since, stmt.excluded.dirty_since),
+                else_=table.c.dirty_since,
+            ),
+            "version": table.c.version + 1,
+        },
+    )
+    db.execute(stmt, values)
+
+
+def find_point(db: Session, device_id: str, timestamp) -> Optional[GPSData]:
+    return (
+        db.query(GPSData)
+        .filter(GPSData.device_id == device_id, GPSData.timestamp == timestamp)
+        .first()
+    )
+
+
+def log_sync(db: Session, device_ids: Iterable[str], status: str = "success", error_message: str = None):
+    device_ids = sorted(set(device_ids))
+    for device_id in device_ids:
+        db.add(SyncLog(device_id=device_id, status=status, error_message=error_message))
+    sync_logs.labels(status).inc(len(device_ids))
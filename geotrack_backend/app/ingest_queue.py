@@ -0,0 +1,238 @@
+"""File d'ingestion différée (INGEST_MODE=queue).
+
+Points qu'un commit groupé n'a pas pu écrire, malgré une nouvelle tentative
+et l'écriture par moitiés : mis de côté dans INGEST_DEAD_LETTER_PATH (une
+ligne JSON par point), puis réinjectés une fois la cause corrigée :
+    python -m app.ingest_queue --replay
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import orjson
+
+from . import config  # noqa: F401  (.env chargé avant les autres modules)
+from .concurrency import run_in_threadpool
+from .database import SessionLocal
+from .ingest import upsert_devices, insert_rows, log_sync
+from .metrics import counter, gauge, summary
+from .pubsub import hub, stream_points
+from .schemas import GPSDataRequest
+from .validation import rejection_message, validate_rows
+
+logger = logging.getLogger(__name__)
+
+flush_seconds = summary("ingest_flush_seconds", "Durée d'un commit groupé")
+flushed_rows = counter("ingest_flushed_rows_total", "Points écrits par la file d'ingestion")
+flush_errors = counter("ingest_flush_errors_total", "Commits groupés en échec")
+dead_lettered = counter("ingest_dead_letter_total", "Points mis de côté après échec de l'écriture")
+queue_rejected = counter("ingest_queue_rejected_total", "Points refusés (file pleine)")
+
+
+class IngestQueue:
+    # Écriture différée : POST /data/ dépose le point validé dans la file et
+    # répond 202 ; une tâche de fond écrit les points par commits groupés,
+    # toutes les `flush_interval` secondes ou tous les `flush_rows` points.
+    # Le client a déjà eu 202 : un groupe en échec n'est jamais abandonné
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        flush_interval: float = 0.2,
+        flush_rows: int = 1000,
+        enabled: bool = False,
+        retry_delay: float = 0.5,
+        dead_letter_path: str = "ingest_dead_letter.jsonl",
+    ):
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.enabled = enabled
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def put_nowait(self, point: GPSDataRequest):
+        # Lève asyncio.QueueFull quand la file est pleine (contre-pression)
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        try:
+            self._queue.put_nowait(point)
+        except asyncio.QueueFull:
+            queue_rejected.inc()
+            raise
+
+    async def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Arrêt propre : on vide la file avant de rendre la main
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self.depth():
+            await self._flush(self._drain(self.flush_rows))
+        self._queue = None
+
+    def _drain(self, limit: int) -> List[GPSDataRequest]:
+        points = []
+        while len(points) < limit:
+            try:
+                points.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return points
+
+    async def _run(self):
+        points = []
+        try:
+            while True:
+                points = [await self._queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while len(points) < self.flush_rows:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        points.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                batch, points = points, []
+                await self._flush(batch)
+        except asyncio.CancelledError:
+            # Points déjà retirés de la file mais pas encore écrits
+            await self._flush(points)
+            raise
+
+    async def _flush(self, points: List[GPSDataRequest]):
+        if not points:
+            return
+        start = time.perf_counter()
+        try:
+            created = await self._write(points)
+            flushed_rows.inc(len(created))
+            hub.publish(created)
+        finally:
+            flush_seconds.observe(time.perf_counter() - start)
+
+    async def _write(self, points: List[GPSDataRequest]) -> List[GPSDataRequest]:
+        # Erreur passagère (connexion, interblocage) : le groupe est retenté
+        # une fois après `retry_delay` secondes
+        try:
+            return await run_in_threadpool(write_points, points)
+        except Exception:
+            flush_errors.inc()
+            logger.exception("Échec de l'écriture groupée de %d points, nouvelle tentative", len(points))
+        await asyncio.sleep(self.retry_delay)
+        return await self._write_halves(points)
+
+    async def _write_halves(self, points: List[GPSDataRequest]) -> List[GPSDataRequest]:
+        # Nouvel échec : écriture par moitiés, jusqu'au point isolé, pour que
+        # les points en cause ne bloquent pas ceux des autres appareils
+        try:
+            return await run_in_threadpool(write_points, points)
+        except Exception as error:
+            flush_errors.inc()
+            if len(points) == 1:
+                await run_in_threadpool(self._dead_letter, points, error)
+                return []
+        middle = len(points) // 2
+        return await self._write_halves(points[:middle]) + await self._write_halves(points[middle:])
+
+    def _dead_letter(self, points: List[GPSDataRequest], error: Exception):
+        failed_at = datetime.now(timezone.utc).isoformat()
+        lines = b"".join(
+            orjson.dumps({"point": point.model_dump(mode="json"), "error": repr(error), "failed_at": failed_at}) + b"\n"
+            for point in points
+        )
+        try:
+            with open(self.dead_letter_path, "ab") as f:
+                f.write(lines)
+        except OSError:
+            # Dernier recours : les points restent dans le journal
+            logger.exception("Points perdus, non écrits dans %s : %s", self.dead_letter_path, lines.decode())
+            return
+        dead_lettered.inc(len(points))
+        logger.error("%d point(s) mis de côté dans %s : %r", len(points), self.dead_letter_path, error)
+
+
+def write_points(points: List[GPSDataRequest]) -> List[GPSDataRequest]:
+    # Un seul commit pour tout le groupe ; les points écartés par les filtres
+    # d'ingestion sont seulement comptés dans SyncLog (le client a déjà eu 202).
+    # Retourne les points nouvellement enregistrés, à diffuser
+    db = SessionLocal()
+    try:
+        rows = [p.model_dump() for p in points]
+        reasons = validate_rows(db, rows)
+        kept = [row for row, reason in zip(rows, reasons) if reason is None]
+        upsert_devices(db, {row["device_id"] for row in kept})
+        inserted = insert_rows(db, kept)
+        log_sync(db, {p.device_id for p in points}, error_message=rejection_message(len(rows), reasons))
+        db.commit()
+        return stream_points(inserted)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def replay_dead_letters(queue: "IngestQueue") -> dict:
+    # Réécrit les points mis de côté, par groupes de `flush_rows` ; ceux qui
+    # échouent encore retournent dans le fichier
+    path = queue.dead_letter_path
+    if not os.path.exists(path):
+        return {"replayed": 0, "written": 0}
+    replaying = f"{path}.replaying"
+    os.replace(path, replaying)
+    with open(replaying, "rb") as f:
+        points = [GPSDataRequest.model_validate(orjson.loads(line)["point"]) for line in f if line.strip()]
+
+    async def replay():
+        written = 0
+        for i in range(0, len(points), queue.flush_rows):
+            written += len(await queue._write_halves(points[i:i + queue.flush_rows]))
+        return written
+
+    written = asyncio.run(replay())
+    os.remove(replaying)
+    return {"replayed": len(points), "written": written}
+
+
+ingest_queue = IngestQueue(
+    maxsize=int(os.getenv("INGEST_QUEUE_SIZE", 10000)),
+    flush_interval=int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 200)) / 1000,
+    flush_rows=int(os.getenv("INGEST_FLUSH_ROWS", 1000)),
+    enabled=os.getenv("INGEST_MODE", "sync").lower() == "queue",
+    retry_delay=int(os.getenv("INGEST_RETRY_DELAY_MS", 500)) / 1000,
+    dead_letter_path=os.getenv("INGEST_DEAD_LETTER_PATH", "ingest_dead_letter.jsonl"),
+)
+# File de l'application seulement, pas celles créées à part (tests)
+gauge("ingest_queue_depth", "Points en attente d'écriture", ingest_queue.depth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replay", action="store_true", help="réécrire les points mis de côté")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    if args.replay:
+        print(json.dumps(replay_dead_letters(ingest_queue)))
+
+
+if __name__ == "__main__":
+    main()
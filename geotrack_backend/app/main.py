@@ -1,47 +1,129 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import HTTPBearer
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-import uvicorn
-from dotenv import load_dotenv
-
-# Charger les variables d'environnement
-load_dotenv()
-
-from app.database import engine, get_db
-from app.models import Base
-from app.routes import auth, config, data
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="Nexor GeoTrack API",
-    description="GPS tracking system with offline capabilities",
-    version="1.0.0"
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include routers
-app.include_router(auth.router, prefix="/auth", tags=["authentication"])
-app.include_router(config.router, prefix="/config", tags=["configuration"])
-app.include_router(data.router, prefix="/data", tags=["gps-data"])
-
-@app.get("/")
-async def root():
-    return {"message": "Nexor GeoTrack API is running"}
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+import anyio.to_thread
+import os
+
+# Application construite par create_app() : importer ce module ne charge ni
+# les routes ni la base. `uvicorn app.main:app` (ou --factory
+# app.main:create_app) la construit au démarrage du worker.
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+def create_app(create_schema: Optional[bool] = None) -> FastAPI:
+    # Variables d'environnement chargées avant les modules de l'application,
+    # qui lisent leur configuration à l'import
+    from app import config  # noqa: F401
+
+    from app import metrics
+    from app.analytics import analytics_refresher
+    from app.database import dispose_engine, get_engine
+    from app.ingest_queue import ingest_queue
+    from app.middleware import CompressionMiddleware, MetricsMiddleware
+    from app.migrate import create_schema as run_create_schema
+    from app.profiling import ProfilingMiddleware
+    from app.pubsub import hub
+    from app.routes import admin, auth, config, data, devices, geofences
+    from app.shared import shared_state
+
+    # Création des tables au démarrage : sur demande seulement (développement,
+    # AUTO_CREATE_SCHEMA=true) ; sinon python -m app.migrate, une fois par déploiement
+    if create_schema is None:
+        create_schema = _env_flag("AUTO_CREATE_SCHEMA", "False")
+
+    # Taille du pool de threads dans lequel les routes exécutent leurs requêtes
+    # SQLAlchemy synchrones (run_in_threadpool)
+    threadpool_size = int(os.getenv("THREADPOOL_SIZE", 40))
+
+    # Compression des réponses : en dessous de GZIP_MIN_SIZE octets le gain ne
+    # vaut pas le coût CPU ; niveau 6 = bon compromis taille / CPU pour du JSON
+    gzip_min_size = int(os.getenv("GZIP_MIN_SIZE", 1000))
+    gzip_level = int(os.getenv("GZIP_LEVEL", 6))
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        anyio.to_thread.current_default_thread_limiter().total_tokens = threadpool_size
+        # Moteur et pool créés ici plutôt qu'à l'import, libérés à l'arrêt
+        get_engine()
+        if create_schema:
+            await run_in_threadpool(run_create_schema)
+        await shared_state.start()
+        await hub.start()
+        if ingest_queue.enabled:
+            await ingest_queue.start()
+        if analytics_refresher.enabled:
+            await analytics_refresher.start()
+        yield
+        await analytics_refresher.stop()
+        if ingest_queue.enabled:
+            await ingest_queue.stop()
+        await hub.stop()
+        await shared_state.stop()
+        dispose_engine()
+
+    app = FastAPI(
+        title="Nexor GeoTrack API",
+        description="GPS tracking system with offline capabilities",
+        version="1.0.0",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse
+    )
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Curseur de pagination et troncature : lisibles par le navigateur
+        expose_headers=["X-Next-Cursor", "X-Truncated"],
+    )
+    # Profilage à la demande : à l'intérieur de la compression et des métriques
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(CompressionMiddleware, minimum_size=gzip_min_size, compresslevel=gzip_level)
+    # Ajouté en dernier : le plus externe, la latence mesurée inclut la compression
+    app.add_middleware(MetricsMiddleware)
+
+    # Include routers
+    app.include_router(auth.router, prefix="/auth", tags=["authentication"])
+    app.include_router(config.router, prefix="/config", tags=["configuration"])
+    app.include_router(data.router, prefix="/data", tags=["gps-data"])
+    app.include_router(devices.router, prefix="/devices", tags=["devices"])
+    app.include_router(geofences.router, prefix="/geofences", tags=["geofences"])
+    app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
+    @app.get("/")
+    async def root():
+        return {"message": "Nexor GeoTrack API is running"}
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy"}
+
+    @app.get("/metrics")
+    async def get_metrics(request: Request):
+        # Format texte Prometheus ; l'ancien instantané JSON reste disponible
+        # avec Accept: application/json
+        if "application/json" in request.headers.get("accept", ""):
+            return metrics.snapshot()
+        return PlainTextResponse(metrics.exposition(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+    return app
+
+def __getattr__(name: str):
+    # `from app.main import app` : application construite au premier accès,
+    # puis conservée dans le module
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Un seul processus (développement) ; production : python -m app.serve
+    import uvicorn
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
@@ -0,0 +1,260 @@
+"""Maintenance de l'historique GPS : partitions, résumé à la minute, rétention.
+
+À lancer périodiquement (cron, tâche planifiée) :
+    python -m app.maintenance
+
+Les points bruts plus vieux que RAW_RETENTION_DAYS sont résumés dans
+gps_data_minute (un point moyen par appareil et par minute) puis supprimés ;
+le résumé est conservé GPS_DATA_RETENTION_DAYS jours.
+
+Sur PostgreSQL, gps_data est partitionnée par mois (migration
+gps_data_partitioning) : le job crée les partitions à venir et détache les
+partitions expirées au lieu de supprimer ligne à ligne. Sur SQLite la table
+reste unique et la purge se fait jour par jour.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import config  # noqa: F401  (.env chargé avant les autres modules)
+from .database import SessionLocal
+from .metrics import counter
+from .models import GPSData, GPSDataMinute
+
+logger = logging.getLogger(__name__)
+
+RAW_RETENTION_DAYS = int(os.getenv("RAW_RETENTION_DAYS", 90))
+GPS_DATA_RETENTION_DAYS = int(os.getenv("GPS_DATA_RETENTION_DAYS", 365))
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 2))
+# Détacher sans supprimer : la partition reste une table autonome à archiver
+ARCHIVE_PARTITIONS = os.getenv("ARCHIVE_PARTITIONS", "False").lower() == "true"
+
+PARTITION_NAME = re.compile(r"^gps_data_(\d{4})_(\d{2})$")
+# Partition par défaut (migration gps_data_partitioning) : points hors des
+# mois déjà créés
+DEFAULT_PARTITION = "gps_data_default"
+
+points_compacted = counter("gps_points_compacted_total", "Points bruts résumés à la minute puis purgés")
+minutes_purged = counter("gps_minutes_purged_total", "Points résumés supprimés (rétention)")
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_start(moment: datetime) -> datetime:
+    return day_start(moment).replace(day=1)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    years, month = divmod(moment.month - 1 + months, 12)
+    return moment.replace(year=moment.year + years, month=month + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"gps_data_{month:%Y_%m}"
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    kind = db.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('gps_data')")).scalar()
+    return kind == "p"
+
+
+def list_partitions(db: Session) -> List[Tuple[str, datetime]]:
+    # Partitions mensuelles rattachées, avec leur mois de début
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'gps_data'::regclass"
+    )).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_partitions(db: Session, now: datetime, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    # Crée d'avance la partition du mois courant et des mois suivants
+    created = []
+    month = month_start(now)
+    for _ in range(months_ahead + 1):
+        upper = add_months(month, 1)
+        name = partition_name(month)
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+            bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            if _default_has_rows(db, month, upper):
+                moved = _attach_from_default(db, name, bounds, month, upper)
+                logger.info("Partition %s : %d points déplacés depuis %s", name, moved, DEFAULT_PARTITION)
+            else:
+                db.execute(text(f"CREATE TABLE {name} PARTITION OF gps_data {bounds}"))
+            created.append(name)
+        month = upper
+    return created
+
+
+def _default_has_rows(db: Session, lower: datetime, upper: datetime) -> bool:
+    # Mois manqué par la maintenance, ou points datés dans le futur : CREATE
+    # TABLE ... PARTITION OF échouerait (contrainte de la partition par défaut)
+    return db.execute(
+        text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper LIMIT 1"),
+        {"lower": lower, "upper": upper},
+    ).first() is not None
+
+
+def _attach_from_default(db: Session, name: str, bounds: str, lower: datetime, upper: datetime) -> int:
+    # Table créée à part, remplie avec les points du mois retirés de la
+    # partition par défaut, puis rattachée ; le tout dans la transaction de
+    # l'appelant (ATTACH crée les index de gps_data sur la nouvelle table)
+    db.execute(text(f"CREATE TABLE {name} (LIKE gps_data INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = db.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"lower": lower, "upper": upper}).rowcount
+    db.execute(text(f"ALTER TABLE gps_data ATTACH PARTITION {name} {bounds}"))
+    return moved
+
+
+def _minute_bucket(dialect: str):
+    # Format en littéral (et non en paramètre) : PostgreSQL exige que
+    # l'expression du SELECT soit identique à celle du GROUP BY
+    if dialect == "postgresql":
+        return func.date_trunc(literal_column("'minute'"), GPSData.timestamp)
+    return func.strftime(literal_column("'%Y-%m-%d %H:%M:00.000000'"), GPSData.timestamp)
+
+
+def rollup_statement(db: Session, window):
+    # INSERT ... SELECT des moyennes par minute ; un point arrivé en retard
+    # sur une minute déjà résumée est fusionné (moyenne pondérée)
+    dialect = db.get_bind().dialect.name
+    bucket = _minute_bucket(dialect)
+    query = (
+        select(GPSData.device_id, bucket, func.avg(GPSData.lat), func.avg(GPSData.lon), func.count())
+        .where(*window)
+        .group_by(GPSData.device_id, bucket)
+    )
+    table = GPSDataMinute.__table__
+    insert = pg_insert if dialect == "postgresql" else sqlite_insert
+    stmt = insert(table).from_select(["device_id", "bucket", "lat", "lon", "point_count"], query)
+    total = table.c.point_count + stmt.excluded.point_count
+    return stmt.on_conflict_do_update(
+        index_elements=["device_id", "bucket"],
+        set_={
+            "lat": (table.c.lat * table.c.point_count + stmt.excluded.lat * stmt.excluded.point_count) / total,
+            "lon": (table.c.lon * table.c.point_count + stmt.excluded.lon * stmt.excluded.point_count) / total,
+            "point_count": total,
+        },
+    )
+
+
+def _window(start: Optional[datetime], end: datetime):
+    window = [GPSData.timestamp < end]
+    if start is not None:
+        window.append(GPSData.timestamp >= start)
+    return window
+
+
+def compact_window(db: Session, start: Optional[datetime], end: datetime, delete_rows: bool = True) -> int:
+    # Résume [start, end) puis supprime les points bruts ; le commit est
+    # fait par l'appelant pour que les deux étapes restent atomiques
+    window = _window(start, end)
+    count = db.execute(select(func.count()).select_from(GPSData).where(*window)).scalar()
+    if count:
+        db.execute(rollup_statement(db, window))
+        if delete_rows:
+            db.execute(delete(GPSData).where(*window))
+    return count
+
+
+def _compact_partitions(db: Session, cutoff: datetime) -> int:
+    total = 0
+    for name, month in list_partitions(db):
+        upper = add_months(month, 1)
+        if upper > cutoff:
+            continue
+        total += compact_window(db, month, upper, delete_rows=False)
+        db.execute(text(f"ALTER TABLE gps_data DETACH PARTITION {name}"))
+        if not ARCHIVE_PARTITIONS:
+            db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        logger.info("Partition %s %s", name, "détachée" if ARCHIVE_PARTITIONS else "supprimée")
+    # Reste éventuel dans la partition par défaut
+    total += compact_window(db, None, month_start(cutoff))
+    db.commit()
+    return total
+
+
+def _compact_days(db: Session, cutoff: datetime) -> int:
+    # Un jour par transaction : les écrivains ne sont bloqués que brièvement
+    total = 0
+    while True:
+        first = db.execute(select(func.min(GPSData.timestamp)).where(GPSData.timestamp < cutoff)).scalar()
+        if first is None:
+            break
+        if first.tzinfo is None:
+            first = first.replace(tzinfo=cutoff.tzinfo)
+        start = day_start(first)
+        total += compact_window(db, start, min(start + timedelta(days=1), cutoff))
+        db.commit()
+    return total
+
+
+def compact_raw_points(db: Session, cutoff: datetime) -> int:
+    if is_partitioned(db):
+        # Seules les partitions entièrement expirées sont détachées
+        total = _compact_partitions(db, cutoff)
+    else:
+        total = _compact_days(db, cutoff)
+    points_compacted.inc(total)
+    return total
+
+
+def purge_minutes(db: Session, cutoff: datetime) -> int:
+    result = db.execute(delete(GPSDataMinute).where(GPSDataMinute.bucket < cutoff))
+    db.commit()
+    minutes_purged.inc(result.rowcount)
+    return result.rowcount
+
+
+def run_maintenance(now: Optional[datetime] = None) -> dict:
+    now = now or datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        created = []
+        if is_partitioned(db):
+            created = ensure_partitions(db, now)
+            db.commit()
+        compacted = compact_raw_points(db, day_start(now - timedelta(days=RAW_RETENTION_DAYS)))
+        purged = purge_minutes(db, day_start(now - timedelta(days=GPS_DATA_RETENTION_DAYS)))
+        return {
+            "partitions_created": created,
+            "points_compacted": compacted,
+            "minutes_purged": purged,
+        }
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    print(json.dumps(run_maintenance()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Format texte d'exposition Prometheus (GET /metrics)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Bornes par défaut des histogrammes de durée, en secondes
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = Tuple[str, float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample_name(name: str, labels: Sequence[Tuple[str, object]]) -> str:
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{name}{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    # Métrique à étiquettes : un enfant par combinaison de valeurs, créé au
+    # premier appel de labels(), exposé sous le même nom
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._labels: Tuple[Tuple[str, str], ...] = ()
+        self._children: Dict[Tuple[str, ...], "_Family"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} attend les étiquettes {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    child._labels = tuple(zip(self.labelnames, values))
+                    self._children[values] = child
+        return child
+
+    def _new_child(self):
+        return type(self)(self.name, self.description)
+
+    def samples(self) -> List[Sample]:
+        if not self.labelnames:
+            return self._own_samples()
+        return [sample for child in list(self._children.values()) for sample in child._own_samples()]
+
+    def _own_samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+    def collect(self) -> Dict[str, float]:
+        return dict(self.samples())
+
+    def exposition(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ] + [f"{sample} {_format_value(value)}" for sample, value in self.samples()]
+
+
+class Counter(_Family):
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._value = 0
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    def _own_samples(self) -> List[Sample]:
+        return [(_sample_name(self.name, self._labels), self._value)]
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Gauge(_Family):
+    # Valeur lue au moment de la collecte (taille d'une file, connexions utilisées...)
+    TYPE = "gauge"
+
+    def __init__(self, name: str, description: str = "", fn: Callable[[], float] = None):
+        super().__init__(name, description)
+        self._fn = fn
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, fn: Callable[[], float]):
+        self._fn = fn
+
+    def _own_samples(self) -> List[Sample]:
+        return [(self.name, self._fn() if self._fn is not None else self._value)]
+
+
+class Summary(_Family):
+    # Durées observées : nombre, somme et maximum
+    TYPE = "summary"
+
+    def __init__(self, name: str, description: str = ""):
+        super().__init__(name, description)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def _own_samples(self) -> List[Sample]:
+        with self._lock:
+            return [
+                (f"{self.name}_count", self._count),
+                (f"{self.name}_sum", self._sum),
+                (f"{self.name}_max", self._max),
+            ]
+
+    def exposition(self) -> List[str]:
+        # Le maximum n'a pas sa place dans un summary Prometheus : jauge à part
+        count, total, maximum = self._own_samples()
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} summary",
+            f"{count[0]} {_format_value(count[1])}",
+            f"{total[0]} {_format_value(total[1])}",
+            f"# TYPE {maximum[0]} gauge",
+            f"{maximum[0]} {_format_value(maximum[1])}",
+        ]
+
+
+class Histogram(_Family):
+    # Répartition des valeurs observées dans des intervalles fixes (cumulés
+    # à l'exposition, comme l'attend Prometheus)
+    TYPE = "histogram"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.description, buckets=self.buckets)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def _own_samples(self) -> List[Sample]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else _format_value(float(bound))
+            samples.append((_sample_name(f"{self.name}_bucket", self._labels + (("le", le),)), cumulative))
+        samples.append((_sample_name(f"{self.name}_count", self._labels), cumulative))
+        samples.append((_sample_name(f"{self.name}_sum", self._labels), total))
+        return samples
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, description: str, **kwargs):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, description, **kwargs)
+        return _registry[name]
+
+
+def counter(name: str, description: str = "", labelnames: Sequence[str] = ()) -> Counter:
+    return _get_or_create(Counter, name, description, labelnames=labelnames)
+
+
+def gauge(name: str, description: str = "", fn: Callable[[], float] = None) -> Gauge:
+    metric = _get_or_create(Gauge, name, description)
+    if fn is not None:
+        metric.set_function(fn)
+    return metric
+
+
+def summary(name: str, description: str = "") -> Summary:
+    return _get_or_create(Summary, name, description)
+
+
+def histogram(name: str, description: str = "", labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, description, labelnames=labelnames, buckets=buckets)
+
+
+def snapshot() -> Dict[str, float]:
+    with _registry_lock:
+        metrics = sorted(_registry.items())
+    values = {}
+    for _, metric in metrics:
+        values.update(metric.collect())
+    return values
+
+
+def exposition() -> str:
+    with _registry_lock:
+        metrics = sorted(_registry.items())
+    lines = []
+    for _, metric in metrics:
+        lines += metric.exposition()
+    return "\n".join(lines) + "\n"
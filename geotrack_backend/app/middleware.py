@@ -0,0 +1,112 @@
+import time
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .database import QueryStats, query_stats
+from .metrics import gauge, histogram
+
+# Réponses à ne jamais compresser : un flux SSE doit partir événement par
+# événement, or le compresseur garde les petits morceaux en mémoire
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream",)
+
+
+# GZipMiddleware transmet telle quelle une réponse qui a déjà un
+# Content-Encoding : cet en-tête marque les flux à ne pas compresser, puis
+# est retiré avant l'envoi au client
+_IDENTITY = (b"content-encoding", b"identity")
+
+
+def _uncompressed(message: Message) -> bool:
+    content_type = Headers(raw=message["headers"]).get("content-type", "")
+    return content_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+
+
+class CompressionMiddleware:
+    # GZip au-delà de `minimum_size` octets (GZipMiddleware de Starlette),
+    # sauf flux temps réel, reconnus à l'en-tête Content-Type de la réponse
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, compresslevel: int = 9):
+        self.app = app
+        self.gzip = GZipMiddleware(self._mark_uncompressed, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_unmarked(message: Message) -> None:
+            if message["type"] == "http.response.start" and _uncompressed(message):
+                message = {**message, "headers": [header for header in message["headers"] if header != _IDENTITY]}
+            await send(message)
+
+        await self.gzip(scope, receive, send_unmarked)
+
+    async def _mark_uncompressed(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_marked(message: Message) -> None:
+            if message["type"] == "http.response.start" and _uncompressed(message):
+                message = {**message, "headers": [*message["headers"], _IDENTITY]}
+            await send(message)
+
+        await self.app(scope, receive, send_marked)
+
+
+requests_in_flight = gauge("http_requests_in_flight", "Requêtes HTTP en cours de traitement")
+request_seconds = histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP par route et statut", ("method", "route", "status"),
+)
+request_queries = histogram(
+    "http_request_db_queries", "Requêtes SQL exécutées par requête HTTP", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+request_db_seconds = histogram(
+    "http_request_db_seconds", "Temps SQL cumulé par requête HTTP", ("method", "route"),
+)
+
+
+def route_label(scope: Scope) -> str:
+    # Gabarit de la route (/data/{id}...) plutôt que le chemin : cardinalité
+    # bornée ; les chemins sans route (404) sont regroupés
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    # Latence par route et statut, requêtes en cours, et nombre / durée des
+    # requêtes SQL de chaque requête (via database.query_stats)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        streaming = False
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                streaming = content_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+            await send(message)
+
+        stats = QueryStats(scope["path"])
+        token = query_stats.set(stats)
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec()
+            query_stats.reset(token)
+            method, route = scope["method"], route_label(scope)
+            # Un flux SSE dure aussi longtemps que le client reste connecté :
+            # sa durée fausserait l'histogramme de latence
+            if not streaming:
+                request_seconds.labels(method, route, status).observe(elapsed)
+            request_queries.labels(method, route).observe(stats.count)
+            request_db_seconds.labels(method, route).observe(stats.seconds)
@@ -0,0 +1,36 @@
+"""Création du schéma de la base, une seule fois avant le démarrage des workers.
+
+    python -m app.migrate
+
+Crée les tables manquantes (Base.metadata.create_all) ; les évolutions de
+schéma PostgreSQL (partitionnement, index) passent par Alembic :
+    alembic upgrade head
+
+python -m app.serve l'exécute avant de lancer les workers ; l'application
+elle-même ne crée les tables au démarrage qu'avec AUTO_CREATE_SCHEMA=true.
+"""
+import argparse
+import json
+import logging
+import os
+from typing import List
+
+from . import config  # noqa: F401  (.env chargé avant les autres modules)
+from .database import Base, get_engine
+from . import models  # noqa: F401  (enregistre les tables dans Base.metadata)
+
+
+def create_schema(bind=None) -> List[str]:
+    Base.metadata.create_all(bind=bind if bind is not None else get_engine())
+    return sorted(Base.metadata.tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    print(json.dumps({"tables": create_schema()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, Index
 from sqlalchemy.sql import func
 from .database import Base
 from sqlalchemy import ForeignKey
@@ -11,6 +11,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_pin = Column(String, nullable=False)
+    pin_lookup = Column(String, index=True, nullable=True)  # HMAC du PIN, voir auth.get_pin_lookup
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -26,6 +27,17 @@ class Device(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class DeviceLastPosition(Base):
+    # Dernière position connue de chaque appareil, tenue à jour à chaque
+    # ingestion (voir ingest.update_last_positions) pour la vue flotte
+    __tablename__ = "device_last_position"
+
+    device_id = Column(String, primary_key=True)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class GPSData(Base):
     __tablename__ = "gps_data"
     
@@ -33,9 +45,140 @@ class GPSData(Base):
     device_id = Column(String, index=True, nullable=False)
     lat = Column(Float, nullable=False)
     lon = Column(Float, nullable=False)
-    timestamp = Column(DateTime(timezone=True), nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False, index=True)
     synced = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    geohash = Column(String, nullable=True)  # Calculé à l'insertion, voir app/geo.py
+
+    # Un point est identifié par (device_id, timestamp) : les renvois sont ignorés.
+    # Sert aussi d'index pour la pagination par appareil (parcours en ordre inverse)
+    __table_args__ = (
+        Index("ix_gps_data_device_id_timestamp", "device_id", "timestamp", unique=True),
+        # Index spatial : plages de préfixes geohash, le timestamp filtré dans l'index
+        Index("ix_gps_data_geohash_timestamp", "geohash", "timestamp"),
+    )
+
+class GPSDataMinute(Base):
+    # Historique sous-échantillonné : un point moyen par appareil et par minute,
+    # alimenté par app/maintenance.py avant la purge des points bruts
+    __tablename__ = "gps_data_minute"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, nullable=False)
+    bucket = Column(DateTime(timezone=True), nullable=False, index=True)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    point_count = Column(Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        Index("ix_gps_data_minute_device_id_bucket", "device_id", "bucket", unique=True),
+    )
+
+class DeviceAnalyticsState(Base):
+    # Appareils dont les trajets/arrêts sont à recalculer (voir app/analytics.py) :
+    # dirty_since = plus ancien point reçu depuis le dernier calcul, version
+    # incrémentée à chaque lot pour ne pas perdre un lot arrivé pendant le calcul
+    __tablename__ = "device_analytics_state"
+
+    device_id = Column(String, primary_key=True)
+    dirty_since = Column(DateTime(timezone=True), nullable=True, index=True)
+    version = Column(Integer, nullable=False, default=0)
+    refreshed_at = Column(DateTime(timezone=True), nullable=True)
+
+class Trip(Base):
+    # Déplacement entre deux arrêts
+    __tablename__ = "trips"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, nullable=False)
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True), nullable=False)
+    start_lat = Column(Float, nullable=False)
+    start_lon = Column(Float, nullable=False)
+    end_lat = Column(Float, nullable=False)
+    end_lon = Column(Float, nullable=False)
+    distance_m = Column(Float, nullable=False)
+    moving_s = Column(Float, nullable=False)
+    max_speed_mps = Column(Float, nullable=False)
+    point_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_trips_device_id_start_time", "device_id", "start_time"),
+    )
+
+class Stop(Base):
+    # Immobilisation d'au moins STOP_MIN_DWELL_S secondes
+    __tablename__ = "stops"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, nullable=False)
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True), nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    point_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_stops_device_id_start_time", "device_id", "start_time"),
+    )
+
+class DeviceDailySummary(Base):
+    # Agrégats par appareil et par jour (UTC) : durées et distances réparties
+    # entre les jours traversés (analytics.rebuild_daily), trajets et arrêts
+    # comptés le jour de leur début
+    __tablename__ = "device_daily_summary"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    distance_m = Column(Float, nullable=False, default=0)
+    moving_s = Column(Float, nullable=False, default=0)
+    stopped_s = Column(Float, nullable=False, default=0)
+    trip_count = Column(Integer, nullable=False, default=0)
+    stop_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_device_daily_summary_device_id_day", "device_id", "day", unique=True),
+    )
+
+class Geofence(Base):
+    # Zone surveillée : polygone [[lat, lon], ...] en JSON, voir app/geofence.py
+    __tablename__ = "geofences"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    polygon = Column(Text, nullable=False)
+    # Incrémentée à chaque modification : les autres processus rechargent leur index
+    version = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class DeviceGeofenceState(Base):
+    # Zones où se trouve l'appareil (ids en JSON) d'après son point le plus
+    # récent, daté par `timestamp` (geofence.NO_POINT_YET avant le premier)
+    __tablename__ = "device_geofence_state"
+
+    device_id = Column(String, primary_key=True)
+    inside = Column(Text, nullable=False, default="[]")
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+
+class GeofenceEvent(Base):
+    # Entrée (enter) ou sortie (exit) d'une zone, datée par le point qui l'a révélée
+    __tablename__ = "geofence_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    geofence_id = Column(Integer, nullable=False)
+    device_id = Column(String, nullable=False)
+    event = Column(String, nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_geofence_events_device_id_timestamp", "device_id", "timestamp"),
+        Index("ix_geofence_events_geofence_id_timestamp", "geofence_id", "timestamp"),
+    )
 
 class SyncLog(Base):
     __tablename__ = "sync_logs"
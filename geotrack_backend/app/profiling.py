@@ -0,0 +1,145 @@
+import cProfile
+import io
+import itertools
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Diagnostic en production : profil cProfile d'une requête sur demande
+# (en-tête X-Profile égal à DIAGNOSTICS_TOKEN) ou par échantillonnage
+# (PROFILE_SAMPLE_RATE, entre 0 et 1), et journal des requêtes SQL lentes
+# avec leur plan ; le tout consultable via GET /admin/diagnostics
+DIAGNOSTICS_TOKEN = os.getenv("DIAGNOSTICS_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 40))
+DIAGNOSTICS_BUFFER_SIZE = int(os.getenv("DIAGNOSTICS_BUFFER_SIZE", 50))
+PROFILE_HEADER = "x-profile"
+
+
+class RingBuffer:
+    # Derniers éléments enregistrés, les plus anciens sont écrasés
+    def __init__(self, maxsize: int):
+        self._items = deque(maxlen=maxsize)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def append(self, item: dict) -> int:
+        with self._lock:
+            item["id"] = next(self._ids)
+            self._items.append(item)
+            return item["id"]
+
+    def get(self, item_id: int) -> Optional[dict]:
+        with self._lock:
+            return next((item for item in self._items if item["id"] == item_id), None)
+
+    def items(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self._items))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+profiles = RingBuffer(DIAGNOSTICS_BUFFER_SIZE)
+slow_queries = RingBuffer(DIAGNOSTICS_BUFFER_SIZE)
+
+
+class RequestProfile:
+    # Profils d'une requête : celui du thread de la boucle d'événements et
+    # un par appel exécuté dans le pool de threads (requêtes SQL, hachage...)
+    # via app.concurrency.run_in_threadpool
+    def __init__(self):
+        self.loop = cProfile.Profile()
+        self.workers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add_worker(self, profiler: cProfile.Profile):
+        with self._lock:
+            self.workers.append(profiler)
+
+    def report(self, top: int) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(self.loop, stream=stream)
+        for profiler in self.workers:
+            stats.add(profiler)
+        stats.sort_stats("cumulative").print_stats(top)
+        return stream.getvalue()
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+class ProfilingMiddleware:
+    # Un seul profil à la fois : cProfile ne peut pas suivre deux requêtes
+    # entrelacées dans le même thread (celui de la boucle d'événements)
+    def __init__(self, app: ASGIApp, token: str = DIAGNOSTICS_TOKEN, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self._busy = threading.Lock()
+
+    def _wanted(self, scope: Scope) -> bool:
+        if self.token and Headers(scope=scope).get(PROFILE_HEADER) == self.token:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._wanted(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        entry = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        item_id = profiles.append(entry)
+        status = 500
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = str(item_id)
+            await send(message)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        profile.loop.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.loop.disable()
+            current_profile.reset(token)
+            self._busy.release()
+            entry.update(
+                status=status,
+                duration_ms=round((time.perf_counter() - start) * 1000, 2),
+                report=profile.report(PROFILE_TOP),
+            )
+
+
+def record_slow_query(statement: str, duration: float, path: Optional[str], plan: List[str]):
+    logger.warning("Requête SQL lente (%.0f ms, %s) : %s", duration * 1000, path or "-", statement)
+    slow_queries.append({
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(duration * 1000, 2),
+        "path": path,
+        "statement": statement,
+        "plan": plan,
+    })
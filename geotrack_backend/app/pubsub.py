@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from .concurrency import run_in_threadpool
+from .metrics import counter, gauge
+from .schemas import GPSDataRequest
+from .shared import MemoryBackend, shared_state
+
+logger = logging.getLogger(__name__)
+
+# Taille du tampon de chaque abonné : au-delà, les messages les plus anciens
+# sont abandonnés pour qu'un client lent ne ralentisse jamais l'ingestion
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", 256))
+
+STREAM_CHANNEL = "stream"
+# Backend partagé : nombre d'abonnés de tous les workers, tenu à jour par une
+# tâche de fond (au plus une fois par seconde) pour savoir s'il faut publier
+SUBSCRIBERS_KEY = "stream:subscribers"
+SUBSCRIBERS_REFRESH_S = 1.0
+
+published = counter("stream_points_published_total", "Points diffusés aux abonnés")
+dropped = counter("stream_messages_dropped_total", "Messages abandonnés (abonné trop lent)")
+
+
+def sse_event(point: GPSDataRequest) -> str:
+    data = json.dumps({
+        "device_id": point.device_id,
+        "lat": point.lat,
+        "lon": point.lon,
+        "timestamp": point.timestamp.isoformat(),
+    })
+    return f"data: {data}\n\n"
+
+
+def stream_points(rows: Iterable[dict]) -> List[GPSDataRequest]:
+    # Points créés par insert_rows, tels que publiés sur le flux
+    return [
+        GPSDataRequest.model_construct(device_id=row["device_id"], lat=row["lat"], lon=row["lon"], timestamp=row["timestamp"])
+        for row in rows
+    ]
+
+
+class Subscription:
+    def __init__(self, device_ids: Optional[Set[str]], maxsize: int):
+        self.device_ids = device_ids
+        self._buffer = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+
+    def push(self, message: str):
+        if len(self._buffer) == self._buffer.maxlen:
+            dropped.inc()
+        self._buffer.append(message)
+        self._ready.set()
+
+    async def get(self, timeout: float) -> List[str]:
+        # Tous les messages en attente d'un coup, ou [] après `timeout` secondes
+        if not self._buffer:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        messages = list(self._buffer)
+        self._buffer.clear()
+        self._ready.clear()
+        return messages
+
+
+class Hub:
+    # Pub/sub dans la boucle d'événements du processus : publish() et
+    # subscribe() doivent être appelés depuis la boucle (pas d'un thread).
+    # Les lots passent par `backend` (app/shared.py) : avec un backend
+    # partagé, chaque worker les distribue à ses propres abonnés
+    def __init__(self, buffer_size: int = STREAM_BUFFER_SIZE, backend=None):
+        self.buffer_size = buffer_size
+        self._by_device: Dict[str, Set[Subscription]] = {}
+        self._all: Set[Subscription] = set()
+        self._backend = backend if backend is not None else MemoryBackend()
+        # Abonnés de ce worker déjà comptés dans le compteur partagé, et total
+        # de tous les workers lu en retour
+        self._reported = 0
+        self._remote_subscribers = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._backend.subscribe(STREAM_CHANNEL, self._deliver)
+
+    @property
+    def active(self) -> bool:
+        # Un abonné dans ce worker ou, avec un backend partagé, dans un autre.
+        # Sans accès au réseau : le total est relu par la tâche de fond.
+        # Compteur resté positif après l'arrêt brutal d'un worker : des lots
+        # publiés pour rien, sans autre effet
+        if self._all or self._by_device:
+            return True
+        return self._remote_subscribers > 0
+
+    async def start(self):
+        if self._backend.remote:
+            # Event lié à la boucle qui l'attend : recréé à chaque démarrage
+            self._changed = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Abonnés de ce worker retirés du compteur partagé
+        await run_in_threadpool(self._backend.incr, SUBSCRIBERS_KEY, -self._reported)
+        self._reported = 0
+
+    async def _run(self):
+        while True:
+            try:
+                await self._sync_subscribers()
+            except Exception:
+                logger.exception("Échec de la mise à jour du nombre d'abonnés")
+            # Réveil anticipé à chaque abonnement ou désabonnement
+            try:
+                await asyncio.wait_for(self._changed.wait(), SUBSCRIBERS_REFRESH_S)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sync_subscribers(self):
+        # Écart depuis le dernier envoi ajouté au compteur partagé (appel
+        # bloquant du client Redis : dans le pool de threads)
+        self._changed.clear()
+        count = self.subscriber_count()
+        delta = count - self._reported
+        self._remote_subscribers = await run_in_threadpool(self._backend.incr, SUBSCRIBERS_KEY, delta)
+        self._reported = count
+
+    def subscriber_count(self) -> int:
+        return len(self._all) + sum(len(subs) for subs in self._by_device.values())
+
+    def subscribe(self, device_ids: Optional[Iterable[str]] = None) -> Subscription:
+        device_ids = set(device_ids) if device_ids else None
+        subscription = Subscription(device_ids, self.buffer_size)
+        self._changed.set()
+        if device_ids is None:
+            self._all.add(subscription)
+        else:
+            for device_id in device_ids:
+                self._by_device.setdefault(device_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._changed.set()
+        if subscription.device_ids is None:
+            self._all.discard(subscription)
+            return
+        for device_id in subscription.device_ids:
+            subs = self._by_device.get(device_id)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._by_device[device_id]
+
+    def publish(self, points: List[GPSDataRequest]):
+        # Chaque point est sérialisé une seule fois ; un abonné reçoit un seul
+        # message par lot, quel que soit le nombre de points qui le concernent
+        if not points or not self.active:
+            return
+        events: Dict[str, List[str]] = {}
+        for point in points:
+            events.setdefault(point.device_id, []).append(sse_event(point))
+        published.inc(len(points))
+        self._backend.publish(STREAM_CHANNEL, events)
+
+    def _deliver(self, events: Dict[str, List[str]]):
+        # Lot publié par ce worker ou par un autre (backend partagé)
+        if self._all:
+            chunk = "".join("".join(device_events) for device_events in events.values())
+            for subscription in self._all:
+                subscription.push(chunk)
+
+        targeted: Dict[Subscription, List[str]] = {}
+        for device_id, device_events in events.items():
+            for subscription in self._by_device.get(device_id, ()):
+                targeted.setdefault(subscription, []).extend(device_events)
+        for subscription, subscription_events in targeted.items():
+            subscription.push("".join(subscription_events))
+
+
+hub = Hub(backend=shared_state)
+# Abonnés du hub de l'application seulement, pas ceux des hubs créés à part
+gauge("stream_subscribers", "Abonnés au flux temps réel", hub.subscriber_count)
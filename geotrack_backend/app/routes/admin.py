@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import hmac
+from .. import database, profiling
+
+router = APIRouter()
+
+# Diagnostic réservé à l'exploitation : jeton partagé DIAGNOSTICS_TOKEN
+# (le même que l'en-tête X-Profile), pas de compte utilisateur
+def require_diagnostics_token(x_admin_token: Optional[str] = Header(None)):
+    if not profiling.DIAGNOSTICS_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Diagnostic désactivé (DIAGNOSTICS_TOKEN non défini)"
+        )
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, profiling.DIAGNOSTICS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Jeton d'administration invalide"
+        )
+
+@router.get("/diagnostics", dependencies=[Depends(require_diagnostics_token)])
+async def get_diagnostics():
+    # Profils sans leur rapport (voir /admin/profiles/{id}), du plus récent au plus ancien
+    return {
+        "profile_sample_rate": profiling.PROFILE_SAMPLE_RATE,
+        "slow_query_ms": database.SLOW_QUERY_MS,
+        "profiles": [
+            {key: value for key, value in entry.items() if key != "report"}
+            for entry in profiling.profiles.items()
+        ],
+        "slow_queries": profiling.slow_queries.items(),
+    }
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse,
+            dependencies=[Depends(require_diagnostics_token)])
+async def get_profile(profile_id: int):
+    entry = profiling.profiles.get(profile_id)
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profil introuvable (expiré ou inconnu)"
+        )
+    if "report" not in entry:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Requête encore en cours"
+        )
+    return PlainTextResponse(entry["report"])
+
+@router.delete("/diagnostics", status_code=status.HTTP_204_NO_CONTENT,
+               dependencies=[Depends(require_diagnostics_token)])
+async def clear_diagnostics():
+    profiling.profiles.clear()
+    profiling.slow_queries.clear()
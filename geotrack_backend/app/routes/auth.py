@@ -1,15 +1,13 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import HTTPBearer
 from datetime import timedelta
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import random
 import os
 from sqlalchemy.orm import Session
 
+from ..concurrency import run_in_threadpool
 from ..schemas import LoginRequest, RegisterRequest, TokenResponse, ChangePinRequest, ForgotPinRequest
-from ..auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_pin_hash, verify_token
+from ..auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, set_user_pin, verify_pin, verify_token
 from ..database import get_db
 from ..models import User
 
@@ -21,6 +19,10 @@ async def register(
     register_data: RegisterRequest,
     db: Session = Depends(get_db)
 ):
+    return await run_in_threadpool(_create_user, db, register_data)
+
+# Requêtes et hachages synchrones exécutés dans le pool de threads
+def _create_user(db: Session, register_data: RegisterRequest):
     # Vérifier si l'email existe déjà
     existing_user = db.query(User).filter(User.email == register_data.email).first()
     if existing_user:
@@ -30,10 +32,8 @@ async def register(
         )
     
     # Créer un nouvel utilisateur
-    new_user = User(
-        email=register_data.email,
-        hashed_pin=get_pin_hash(register_data.pin)
-    )
+    new_user = User(email=register_data.email)
+    set_user_pin(new_user, register_data.pin)
     
     db.add(new_user)
     db.commit()
@@ -46,8 +46,8 @@ async def login(
     login_data: LoginRequest,
     db: Session = Depends(get_db)
 ):
-    # Utiliser seulement le PIN pour l'authentification
-    user = authenticate_user(db, login_data.pin)
+    # PIN seul (recherche par empreinte indexée) ou email + PIN
+    user = await run_in_threadpool(authenticate_user, db, login_data.pin, login_data.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -76,7 +76,11 @@ async def change_pin(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Non autorisé à modifier ce compte"
         )
-    
+
+    await run_in_threadpool(_change_pin, db, change_data)
+    return {"message": "PIN modifié avec succès"}
+
+def _change_pin(db: Session, change_data: ChangePinRequest):
     # Vérifier l'utilisateur
     user = db.query(User).filter(User.email == change_data.email).first()
     if not user:
@@ -86,7 +90,6 @@ async def change_pin(
         )
     
     # Vérifier l'ancien PIN
-    from ..auth import verify_pin
     if not verify_pin(change_data.old_pin, user.hashed_pin):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -94,17 +97,28 @@ async def change_pin(
         )
     
     # Mettre à jour le PIN
-    user.hashed_pin = get_pin_hash(change_data.new_pin)
+    set_user_pin(user, change_data.new_pin)
     
     db.commit()
-    
-    return {"message": "PIN modifié avec succès"}
 
 @router.post("/forgot-pin")
 async def forgot_pin(
     forgot_data: ForgotPinRequest,
     db: Session = Depends(get_db)
 ):
+    new_pin = await run_in_threadpool(_reset_pin, db, forgot_data)
+
+    # Envoyer le nouveau PIN par email
+    try:
+        await run_in_threadpool(send_pin_email, forgot_data.email, new_pin)
+        return {"message": "Nouveau PIN envoyé par email"}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors de l'envoi de l'email: {str(e)}"
+        )
+
+def _reset_pin(db: Session, forgot_data: ForgotPinRequest) -> str:
     # Vérifier que l'email existe dans la base de données
     user = db.query(User).filter(User.email == forgot_data.email).first()
     if not user:
@@ -117,24 +131,20 @@ async def forgot_pin(
     new_pin = str(random.randint(1000, 9999))  # PIN à 4 chiffres
     
     # Mettre à jour le PIN dans la base de données
-    user.hashed_pin = get_pin_hash(new_pin)
+    set_user_pin(user, new_pin)
     
     db.commit()
-    
-    # Envoyer le nouveau PIN par email
-    try:
-        await send_pin_email(forgot_data.email, new_pin)
-        return {"message": "Nouveau PIN envoyé par email"}
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erreur lors de l'envoi de l'email: {str(e)}"
-        )
+    return new_pin
         
         
         
 
-async def send_pin_email(email: str, new_pin: str):
+def send_pin_email(email: str, new_pin: str):
+    # smtplib et email.mime importés ici : rarement utilisés, inutiles au démarrage
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     # Configuration SMTP (à mettre dans les variables d'environnement)
     smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
     smtp_port = int(os.getenv("SMTP_PORT", 587))
@@ -1,35 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, status  
-from fastapi.security import HTTPBearer
+from fastapi import APIRouter, Depends, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import Optional
-from ..models import Config, User
+import hashlib
+import os
+from ..concurrency import run_in_threadpool
+from ..models import Config
 from ..schemas import ConfigResponse, ConfigUpdateRequest
 from ..database import get_db
-from ..auth import verify_token  
+from ..auth import CurrentUser, get_current_user
+from ..cache import TTLCache
 
 router = APIRouter()
-security = HTTPBearer()
 
-def get_current_user_email(token: str = Depends(security)):
-    return verify_token(token.credentials)
+# Les appareils relisent leur config à chaque cycle de synchronisation :
+# elle est servie depuis ce cache, mis à jour à chaque PUT/PATCH. Partagé
+# entre les workers : un PUT reçu par l'un est vu par tous
+config_cache = TTLCache(
+    "config",
+    maxsize=int(os.getenv("CONFIG_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("CONFIG_CACHE_TTL", 60)),
+    shared=True,
+    dumps=lambda config: config.model_dump_json().encode(),
+    loads=ConfigResponse.model_validate_json,
+)
+
+def config_etag(config: ConfigResponse) -> str:
+    digest = hashlib.sha1(config.model_dump_json().encode()).hexdigest()[:16]
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
 
 @router.get("/", response_model=ConfigResponse)
 async def get_user_config(
-    user_email: str = Depends(get_current_user_email),
+    request: Request,
+    response: Response,
+    user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Trouver l'utilisateur
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,  # Ajoutez status. ici
-            detail="Utilisateur non trouvé"
-        )
-    
-    # Get user's config or create default one
-    config = db.query(Config).filter(Config.user_id == user.id).first()
+    config = await run_in_threadpool(_cached_config, db, user)
+
+    # Config inchangée : 304 sans corps
+    etag = config_etag(config)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return config
+
+# Requêtes synchrones exécutées dans le pool de threads, avec les accès au
+# cache : partagé, il fait un aller-retour réseau (client Redis bloquant)
+def _cached_config(db: Session, user: CurrentUser) -> ConfigResponse:
+    config = config_cache.get(user.email)
+    if config is None:
+        config = _read_config(db, user.id)
+        config_cache.set(user.email, config)
+    return config
+
+def _read_config(db: Session, user_id: int) -> ConfigResponse:
+    # Get user's config or create default one (l'utilisateur est résolu par get_current_user)
+    config = db.query(Config).filter(Config.user_id == user_id).first()
     if not config:
-        config = Config(user_id=user.id)
+        config = Config(user_id=user_id)
         db.add(config)
         db.commit()
         db.refresh(config)
@@ -43,17 +78,15 @@ async def get_user_config(
 @router.put("/", response_model=ConfigResponse)
 async def update_user_config(
     config_data: ConfigUpdateRequest,
-    user_email: str = Depends(get_current_user_email),
+    response: Response,
+    user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Trouver l'utilisateur
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,  # Ajoutez status. ici
-            detail="Utilisateur non trouvé"
-        )
-    
+    config = await run_in_threadpool(_write_config, db, user, config_data)
+    response.headers["ETag"] = config_etag(config)
+    return config
+
+def _write_config(db: Session, user: CurrentUser, config_data: ConfigUpdateRequest) -> ConfigResponse:
     # Get user's config or create if doesn't exist
     config = db.query(Config).filter(Config.user_id == user.id).first()
     if not config:
@@ -73,17 +106,21 @@ async def update_user_config(
     db.commit()
     db.refresh(config)
     
-    return ConfigResponse(
+    updated = ConfigResponse(
         x_parameter=config.x_parameter,
         y_parameter=config.y_parameter,
         device_id=config.device_id
     )
+    # Write-through : le prochain GET voit la nouvelle valeur
+    config_cache.set(user.email, updated)
+    return updated
 
 @router.patch("/", response_model=ConfigResponse)
 async def partial_update_user_config(
     config_data: ConfigUpdateRequest,
-    user_email: str = Depends(get_current_user_email),
+    response: Response,
+    user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Cette route fonctionne de la même manière que PUT
-    return await update_user_config(config_data, user_email, db)
\ No newline at end of file
+    return await update_user_config(config_data, response, user, db)
\ No newline at end of file
@@ -1,61 +1,415 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
+import asyncio
+from sqlalchemy import and_, or_, select, union_all
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
+import numpy as np
+import os
+from ..concurrency import run_in_threadpool
 from ..database import get_db
-from ..models import GPSData, Device, SyncLog
-from ..schemas import GPSDataRequest, GPSDataResponse
-from ..auth import verify_token
+from ..models import GPSData
+from ..schemas import (
+    GPSDataRequest,
+    GPSDataResponse,
+    GPSDataBatchRequest,
+    GPSDataBatchItemResult,
+    GPSDataBatchResponse,
+    TrackResponse,
+)
+from ..auth import get_current_user_email
+from ..ingest import upsert_devices, insert_rows, find_point, log_sync
+from ..binary import BINARY_MEDIA_TYPE, BinaryFormatError, decode_batch
+from ..export import EXPORTERS, EXPORT_MEDIA_TYPES, iter_points
+from ..geo import cover, haversine_m, prefix_upper_bound, radius_boxes
+from ..ingest_queue import ingest_queue
+from ..pubsub import hub, stream_points
+from ..track import SIMPLIFIERS, encode_deltas, encode_polyline, project, to_epoch_seconds
+from ..validation import REJECTION_MESSAGES, rejection_message, validate_rows
 
 router = APIRouter()
-security = HTTPBearer()
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 5000))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+SPATIAL_MAX_CELLS = int(os.getenv("SPATIAL_MAX_CELLS", 32))
+STREAM_HEARTBEAT_S = float(os.getenv("STREAM_HEARTBEAT_S", 15))
+MAX_TRACK_POINTS = int(os.getenv("MAX_TRACK_POINTS", 200000))
 
 @router.post("/", response_model=GPSDataResponse)
 async def create_gps_data(
     gps_data: GPSDataRequest,
-    token: str = Depends(security),
+    user_email: str = Depends(get_current_user_email),
     db: Session = Depends(get_db)
 ):
-    verify_token(token.credentials)
-    
-    # Create or get device
-    device = db.query(Device).filter(Device.device_id == gps_data.device_id).first()
-    if not device:
-        device = Device(device_id=gps_data.device_id)
-        db.add(device)
+    # Mode file d'ingestion (INGEST_MODE=queue) : écriture différée et groupée
+    if ingest_queue.enabled:
+        try:
+            ingest_queue.put_nowait(gps_data)
+        except asyncio.QueueFull:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="File d'ingestion pleine, réessayez plus tard",
+                headers={"Retry-After": "1"}
+            )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "queued"})
+
+    row, created = await run_in_threadpool(_store_point, db, gps_data)
+    if created:
+        hub.publish([gps_data])
+    return row
+
+# Les accès à la base sont synchrones : ils tournent dans le pool de threads
+# pour ne pas bloquer la boucle d'événements, la réponse étant sérialisée
+# ensuite dans la boucle
+def _store_point(db: Session, gps_data: GPSDataRequest):
+    # Filtres d'ingestion (app/validation.py) : un point rejeté est journalisé
+    # puis refusé en 422, inutile pour l'appareil de le renvoyer
+    point = gps_data.model_dump()
+    reason = validate_rows(db, [point])[0]
+    if reason is not None:
+        log_sync(db, [gps_data.device_id], status="error", error_message=rejection_message(1, [reason]))
         db.commit()
-    
-    # Create GPS data entry
-    db_gps_data = GPSData(
-        device_id=gps_data.device_id,
-        lat=gps_data.lat,
-        lon=gps_data.lon,
-        timestamp=gps_data.timestamp
-    )
-    db.add(db_gps_data)
-    
-    # Log sync
-    sync_log = SyncLog(
-        device_id=gps_data.device_id,
-        status="success"
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Point rejeté : {REJECTION_MESSAGES[reason]}"
+        )
+
+    # Create or get device, insert the point and log the sync in one commit
+    upsert_devices(db, [gps_data.device_id])
+    inserted = insert_rows(db, [point])
+    log_sync(db, [gps_data.device_id])
+    db.commit()
+
+    # Un renvoi du même point (même device_id et timestamp) retourne la ligne existante
+    if inserted:
+        return db.get(GPSData, inserted[0]["id"]), True
+    return find_point(db, gps_data.device_id, gps_data.timestamp), False
+
+@router.post(
+    "/batch",
+    response_model=GPSDataBatchResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": GPSDataBatchRequest.model_json_schema()},
+        BINARY_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+)
+async def create_gps_data_batch(
+    request: Request,
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    # Deux formats selon Content-Type : JSON (GPSDataBatchRequest) ou le
+    # format binaire compact de app/binary.py, sans validation point par point
+    body = await request.body()
+    if request.headers.get("content-type", "").split(";")[0].strip() == BINARY_MEDIA_TYPE:
+        try:
+            rows = await run_in_threadpool(decode_batch, body)
+        except BinaryFormatError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Format binaire invalide : {e}")
+        _check_batch_size(len(rows))
+        result, created = await run_in_threadpool(_store_rows, db, rows)
+    else:
+        try:
+            batch = GPSDataBatchRequest.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors()], body=body
+            )
+        _check_batch_size(len(batch.points))
+        result, created = await run_in_threadpool(_store_batch, db, batch.points)
+
+    # Seuls les points nouvellement enregistrés : ni les renvois, ni les
+    # doublons à l'intérieur du lot
+    hub.publish(created)
+    return result
+
+def _check_batch_size(size: int):
+    if size > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Lot trop volumineux (maximum {MAX_BATCH_SIZE} points)"
+        )
+
+def _store_rows(db: Session, rows: List[dict]):
+    # Lot binaire : déjà décodé et typé, seuls les filtres d'ingestion s'appliquent
+    return _store_valid(db, rows, list(range(len(rows))), len(rows), [])
+
+def _store_batch(db: Session, points: list):
+    # Valider chaque point séparément : un point invalide ne bloque pas le lot
+    results = []
+    rows = []
+    indexes = []
+    for index, item in enumerate(points):
+        try:
+            point = GPSDataRequest.model_validate(item)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(loc) for loc in error["loc"])
+            detail = f"{field}: {error['msg']}" if field else error["msg"]
+            results.append(GPSDataBatchItemResult(index=index, status="rejected", detail=detail))
+            continue
+        rows.append(point.model_dump())
+        indexes.append(index)
+    return _store_valid(db, rows, indexes, len(points), results)
+
+def _store_valid(db: Session, rows: List[dict], indexes: List[int], total: int,
+                 results: List[GPSDataBatchItemResult]):
+    # Filtres d'ingestion (app/validation.py) sur tout le lot, puis une
+    # seule transaction ; `results` contient déjà les points invalides
+    reasons = validate_rows(db, rows)
+    kept = []
+    for index, row, reason in zip(indexes, rows, reasons):
+        if reason is None:
+            kept.append(row)
+            results.append(GPSDataBatchItemResult(index=index, status="accepted"))
+        else:
+            results.append(GPSDataBatchItemResult(index=index, status="rejected", detail=REJECTION_MESSAGES[reason]))
+    results.sort(key=lambda result: result.index)
+
+    upsert_devices(db, {row["device_id"] for row in kept})
+    inserted = insert_rows(db, kept)
+    # Rejets comptés par motif dans SyncLog.error_message
+    log_sync(
+        db, {row["device_id"] for row in rows},
+        status="success" if kept or not rows else "error",
+        error_message=rejection_message(total, reasons, invalid=total - len(rows)),
     )
-    db.add(sync_log)
-    
     db.commit()
-    db.refresh(db_gps_data)
-    
-    return db_gps_data
+
+    result = GPSDataBatchResponse(
+        accepted=len(kept),
+        rejected=total - len(kept),
+        duplicates=len(kept) - len(inserted),
+        results=results
+    )
+    return result, stream_points(inserted) if hub.active else []
 
 @router.get("/", response_model=List[GPSDataResponse])
 async def get_gps_data(
     device_id: str = None,
-    token: str = Depends(security),
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    rows, next_cursor = await run_in_threadpool(_list_points, db, device_id, before, after, limit)
+    headers = {"X-Next-Cursor": next_cursor.isoformat()} if next_cursor is not None else None
+    return ORJSONResponse(_point_rows(rows), headers=headers)
+
+# Les listes sont lues en tuples et sérialisées directement par orjson,
+# sans construire d'objets ORM ni de modèles GPSDataResponse par ligne
+GPS_DATA_COLUMNS = (
+    GPSData.id, GPSData.device_id, GPSData.lat, GPSData.lon,
+    GPSData.timestamp, GPSData.synced, GPSData.created_at,
+)
+GPS_DATA_FIELDS = tuple(column.key for column in GPS_DATA_COLUMNS)
+
+def _point_rows(rows) -> List[dict]:
+    return [dict(zip(GPS_DATA_FIELDS, row)) for row in rows]
+
+def _list_points(db: Session, device_id: Optional[str], before: Optional[datetime],
+                 after: Optional[datetime], limit: int):
+    query = db.query(*GPS_DATA_COLUMNS)
+    if device_id:
+        query = query.filter(GPSData.device_id == device_id)
+    if before is not None:
+        query = query.filter(GPSData.timestamp < before)
+    if after is not None:
+        query = query.filter(GPSData.timestamp > after)
+
+    # Pagination par curseur : chaque page est un parcours d'index
+    # (device_id, timestamp) ou (timestamp), sans OFFSET.
+    # Seul `after` => ordre chronologique, sinon du plus récent au plus ancien.
+    ascending = after is not None and before is None
+    if ascending:
+        order = (GPSData.timestamp.asc(), GPSData.id.asc())
+    else:
+        order = (GPSData.timestamp.desc(), GPSData.id.desc())
+    rows = query.order_by(*order).limit(limit).all()
+
+    if len(rows) < limit:
+        return rows, None
+
+    last = rows[-1].timestamp
+    if not device_id:
+        # Sans filtre d'appareil, plusieurs points peuvent partager le
+        # timestamp de fin de page : on les inclut tous pour que le
+        # curseur suivant (strict) n'en saute aucun
+        seen = {row.id for row in rows}
+        rows += [
+            row for row in query.filter(GPSData.timestamp == last).order_by(GPSData.id)
+            if row.id not in seen
+        ]
+    return rows, last
+
+@router.get("/within", response_model=List[GPSDataResponse])
+async def get_gps_data_within(
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_m: Optional[float] = Query(None, gt=0),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    device_id: str = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_email: str = Depends(get_current_user_email),
     db: Session = Depends(get_db)
 ):
-    verify_token(token.credentials)
-    
-    query = db.query(GPSData)
+    # Zone : rectangle (min_lat, min_lon, max_lat, max_lon) ou cercle (lat, lon, radius_m)
+    bbox = (min_lat, min_lon, max_lat, max_lon)
+    circle = (lat, lon, radius_m)
+    if all(v is not None for v in bbox) and all(v is None for v in circle):
+        if min_lat > max_lat:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_lat doit être inférieur à max_lat")
+        if min_lon <= max_lon:
+            boxes = [bbox]
+        else:
+            # Rectangle à cheval sur l'antiméridien
+            boxes = [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+        center = None
+    elif all(v is not None for v in circle) and all(v is None for v in bbox):
+        boxes = radius_boxes(lat, lon, radius_m)
+        center = circle
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Zone attendue : min_lat, min_lon, max_lat, max_lon ou lat, lon, radius_m"
+        )
+
+    rows, truncated = await run_in_threadpool(_points_within, db, boxes, center, start, end, device_id, limit)
+    headers = {"X-Truncated": "true"} if truncated else None
+    return ORJSONResponse(_point_rows(rows), headers=headers)
+
+def _points_within(db: Session, boxes, center, start: Optional[datetime], end: Optional[datetime],
+                   device_id: Optional[str], limit: int):
+    # 1. candidats via l'index (geohash, timestamp) : une plage par préfixe.
+    # UNION ALL plutôt qu'un OR : chaque branche est un parcours d'index
+    # couvrant, alors qu'avec un OR le planificateur préfère l'index timestamp
+    ranges = []
+    for prefix in cover(boxes, SPATIAL_MAX_CELLS):
+        candidates = select(GPSData.id).where(
+            GPSData.geohash >= prefix, GPSData.geohash < prefix_upper_bound(prefix)
+        )
+        if start is not None:
+            candidates = candidates.where(GPSData.timestamp >= start)
+        if end is not None:
+            candidates = candidates.where(GPSData.timestamp < end)
+        ranges.append(candidates)
+    candidate_ids = union_all(*ranges).subquery()
+
+    # 2. filtre exact sur le rectangle, puis sur le cercle en Python
+    query = db.query(*GPS_DATA_COLUMNS).filter(GPSData.id.in_(select(candidate_ids.c.id)))
+    query = query.filter(or_(*[
+        and_(GPSData.lat.between(box[0], box[2]), GPSData.lon.between(box[1], box[3]))
+        for box in boxes
+    ]))
     if device_id:
         query = query.filter(GPSData.device_id == device_id)
-    
-    return query.order_by(GPSData.timestamp.desc()).limit(100).all()
\ No newline at end of file
+    query = query.order_by(GPSData.timestamp, GPSData.id)
+
+    if center is None:
+        rows = query.limit(limit + 1).all()
+    else:
+        lat, lon, radius_m = center
+        rows = []
+        for row in query.yield_per(1000):
+            if haversine_m(lat, lon, row.lat, row.lon) <= radius_m:
+                rows.append(row)
+                if len(rows) > limit:
+                    break
+    return rows[:limit], len(rows) > limit
+
+@router.get("/track", response_model=TrackResponse, response_model_exclude_none=True)
+async def get_track(
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tolerance_m: float = Query(0, ge=0),
+    algorithm: str = Query("dp", pattern="^(dp|vw)$"),
+    encoding: str = Query("polyline", pattern="^(json|polyline)$"),
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    # Trace d'un appareil sur une fenêtre, simplifiée à tolerance_m mètres
+    # près (Douglas-Peucker ou Visvalingam), en JSON compact ou encodée
+    return await run_in_threadpool(_build_track, db, device_id, start, end, tolerance_m, algorithm, encoding)
+
+def _build_track(db: Session, device_id: str, start: Optional[datetime], end: Optional[datetime],
+                 tolerance_m: float, algorithm: str, encoding: str) -> TrackResponse:
+    query = db.query(GPSData.lat, GPSData.lon, GPSData.timestamp).filter(GPSData.device_id == device_id)
+    if start is not None:
+        query = query.filter(GPSData.timestamp >= start)
+    if end is not None:
+        query = query.filter(GPSData.timestamp < end)
+    rows = query.order_by(GPSData.timestamp).limit(MAX_TRACK_POINTS + 1).all()
+    if len(rows) > MAX_TRACK_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Trace trop longue (maximum {MAX_TRACK_POINTS} points), réduisez la fenêtre"
+        )
+
+    lat = np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+    lon = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    times = to_epoch_seconds([row[2] for row in rows])
+    if len(rows) > 2 and tolerance_m > 0:
+        kept = SIMPLIFIERS[algorithm](project(lat, lon), tolerance_m)
+        lat, lon, times = lat[kept], lon[kept], times[kept]
+
+    track = TrackResponse(device_id=device_id, raw_count=len(rows), count=len(lat), encoding=encoding)
+    if encoding == "polyline":
+        track.polyline = encode_polyline(lat, lon)
+        track.times = encode_deltas(np.floor(times).astype(np.int64))
+    else:
+        track.points = np.column_stack((lat, lon, times)).tolist()
+    return track
+
+@router.get("/stream")
+async def stream_gps_data(
+    device_id: Optional[List[str]] = Query(None),
+    user_email: str = Depends(get_current_user_email)
+):
+    # Server-Sent Events : un événement `data:` par point reçu, filtré par
+    # appareil si device_id est fourni (paramètre répétable)
+    async def events():
+        # Abonnement dans le générateur : le finally le libère toujours
+        subscription = hub.subscribe(device_id)
+        try:
+            yield ": connected\n\n"
+            while True:
+                messages = await subscription.get(STREAM_HEARTBEAT_S)
+                # Commentaire SSE périodique : garde la connexion ouverte
+                # à travers les proxys quand aucun point n'arrive
+                yield "".join(messages) if messages else ": ping\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/export")
+async def export_gps_data(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|geojson)$"),
+    device_id: str = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_email: str = Depends(get_current_user_email)
+):
+    # Mémoire constante : les lignes sont lues et sérialisées par paquets
+    body = EXPORTERS[format](iter_points(device_id, start, end))
+    filename = f"gps_{device_id or 'all'}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,113 @@
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.orm import Session
+from datetime import date, datetime
+from typing import List, Optional
+import orjson
+import os
+from ..analytics import ANALYTICS_INLINE_MAX_POINTS, refresh_device
+from ..concurrency import run_in_threadpool
+from ..database import get_db
+from ..models import DeviceDailySummary, DeviceLastPosition, Stop, Trip
+from ..schemas import DailySummaryResponse, DevicePositionResponse, StopResponse, TripResponse
+from ..auth import get_current_user_email
+from ..cache import TTLCache
+
+router = APIRouter()
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+# Vue flotte : la réponse déjà sérialisée est partagée par tous les tableaux
+# de bord pendant POSITIONS_SNAPSHOT_TTL secondes
+positions_cache = TTLCache(
+    "positions",
+    maxsize=1,
+    ttl=float(os.getenv("POSITIONS_SNAPSHOT_TTL", 2)),
+    shared=True,
+    # Corps JSON déjà sérialisé : stocké tel quel
+    dumps=bytes,
+    loads=bytes,
+)
+
+@router.get("/positions", response_model=List[DevicePositionResponse])
+async def get_device_positions(
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    body = await run_in_threadpool(_cached_positions, db)
+    return Response(content=body, media_type="application/json")
+
+def _cached_positions(db: Session) -> bytes:
+    # Dans le pool de threads : partagé, le cache fait un aller-retour réseau
+    body = positions_cache.get("all")
+    if body is None:
+        body = _positions_snapshot(db)
+        positions_cache.set("all", body)
+    return body
+
+def _positions_snapshot(db: Session) -> bytes:
+    # Une ligne par appareil : lecture en O(appareils), sans agrégat sur gps_data
+    rows = db.query(
+        DeviceLastPosition.device_id,
+        DeviceLastPosition.lat,
+        DeviceLastPosition.lon,
+        DeviceLastPosition.timestamp,
+    ).order_by(DeviceLastPosition.device_id)
+    return orjson.dumps([
+        {"device_id": device_id, "lat": lat, "lon": lon, "timestamp": timestamp}
+        for device_id, lat, lon, timestamp in rows
+    ])
+
+# Rapports : agrégats précalculés (app/analytics.py). Un appareil marqué est
+# d'abord recalculé, sur ses seuls derniers segments, pour un rapport à jour ;
+# un retard plus long est laissé à la tâche de fond
+@router.get("/{device_id}/daily", response_model=List[DailySummaryResponse])
+async def get_daily_summary(
+    device_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    return await run_in_threadpool(_daily_summary, db, device_id, start, end)
+
+def _daily_summary(db: Session, device_id: str, start: Optional[date], end: Optional[date]):
+    refresh_device(db, device_id, max_points=ANALYTICS_INLINE_MAX_POINTS)
+    query = db.query(DeviceDailySummary).filter(DeviceDailySummary.device_id == device_id)
+    if start is not None:
+        query = query.filter(DeviceDailySummary.day >= start)
+    if end is not None:
+        query = query.filter(DeviceDailySummary.day <= end)
+    return query.order_by(DeviceDailySummary.day).all()
+
+@router.get("/{device_id}/trips", response_model=List[TripResponse])
+async def get_trips(
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    return await run_in_threadpool(_segments, db, Trip, device_id, start, end, limit)
+
+@router.get("/{device_id}/stops", response_model=List[StopResponse])
+async def get_stops(
+    device_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    return await run_in_threadpool(_segments, db, Stop, device_id, start, end, limit)
+
+def _segments(db: Session, model, device_id: str, start: Optional[datetime], end: Optional[datetime], limit: int):
+    # Segments commençant dans [start, end), dans l'ordre chronologique
+    refresh_device(db, device_id, max_points=ANALYTICS_INLINE_MAX_POINTS)
+    query = db.query(model).filter(model.device_id == device_id)
+    if start is not None:
+        query = query.filter(model.start_time >= start)
+    if end is not None:
+        query = query.filter(model.start_time < end)
+    return query.order_by(model.start_time).limit(limit).all()
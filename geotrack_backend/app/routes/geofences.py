@@ -0,0 +1,139 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+import json
+import os
+from ..concurrency import run_in_threadpool
+from ..database import get_db
+from ..geofence import geofences, validate_polygon
+from ..models import Geofence, GeofenceEvent
+from ..schemas import GeofenceEventResponse, GeofenceRequest, GeofenceResponse
+from ..auth import get_current_user_email
+
+router = APIRouter()
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+def _check_polygon(fence: GeofenceRequest):
+    error = validate_polygon(fence.polygon)
+    if error is not None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=error)
+
+def _fence_response(fence: Geofence) -> GeofenceResponse:
+    return GeofenceResponse(
+        id=fence.id,
+        name=fence.name,
+        polygon=json.loads(fence.polygon),
+        created_at=fence.created_at,
+        updated_at=fence.updated_at
+    )
+
+def _get_fence(db: Session, geofence_id: int) -> Geofence:
+    fence = db.get(Geofence, geofence_id)
+    if fence is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Zone introuvable")
+    return fence
+
+@router.post("/", response_model=GeofenceResponse, status_code=status.HTTP_201_CREATED)
+async def create_geofence(
+    fence: GeofenceRequest,
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    _check_polygon(fence)
+    return await run_in_threadpool(_create_fence, db, fence)
+
+def _create_fence(db: Session, fence: GeofenceRequest) -> GeofenceResponse:
+    row = Geofence(name=fence.name, polygon=json.dumps(fence.polygon))
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    # Index du processus reconstruit au prochain point reçu
+    geofences.invalidate()
+    return _fence_response(row)
+
+@router.get("/", response_model=List[GeofenceResponse])
+async def list_geofences(
+    after_id: int = 0,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    return await run_in_threadpool(_list_fences, db, after_id, limit)
+
+def _list_fences(db: Session, after_id: int, limit: int) -> List[GeofenceResponse]:
+    # Pagination par id : after_id = dernier id de la page précédente
+    rows = db.query(Geofence).filter(Geofence.id > after_id).order_by(Geofence.id).limit(limit)
+    return [_fence_response(row) for row in rows]
+
+@router.get("/events", response_model=List[GeofenceEventResponse])
+async def list_geofence_events(
+    device_id: Optional[str] = None,
+    geofence_id: Optional[int] = None,
+    after: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    return await run_in_threadpool(_list_events, db, device_id, geofence_id, after, limit)
+
+def _list_events(db: Session, device_id: Optional[str], geofence_id: Optional[int],
+                 after: Optional[datetime], limit: int):
+    # Événements postérieurs à `after`, dans l'ordre chronologique
+    query = db.query(GeofenceEvent)
+    if device_id is not None:
+        query = query.filter(GeofenceEvent.device_id == device_id)
+    if geofence_id is not None:
+        query = query.filter(GeofenceEvent.geofence_id == geofence_id)
+    if after is not None:
+        query = query.filter(GeofenceEvent.timestamp > after)
+    return query.order_by(GeofenceEvent.timestamp, GeofenceEvent.id).limit(limit).all()
+
+@router.get("/{geofence_id}", response_model=GeofenceResponse)
+async def get_geofence(
+    geofence_id: int,
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    return await run_in_threadpool(_read_fence, db, geofence_id)
+
+def _read_fence(db: Session, geofence_id: int) -> GeofenceResponse:
+    return _fence_response(_get_fence(db, geofence_id))
+
+@router.put("/{geofence_id}", response_model=GeofenceResponse)
+async def update_geofence(
+    geofence_id: int,
+    fence: GeofenceRequest,
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    _check_polygon(fence)
+    return await run_in_threadpool(_update_fence, db, geofence_id, fence)
+
+def _update_fence(db: Session, geofence_id: int, fence: GeofenceRequest) -> GeofenceResponse:
+    row = _get_fence(db, geofence_id)
+    row.name = fence.name
+    row.polygon = json.dumps(fence.polygon)
+    row.version = Geofence.version + 1
+    db.commit()
+    db.refresh(row)
+    geofences.invalidate()
+    return _fence_response(row)
+
+@router.delete("/{geofence_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_geofence(
+    geofence_id: int,
+    user_email: str = Depends(get_current_user_email),
+    db: Session = Depends(get_db)
+):
+    await run_in_threadpool(_delete_fence, db, geofence_id)
+
+def _delete_fence(db: Session, geofence_id: int):
+    # L'historique des événements de la zone disparaît avec elle ; les
+    # appareils qui s'y trouvaient l'oublient au point suivant (voir geofence.evaluate)
+    db.delete(_get_fence(db, geofence_id))
+    db.query(GeofenceEvent).filter(GeofenceEvent.geofence_id == geofence_id).delete()
+    db.commit()
+    geofences.invalidate()
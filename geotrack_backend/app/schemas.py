@@ -1,9 +1,10 @@
 from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
 
 class LoginRequest(BaseModel):
-    pin: str  
+    pin: str
+    email: Optional[EmailStr] = None  # Optionnel : recherche directe du compte
     
 class RegisterRequest(BaseModel):
     email: EmailStr
@@ -32,6 +33,21 @@ class GPSDataRequest(BaseModel):
     lon: float
     timestamp: datetime
 
+class GPSDataBatchRequest(BaseModel):
+    # Les points sont validés un par un pour pouvoir rejeter individuellement
+    points: List[Any]
+
+class GPSDataBatchItemResult(BaseModel):
+    index: int
+    status: str  # accepted, rejected
+    detail: Optional[str] = None
+
+class GPSDataBatchResponse(BaseModel):
+    accepted: int    # Points valides, y compris les doublons déjà enregistrés
+    rejected: int
+    duplicates: int  # Points déjà reçus, ignorés à l'insertion
+    results: List[GPSDataBatchItemResult]
+
 class GPSDataResponse(BaseModel):
     id: int
     device_id: str
@@ -44,6 +60,18 @@ class GPSDataResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TrackResponse(BaseModel):
+    device_id: str
+    raw_count: int   # Points lus sur la fenêtre
+    count: int       # Points renvoyés après simplification
+    encoding: str    # json, polyline
+    # encoding=json : [lat, lon, secondes epoch] par point
+    points: Optional[List[List[float]]] = None
+    # encoding=polyline : coordonnées au format "encoded polyline" (précision 5)
+    # et secondes epoch codées de la même façon (écarts successifs)
+    polyline: Optional[str] = None
+    times: Optional[str] = None
+
 class DeviceResponse(BaseModel):
     id: int
     device_id: str
@@ -54,6 +82,51 @@ class DeviceResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DevicePositionResponse(BaseModel):
+    device_id: str
+    lat: float
+    lon: float
+    timestamp: datetime
+
+class DailySummaryResponse(BaseModel):
+    device_id: str
+    day: date           # Jour UTC ; trajets et arrêts comptés le jour de leur début
+    distance_m: float   # Part de chaque trajet sur ce jour (au prorata de sa durée)
+    moving_s: float
+    stopped_s: float    # Au plus 86400 : un arrêt qui passe minuit est réparti
+    trip_count: int
+    stop_count: int
+
+    class Config:
+        from_attributes = True
+
+class TripResponse(BaseModel):
+    device_id: str
+    start_time: datetime
+    end_time: datetime
+    start_lat: float
+    start_lon: float
+    end_lat: float
+    end_lon: float
+    distance_m: float
+    moving_s: float
+    max_speed_mps: float
+    point_count: int
+
+    class Config:
+        from_attributes = True
+
+class StopResponse(BaseModel):
+    device_id: str
+    start_time: datetime
+    end_time: datetime
+    lat: float           # Position moyenne pendant l'arrêt
+    lon: float
+    point_count: int
+
+    class Config:
+        from_attributes = True
+
 class SyncLogResponse(BaseModel):
     id: int
     device_id: str
@@ -67,4 +140,28 @@ class SyncLogResponse(BaseModel):
 class ConfigUpdateRequest(BaseModel):
     x_parameter: Optional[int] = None
     y_parameter: Optional[int] = None
-    device_id: Optional[str] = None
\ No newline at end of file
+    device_id: Optional[str] = None
+
+class GeofenceRequest(BaseModel):
+    name: str
+    # Sommets [lat, lon] dans l'ordre du contour, fermé automatiquement
+    polygon: List[Tuple[float, float]]
+
+class GeofenceResponse(BaseModel):
+    id: int
+    name: str
+    polygon: List[Tuple[float, float]]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+class GeofenceEventResponse(BaseModel):
+    id: int
+    geofence_id: int
+    device_id: str
+    event: str  # enter, exit
+    timestamp: datetime
+    lat: float
+    lon: float
+
+    class Config:
+        from_attributes = True
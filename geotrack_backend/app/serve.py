@@ -0,0 +1,58 @@
+"""Point d'entrée de production : schéma, puis N workers uvicorn.
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8000]
+
+Le schéma est créé une seule fois (app/migrate.py) avant le lancement des
+workers, qui construisent chacun l'application (app.main:create_app).
+WEB_CONCURRENCY workers par défaut, un par cœur.
+
+Avec plus d'un worker, SHARED_STATE_URL doit pointer vers un serveur
+compatible Redis (app/shared.py) : caches, flux temps réel et tâches de fond
+sont alors communs à tous les workers.
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+from . import config  # noqa: F401  (.env chargé avant les autres modules)
+from .migrate import create_schema
+from .shared import shared_state
+
+logger = logging.getLogger(__name__)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+    tables = create_schema()
+    logger.info("Schéma à jour (%d tables)", len(tables))
+
+    if args.workers > 1 and not shared_state.remote:
+        logger.warning(
+            "%d workers sans SHARED_STATE_URL partagé : caches et flux temps réel propres à chaque worker",
+            args.workers,
+        )
+    uvicorn.run(
+        "app.main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        proxy_headers=True,
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""État partagé entre les workers : caches, pub/sub, compteurs et baux.
+
+SHARED_STATE_URL choisit le backend :
+    memory://            (défaut) mémoire du processus, pour un seul worker
+    redis://host:6379/0  serveur compatible Redis (Redis, Valkey, KeyDB,
+                         Dragonfly...) commun à tous les workers ; dépendance
+                         optionnelle : pip install redis==5.0.1
+
+Avec plusieurs workers (python -m app.serve) et le backend mémoire, chaque
+worker garde ses propres caches et le flux temps réel ne voit que les
+points reçus par son worker.
+
+Messages et valeurs de cache sont sérialisés en JSON (orjson) : rien de ce
+que renvoie le serveur n'est exécuté à la lecture.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from .metrics import counter
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "memory://")
+# Préfixe de toutes les clés et canaux : plusieurs déploiements sur un même serveur
+SHARED_STATE_PREFIX = os.getenv("SHARED_STATE_PREFIX", "geotrack:")
+# Messages pub/sub en attente d'envoi ; au-delà, les plus récents sont abandonnés
+SHARED_OUTBOX_SIZE = int(os.getenv("SHARED_OUTBOX_SIZE", 10000))
+
+outbox_dropped = counter("shared_messages_dropped_total", "Messages pub/sub abandonnés (file d'envoi pleine)")
+
+Handler = Callable[[Any], None]
+
+
+class MemoryBackend:
+    # Tout reste dans le processus ; publish() appelle les abonnés directement
+    remote = False
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, float]] = {}
+        self._leases: Dict[str, float] = {}
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        # Compteur ; `ttl` posé à la création (fenêtre fixe, ex. limite de débit)
+        now = time.monotonic()
+        with self._lock:
+            value, expires_at = self._counters.get(key, (0, 0.0))
+            if expires_at <= now:
+                value, expires_at = 0, now + ttl if ttl is not None else math.inf
+            value += amount
+            self._counters[key] = (value, expires_at)
+            return value
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        # Bail exclusif de `ttl` secondes ; False s'il est déjà détenu
+        now = time.monotonic()
+        with self._lock:
+            if self._leases.get(key, 0) > now:
+                return False
+            self._leases[key] = now + ttl
+            return True
+
+    def release(self, key: str):
+        with self._lock:
+            self._leases.pop(key, None)
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, message: Any):
+        for handler in self._handlers.get(channel, ()):
+            handler(message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisBackend:
+    # Client synchrone pour les caches, compteurs et baux, à n'appeler que
+    # depuis le pool de threads (run_in_threadpool) ; client asyncio pour le pub/sub, dans la boucle :
+    # publish() ne bloque pas, une tâche envoie les messages dans l'ordre
+    remote = True
+
+    def __init__(self, url: str, prefix: str = SHARED_STATE_PREFIX):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(f"SHARED_STATE_URL={url} : le paquet redis n'est pas installé") from e
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._async = None
+        self._pubsub = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return self._client.mget([self._key(key) for key in keys])
+
+    def set_many(self, items: Dict[str, bytes], ttl: float):
+        if not items:
+            return
+        with self._client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self._key(key), value, px=max(1, int(ttl * 1000)))
+            pipe.execute()
+
+    def delete(self, *keys: str):
+        if keys:
+            self._client.delete(*(self._key(key) for key in keys))
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self._client.scan_iter(match=self._key(prefix) + "*", count=1000))
+        if keys:
+            self._client.delete(*keys)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = self._client.incrby(self._key(key), amount)
+        if ttl is not None and value == amount:
+            self._client.pexpire(self._key(key), max(1, int(ttl * 1000)))
+        return value
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        return bool(self._client.set(self._key(key), os.getpid(), nx=True, px=max(1, int(ttl * 1000))))
+
+    def release(self, key: str):
+        self._client.delete(self._key(key))
+
+    def subscribe(self, channel: str, handler: Handler):
+        # À appeler avant start() (abonnements des modules, à l'import)
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, message: Any):
+        data = orjson.dumps(message)
+        if self._outbox is None:
+            # Hors application (scripts, tests) : envoi direct
+            self._client.publish(self._key(channel), data)
+            return
+        try:
+            self._outbox.put_nowait((channel, data))
+        except asyncio.QueueFull:
+            outbox_dropped.inc()
+
+    async def start(self):
+        import redis.asyncio
+        self._async = redis.asyncio.Redis.from_url(self.url)
+        self._outbox = asyncio.Queue(maxsize=SHARED_OUTBOX_SIZE)
+        self._tasks = [asyncio.create_task(self._send())]
+        if self._handlers:
+            self._pubsub = self._async.pubsub()
+            await self._pubsub.subscribe(*(self._key(channel) for channel in self._handlers))
+            self._tasks.append(asyncio.create_task(self._listen()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        outbox, self._outbox = self._outbox, None
+        if outbox is not None:
+            # Messages publiés juste avant l'arrêt
+            while not outbox.empty():
+                channel, data = outbox.get_nowait()
+                await self._async.publish(self._key(channel), data)
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+
+    async def _send(self):
+        while True:
+            channel, data = await self._outbox.get()
+            try:
+                await self._async.publish(self._key(channel), data)
+            except Exception:
+                logger.exception("Échec de la publication sur %s", channel)
+
+    async def _listen(self):
+        # Le client se reconnecte et se réabonne de lui-même après une coupure
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    channel = message["channel"].decode()[len(self.prefix):]
+                    payload = orjson.loads(message["data"])
+                    for handler in self._handlers.get(channel, ()):
+                        handler(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Abonnement pub/sub interrompu, nouvelle tentative")
+                await asyncio.sleep(1)
+
+
+def create_backend(url: str = SHARED_STATE_URL):
+    scheme = url.split("://", 1)[0].lower()
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisBackend(url)
+    raise ValueError(f"SHARED_STATE_URL : backend inconnu {url!r}")
+
+
+shared_state = create_backend()
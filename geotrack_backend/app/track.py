@@ -0,0 +1,148 @@
+import heapq
+from datetime import datetime
+from typing import List
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_M
+
+
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch_seconds(timestamps: List[datetime]) -> np.ndarray:
+    # Horodatage sans fuseau (SQLite) considéré comme UTC ; la soustraction
+    # évite de recréer chaque datetime avec tzinfo (plusieurs fois plus lent)
+    return np.array([
+        ts.timestamp() if ts.tzinfo is not None else (ts - _NAIVE_EPOCH).total_seconds()
+        for ts in timestamps
+    ], dtype=np.float64)
+
+
+def project(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # Projection équirectangulaire locale en mètres, suffisante à l'échelle
+    # d'une trace ; np.unwrap rend continue une trace qui traverse l'antiméridien
+    lat0 = np.radians(lat.mean())
+    x = np.unwrap(np.radians(lon)) * EARTH_RADIUS_M * np.cos(lat0)
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return np.column_stack((x, y))
+
+
+def _segment_distances(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Distance de chaque point au segment [a, b] (une ligne de a et b par point)
+    ab = b - a
+    length2 = np.einsum("ij,ij->i", ab, ab)
+    t = np.einsum("ij,ij->i", points - a, ab) / np.where(length2 > 0, length2, 1.0)
+    closest = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+    return np.hypot(*(points - closest).T)
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # Indices des points conservés. Tous les segments d'un même niveau de
+    # récursion sont traités ensemble : un seul calcul de distances par niveau
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    starts, ends = np.array([0]), np.array([n - 1])
+    while len(starts):
+        interior = ends - starts - 1
+        starts, ends, interior = starts[interior > 0], ends[interior > 0], interior[interior > 0]
+        if not len(starts):
+            break
+        segment = np.repeat(np.arange(len(starts)), interior)
+        offsets = np.cumsum(interior) - interior
+        index = np.repeat(starts + 1 - offsets, interior) + np.arange(interior.sum())
+        distances = _segment_distances(points[index], points[starts][segment], points[ends][segment])
+
+        # Point le plus éloigné de chaque segment
+        farthest = np.maximum.reduceat(distances, offsets)
+        candidates = np.flatnonzero(distances == farthest[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        split = index[candidates[first]]
+
+        far = farthest > tolerance
+        split = split[far]
+        keep[split] = True
+        starts, ends = np.concatenate((starts[far], split)), np.concatenate((split, ends[far]))
+    return np.flatnonzero(keep)
+
+
+def _triangle_areas(points: np.ndarray) -> np.ndarray:
+    a, b, c = points[:-2], points[1:-1], points[2:]
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def visvalingam(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # Retire tour à tour le point dont le triangle avec ses voisins est le
+    # plus petit, tant que cette aire est sous tolerance² (m²)
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+    threshold = tolerance ** 2
+    areas = np.full(n, np.inf)
+    areas[1:-1] = _triangle_areas(points)
+    previous = np.arange(-1, n - 1)
+    following = np.arange(1, n + 1)
+    removed = np.zeros(n, dtype=bool)
+    heap = [(area, index) for index, area in enumerate(areas[1:-1].tolist(), start=1)]
+    heapq.heapify(heap)
+
+    def area(index):
+        a, b, c = points[previous[index]], points[index], points[following[index]]
+        return 0.5 * abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1]))
+
+    while heap:
+        current, index = heapq.heappop(heap)
+        if removed[index] or current != areas[index]:
+            continue  # entrée périmée
+        if current >= threshold:
+            break
+        removed[index] = True
+        before, after = previous[index], following[index]
+        following[before] = after
+        previous[after] = before
+        for neighbour in (before, after):
+            if 0 < neighbour < n - 1:
+                # L'aire d'un voisin ne descend pas sous celle du point retiré
+                areas[neighbour] = max(area(neighbour), current)
+                heapq.heappush(heap, (areas[neighbour], neighbour))
+    return np.flatnonzero(~removed)
+
+
+SIMPLIFIERS = {
+    "dp": douglas_peucker,
+    "vw": visvalingam,
+}
+
+
+def _encode_signed(deltas: np.ndarray) -> str:
+    # Format des "encoded polylines" de Google : zigzag puis groupes de
+    # 5 bits, bit 0x20 si un groupe suit, décalés de 63 (ASCII imprimable)
+    if len(deltas) == 0:
+        return ""
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    remaining = zigzag[:, None] >> np.arange(0, 35, 5, dtype=np.int64)  # (n, 7)
+    used = remaining > 0
+    used[:, 0] = True
+    more = np.zeros_like(used)
+    more[:, :-1] = used[:, 1:]
+    chars = (remaining & 0x1F) + np.where(more, 0x20, 0) + 63
+    return chars[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def encode_deltas(values: np.ndarray) -> str:
+    # Suite d'entiers codée en écarts successifs (la première valeur telle quelle)
+    return _encode_signed(np.diff(values.astype(np.int64), prepend=0))
+
+
+def encode_polyline(lat: np.ndarray, lon: np.ndarray, precision: int = 5) -> str:
+    # Couples (lat, lon) entrelacés, chacun en écart au point précédent
+    factor = 10 ** precision
+    coords = np.empty(2 * len(lat), dtype=np.int64)
+    coords[0::2] = np.round(lat * factor)
+    coords[1::2] = np.round(lon * factor)
+    deltas = coords.copy()
+    deltas[2:] -= coords[:-2]
+    return _encode_signed(deltas)
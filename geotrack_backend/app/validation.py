@@ -0,0 +1,293 @@
+"""Validation et filtrage des points GPS à l'ingestion.
+
+Chaque lot passe par les étapes de INGEST_FILTERS, dans l'ordre :
+    range   coordonnées hors limites, non finies ou (0, 0)
+    time    horodatage au-delà de INGEST_MAX_FUTURE_S dans le futur, ou
+            antérieur à INGEST_MIN_TIMESTAMP
+    speed   saut impossible (plus de INGEST_MAX_SPEED_MPS) depuis le point
+            précédent de l'appareil, dans le lot ou en cache
+    kalman  lissage de la position (non activé par défaut)
+
+Les étapes travaillent en colonnes NumPy sur tout le lot, trié par
+appareil puis par date. Le dernier point accepté de chaque appareil est
+gardé en cache (relu dans device_last_position en cas d'absence) pour
+contrôler le premier point du lot suivant, une fois le lot enregistré
+(commit de la session).
+"""
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .geo import haversine_array
+from .metrics import counter
+from .models import DeviceLastPosition
+from .track import to_epoch_seconds
+
+INGEST_FILTERS = [name.strip() for name in os.getenv("INGEST_FILTERS", "range,time,speed").split(",") if name.strip()]
+INGEST_MAX_FUTURE_S = float(os.getenv("INGEST_MAX_FUTURE_S", 300))
+INGEST_MIN_TIMESTAMP = os.getenv("INGEST_MIN_TIMESTAMP", "2000-01-01T00:00:00+00:00")
+# 0 = pas de contrôle de vitesse
+INGEST_MAX_SPEED_MPS = float(os.getenv("INGEST_MAX_SPEED_MPS", 100))
+# Au-delà de cet écart entre deux points, la vitesse n'est pas contrôlée :
+# un point de référence erroné ne bloque pas l'appareil plus longtemps
+INGEST_SPEED_WINDOW_S = float(os.getenv("INGEST_SPEED_WINDOW_S", 900))
+# Kalman : écart type de la mesure (m) et bruit de déplacement (m²/s)
+INGEST_KALMAN_NOISE_M = float(os.getenv("INGEST_KALMAN_NOISE_M", 10))
+INGEST_KALMAN_PROCESS_NOISE = float(os.getenv("INGEST_KALMAN_PROCESS_NOISE", 10))
+
+REJECTION_MESSAGES = {
+    "invalid": "format invalide",
+    "range": "coordonnées hors limites",
+    "null_island": "position (0, 0)",
+    "future": "horodatage dans le futur",
+    "too_old": "horodatage trop ancien",
+    "speed": "déplacement impossible depuis le point précédent",
+}
+
+points_rejected = counter("gps_points_rejected_total", "Points GPS rejetés à l'ingestion, par motif", ("reason",))
+
+# Dernier point accepté par appareil : (secondes epoch, lat, lon, variance
+# Kalman). Partagé entre les workers : les lots successifs d'un appareil
+# peuvent arriver sur des workers différents. Variance inconnue (NaN) relue
+# None depuis le backend partagé : np.array(..., dtype=float64) la rend NaN
+last_points = TTLCache(
+    "last_point",
+    maxsize=int(os.getenv("INGEST_LAST_POINT_CACHE_SIZE", 100000)),
+    ttl=float(os.getenv("INGEST_LAST_POINT_TTL", 300)),
+    shared=True,
+)
+# Derniers points d'un lot validé, en attente du commit (Session.info)
+PENDING_LAST_POINTS = "pending_last_points"
+
+
+class PointBatch:
+    # Lot en colonnes, trié par appareil puis par date ; reasons[i] = motif
+    # de rejet du i-ème point trié (None : accepté)
+    def __init__(self, db: Session, rows: List[dict]):
+        self.db = db
+        seconds = to_epoch_seconds([row["timestamp"] for row in rows])
+        device_ids, codes = np.unique([row["device_id"] for row in rows], return_inverse=True)
+        self.order = np.lexsort((seconds, codes))
+        self.t = seconds[self.order]
+        self.lat = np.array([row["lat"] for row in rows], dtype=np.float64)[self.order]
+        self.lon = np.array([row["lon"] for row in rows], dtype=np.float64)[self.order]
+        self.device_ids = device_ids.tolist()
+        self.device_index = codes[self.order]
+        self.kept = np.ones(len(rows), dtype=bool)
+        self.reasons = np.full(len(rows), None, dtype=object)
+        self.variance = np.full(len(self.device_ids), np.nan)
+        self.smoothed = False
+        self._references = None
+
+    def reject(self, mask: np.ndarray, reason: str):
+        mask = mask & self.kept
+        count = int(np.count_nonzero(mask))
+        if count:
+            self.reasons[mask] = reason
+            self.kept &= ~mask
+            points_rejected.labels(reason).inc(count)
+
+    def references(self):
+        # Dernier point connu de chaque appareil, en colonnes (NaN : inconnu)
+        if self._references is None:
+            known = load_last_points(self.db, self.device_ids)
+            self._references = tuple(
+                np.array([known.get(device_id, (np.nan,) * 4)[k] for device_id in self.device_ids], dtype=np.float64)
+                for k in range(4)
+            )
+        return self._references
+
+
+def load_last_points(db: Session, device_ids: List[str]) -> Dict[str, tuple]:
+    known = last_points.get_many(device_ids)
+    missing = [device_id for device_id in device_ids if device_id not in known]
+    if missing:
+        rows = db.query(
+            DeviceLastPosition.device_id, DeviceLastPosition.timestamp,
+            DeviceLastPosition.lat, DeviceLastPosition.lon,
+        ).filter(DeviceLastPosition.device_id.in_(missing)).all()
+        seconds = to_epoch_seconds([row.timestamp for row in rows])
+        for row, t in zip(rows, seconds.tolist()):
+            known[row.device_id] = (t, row.lat, row.lon, np.nan)
+    return known
+
+
+def check_range(batch: PointBatch):
+    lat, lon = batch.lat, batch.lon
+    finite = np.isfinite(lat) & np.isfinite(lon)
+    batch.reject(~finite | (np.abs(lat) > 90) | (np.abs(lon) > 180), "range")
+    # Position par défaut de récepteurs sans fix
+    batch.reject((lat == 0) & (lon == 0), "null_island")
+
+
+def check_time(batch: PointBatch):
+    now = datetime.now(timezone.utc).timestamp()
+    batch.reject(batch.t > now + INGEST_MAX_FUTURE_S, "future")
+    oldest = datetime.fromisoformat(INGEST_MIN_TIMESTAMP)
+    batch.reject(batch.t < to_epoch_seconds([oldest])[0], "too_old")
+
+
+def _too_fast(prev_t, prev_lat, prev_lon, t, lat, lon) -> np.ndarray:
+    dt = t - prev_t
+    checked = (dt > 0) & (dt <= INGEST_SPEED_WINDOW_S)
+    with np.errstate(invalid="ignore"):
+        distance = haversine_array(prev_lat, prev_lon, lat, lon)
+        return checked & (distance / np.where(checked, dt, 1.0) > INGEST_MAX_SPEED_MPS)
+
+
+def check_speed(batch: PointBatch):
+    # Un point est rejeté s'il est trop loin de son prédécesseur et aussi de
+    # son successeur (ou s'il est le dernier) : un pic isolé est écarté, mais
+    # un point de référence erroné ne fait pas rejeter tout le lot. Passes
+    # successives : le rejet d'un point change les voisins des autres
+    if INGEST_MAX_SPEED_MPS <= 0:
+        return
+    ref_t, ref_lat, ref_lon, _ = batch.references()
+    while True:
+        idx = np.flatnonzero(batch.kept)
+        if not len(idx):
+            return
+        code = batch.device_index[idx]
+        t, lat, lon = batch.t[idx], batch.lat[idx], batch.lon[idx]
+        has_prev = np.r_[False, code[1:] == code[:-1]]
+        has_next = np.r_[has_prev[1:], False]
+        # Point précédent : dans le lot, sinon le dernier point connu de l'appareil
+        prev_t = np.where(has_prev, np.r_[np.nan, t[:-1]], ref_t[code])
+        prev_lat = np.where(has_prev, np.r_[np.nan, lat[:-1]], ref_lat[code])
+        prev_lon = np.where(has_prev, np.r_[np.nan, lon[:-1]], ref_lon[code])
+
+        too_fast = _too_fast(prev_t, prev_lat, prev_lon, t, lat, lon)
+        reject = too_fast & (~has_next | np.r_[too_fast[1:], False])
+        # Deux rejets consécutifs : le second est réexaminé à la passe suivante
+        reject &= ~(np.r_[False, reject[:-1]] & has_prev)
+        if not reject.any():
+            return
+        mask = np.zeros(len(batch.kept), dtype=bool)
+        mask[idx[reject]] = True
+        batch.reject(mask, "speed")
+
+
+def smooth_kalman(batch: PointBatch):
+    # Filtre de Kalman à marche aléatoire, même variance (m²) en latitude et
+    # en longitude. Récurrence point après point : chaque itération traite le
+    # k-ième point de tous les appareils à la fois
+    idx = np.flatnonzero(batch.kept)
+    if not len(idx):
+        return
+    code = batch.device_index[idx]
+    starts = np.flatnonzero(np.r_[True, code[1:] != code[:-1]])
+    rank = np.arange(len(idx)) - np.repeat(starts, np.diff(np.r_[starts, len(idx)]))
+
+    state_t, state_lat, state_lon, state_var = (column.copy() for column in batch.references())
+    measurement_var = INGEST_KALMAN_NOISE_M ** 2
+    state_var[np.isnan(state_var)] = measurement_var
+    for k in range(int(rank.max()) + 1):
+        points = idx[rank == k]
+        devices = batch.device_index[points]
+        t = batch.t[points]
+        # Premier point connu de l'appareil : l'état part de la mesure ; point
+        # en retard sur l'état : gardé tel quel
+        start = np.isnan(state_t[devices])
+        late = ~start & (t <= state_t[devices])
+        predicted = state_var[devices] + INGEST_KALMAN_PROCESS_NOISE * np.where(start | late, 0.0, t - state_t[devices])
+        gain = np.where(start, 1.0, np.where(late, 0.0, predicted / (predicted + measurement_var)))
+        lat = state_lat[devices] + gain * (batch.lat[points] - state_lat[devices])
+        lon = state_lon[devices] + gain * (batch.lon[points] - state_lon[devices])
+        batch.lat[points] = np.where(start | late, batch.lat[points], lat)
+        batch.lon[points] = np.where(start | late, batch.lon[points], lon)
+
+        update = ~late
+        state_t[devices[update]] = t[update]
+        state_lat[devices[update]] = batch.lat[points[update]]
+        state_lon[devices[update]] = batch.lon[points[update]]
+        state_var[devices[update]] = np.where(start, measurement_var, (1 - gain) * predicted)[update]
+    batch.variance = state_var
+    batch.smoothed = True
+
+
+FILTERS: Dict[str, Callable[[PointBatch], None]] = {
+    "range": check_range,
+    "time": check_time,
+    "speed": check_speed,
+    "kalman": smooth_kalman,
+}
+
+
+def validate_rows(db: Session, rows: List[dict], filters: Optional[List[str]] = None) -> List[Optional[str]]:
+    # Motif de rejet de chaque point (None : accepté), dans l'ordre des
+    # lignes ; les lignes acceptées peuvent être modifiées (lissage)
+    if not rows:
+        return []
+    batch = PointBatch(db, rows)
+    for name in INGEST_FILTERS if filters is None else filters:
+        FILTERS[name](batch)
+        if not batch.kept.any():
+            break
+
+    kept = np.flatnonzero(batch.kept)
+    if batch.smoothed:
+        for position in kept.tolist():
+            row = rows[batch.order[position]]
+            row["lat"] = float(batch.lat[position])
+            row["lon"] = float(batch.lon[position])
+    _pending_last_points(batch, kept)
+
+    reasons: List[Optional[str]] = [None] * len(rows)
+    for position in np.flatnonzero(~batch.kept).tolist():
+        reasons[batch.order[position]] = batch.reasons[position]
+    return reasons
+
+
+def _pending_last_points(batch: PointBatch, kept: np.ndarray):
+    # Dernier point accepté de chaque appareil, s'il est plus récent que celui du cache
+    # (le cache ne sert qu'aux étapes qui ont lu les points de référence).
+    # Gardé sur la session jusqu'au commit : un lot annulé ne doit pas
+    # servir de référence au contrôle de vitesse
+    if not len(kept) or batch._references is None:
+        return
+    code = batch.device_index[kept]
+    last = kept[np.r_[code[1:] != code[:-1], True]]
+    ref_t = batch.references()[0]
+    latest = {}
+    for position in last.tolist():
+        device = batch.device_index[position]
+        if batch.t[position] <= ref_t[device]:
+            continue
+        latest[batch.device_ids[device]] = (
+            float(batch.t[position]), float(batch.lat[position]), float(batch.lon[position]),
+            float(batch.variance[device]),
+        )
+    if latest:
+        batch.db.info.setdefault(PENDING_LAST_POINTS, {}).update(latest)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_last_points(session: Session):
+    latest = session.info.pop(PENDING_LAST_POINTS, None)
+    if latest:
+        last_points.set_many(latest)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_last_points(session: Session, transaction):
+    # Transaction annulée ou session fermée sans commit
+    if transaction.parent is None:
+        session.info.pop(PENDING_LAST_POINTS, None)
+
+
+def rejection_message(total: int, reasons: Iterable[Optional[str]], invalid: int = 0) -> Optional[str]:
+    # Résumé pour SyncLog.error_message, None si aucun point n'a été rejeté
+    counts = Counter(reason for reason in reasons if reason is not None)
+    if invalid:
+        counts["invalid"] += invalid
+    rejected = sum(counts.values())
+    if not rejected:
+        return None
+    details = ", ".join(f"{REJECTION_MESSAGES[reason]} : {count}" for reason, count in counts.most_common())
+    return f"{rejected} point(s) rejeté(s) sur {total} ({details})"
@@ -0,0 +1,99 @@
+"""Coût du calcul des trajets et arrêts : complet, incrémental, lecture du rapport.
+
+Usage : python -m benchmarks.bench_analytics [259200]
+
+Un appareil à 1 Hz (alternance de trajets et d'arrêts) : recalcul complet
+de tout l'historique, puis recalcul incrémental après l'arrivée d'une
+minute de points, et lecture des agrégats journaliers comparée à
+l'ancienne façon de faire (relire tous les points de la journée).
+"""
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.analytics import rebuild_daily, rebuild_segments, refresh_device  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.ingest import insert_rows  # noqa: E402
+from app.models import DeviceDailySummary, GPSData, Stop, Trip  # noqa: E402
+
+DEVICE = "bench-analytics"
+START = datetime(2024, 3, 1)
+
+
+def trace(n_points, start_index=0, seed=0):
+    # Trajets de 5 à 40 minutes à ~10 m/s, arrêts de 2 à 60 minutes ; bruit
+    # de ~10 cm, sous le seuil de vitesse STOP_SPEED_MPS à 1 Hz
+    rng = random.Random(seed)
+    lat, lon, heading = 48.85, 2.35, 0.0
+    remaining, moving = 0, False
+    rows = []
+    for i in range(start_index, start_index + n_points):
+        if remaining == 0:
+            moving = not moving
+            remaining = rng.randint(300, 2400) if moving else rng.randint(120, 3600)
+            heading = rng.uniform(0, 360)
+        remaining -= 1
+        if moving:
+            lat += 10 * math.cos(math.radians(heading)) / 111_000
+            lon += 10 * math.sin(math.radians(heading)) / (111_000 * math.cos(math.radians(lat)))
+        rows.append({
+            "device_id": DEVICE,
+            "lat": lat + rng.gauss(0, 1e-6),
+            "lon": lon + rng.gauss(0, 1e-6),
+            "timestamp": START + timedelta(seconds=i),
+            "synced": True,
+        })
+    return rows
+
+
+def main(n_points):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    for offset in range(0, n_points, 100_000):
+        db.execute(insert(GPSData.__table__), trace(min(100_000, n_points - offset), offset, seed=offset))
+    db.commit()
+
+    start = time.perf_counter()
+    processed = rebuild_segments(db, DEVICE, None)
+    rebuild_daily(db, DEVICE, None)
+    db.commit()
+    full_s = time.perf_counter() - start
+    trips = db.query(Trip).filter(Trip.device_id == DEVICE).count()
+    stops = db.query(Stop).filter(Stop.device_id == DEVICE).count()
+    print(f"{processed} points -> {trips} trajets, {stops} arrêts | recalcul complet {full_s:6.2f} s")
+
+    incremental = []
+    for minute in range(10):
+        insert_rows(db, trace(60, n_points + minute * 60, seed=minute))
+        db.commit()
+        start = time.perf_counter()
+        refresh_device(db, DEVICE)
+        incremental.append(time.perf_counter() - start)
+    print(f"  + 60 points : recalcul incrémental p50 {statistics.median(incremental) * 1000:7.1f} ms")
+
+    day = START.date() + timedelta(days=1)
+    start = time.perf_counter()
+    db.query(DeviceDailySummary).filter(DeviceDailySummary.device_id == DEVICE, DeviceDailySummary.day == day).all()
+    report_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    day_start = datetime.combine(day, datetime.min.time())
+    rows = db.query(GPSData.timestamp, GPSData.lat, GPSData.lon).filter(
+        GPSData.device_id == DEVICE, GPSData.timestamp >= day_start, GPSData.timestamp < day_start + timedelta(days=1),
+    ).order_by(GPSData.timestamp).all()
+    scan_ms = (time.perf_counter() - start) * 1000
+    print(f"  rapport du {day} : agrégat {report_ms:6.2f} ms | relecture de {len(rows)} points {scan_ms:7.1f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 259_200)
@@ -0,0 +1,55 @@
+"""Surcoût d'authentification par requête, avant et après mise en cache.
+
+Usage : python -m benchmarks.bench_auth
+
+Mesure jwt.decode seul (ancien verify_token), verify_token avec le cache
+de jetons, et la résolution email -> id utilisateur (requête User contre
+cache) utilisée par get_current_user.
+"""
+import os
+import tempfile
+import timeit
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from jose import jwt  # noqa: E402
+
+from app.auth import ALGORITHM, SECRET_KEY, create_access_token, user_id_cache, verify_token  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import User  # noqa: E402
+
+N = 20000
+
+
+def per_call_us(fn, number=N):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(email="bench@example.com", hashed_pin="x"))
+    db.commit()
+
+    token = create_access_token({"sub": "bench@example.com"})
+    verify_token(token)
+    user_id_cache.set("bench@example.com", 1)
+
+    decode = per_call_us(lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]))
+    cached = per_call_us(lambda: verify_token(token))
+    lookup = per_call_us(
+        lambda: db.query(User.id).filter(User.email == "bench@example.com").scalar(), number=2000
+    )
+    cached_lookup = per_call_us(lambda: user_id_cache.get("bench@example.com"))
+    db.close()
+
+    print(f"jwt.decode (sans cache)     {decode:8.2f} µs")
+    print(f"verify_token (cache)        {cached:8.2f} µs")
+    print(f"requête User par email      {lookup:8.2f} µs")
+    print(f"id utilisateur (cache)      {cached_lookup:8.2f} µs")
+    print(f"total par requête : {decode + lookup:.1f} µs -> {cached + cached_lookup:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
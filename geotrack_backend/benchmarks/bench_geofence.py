@@ -0,0 +1,113 @@
+"""Coût de l'évaluation des zones (geofences) à l'ingestion.
+
+Usage : python -m benchmarks.bench_geofence [20000]
+
+N zones polygonales (8 à 24 sommets, 50 à 500 m de rayon) réparties sur
+un carré d'un degré. Mesure la construction de l'index, le débit de
+GeofenceIndex.locate (lot de 1000 points et point seul) comparé au même
+test sans grille (rectangles englobants de toutes les zones), puis la
+latence d'un lot de 100 points passé par insert_rows sans zone et avec
+les N zones.
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+import numpy as np  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.geofence import GeofenceIndex, geofences  # noqa: E402
+from app.ingest import insert_rows  # noqa: E402
+from app.models import Geofence  # noqa: E402
+
+LAT0, LON0 = 48.5, 2.0
+DEG_PER_M = 1 / 111_000
+
+
+def random_polygons(n, seed=0):
+    rng = np.random.default_rng(seed)
+    polygons = []
+    for _ in range(n):
+        vertices = int(rng.integers(8, 25))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        radius = rng.uniform(50, 500) * DEG_PER_M * rng.uniform(0.6, 1.0, vertices)
+        lat, lon = LAT0 + rng.uniform(0, 1), LON0 + rng.uniform(0, 1)
+        polygons.append(np.column_stack((lat + radius * np.sin(angles), lon + radius * np.cos(angles))).tolist())
+    return polygons
+
+
+def random_points(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return LAT0 + rng.uniform(0, 1, n), LON0 + rng.uniform(0, 1, n)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def ingest_latency(db, first_batch, device_count=100, batches=50):
+    # Chaque appareil avance de ~10 m par lot (un lot par seconde) : les
+    # entrées/sorties restent rares, comme pour une vraie flotte
+    start = datetime(2025, 1, 1)
+    lat, lon = random_points(device_count, seed=2)
+    heading = np.random.default_rng(3).uniform(0, 2 * np.pi, device_count)
+    samples = []
+    for batch in range(first_batch, first_batch + batches):
+        step = batch * 10 * DEG_PER_M
+        rows = [
+            {"device_id": f"bench-fence-{d}", "lat": float(lat[d] + step * np.sin(heading[d])),
+             "lon": float(lon[d] + step * np.cos(heading[d])), "timestamp": start + timedelta(seconds=batch)}
+            for d in range(device_count)
+        ]
+        begin = time.perf_counter()
+        insert_rows(db, rows)
+        db.commit()
+        samples.append(time.perf_counter() - begin)
+    return statistics.median(samples) * 1000
+
+
+def main(n_fences):
+    polygons = random_polygons(n_fences)
+    start = time.perf_counter()
+    index = GeofenceIndex(enumerate(polygons))
+    print(f"{n_fences} zones : index construit en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    lat, lon = random_points(1000)
+    batch_s = timed(lambda: index.locate(lat, lon), 20)
+    single_s = timed(lambda: index.locate(lat[:1], lon[:1]), 2000)
+    # Référence sans grille : toutes les zones candidates pour chaque point
+    unindexed = GeofenceIndex(enumerate(polygons), max_cells=0)
+    brute_s = timed(lambda: unindexed.locate(lat[:100], lon[:100]), 3) * 10
+    assert index.locate(lat[:100], lon[:100]) == unindexed.locate(lat[:100], lon[:100])
+    print(f"  lot de 1000 points : {batch_s * 1000:7.2f} ms ({1000 / batch_s:,.0f} points/s)")
+    print(f"  point seul         : {single_s * 1e6:7.1f} µs")
+    print(f"  sans index (toutes les zones) : {brute_s * 1000:7.0f} ms pour 1000 points")
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    ingest_latency(db, 0, batches=5)  # création des appareils, préchauffage
+    without = ingest_latency(db, 5)
+    db.execute(insert(Geofence.__table__), [{"name": f"zone-{i}", "polygon": json.dumps(p)} for i, p in enumerate(polygons)])
+    db.commit()
+    geofences.invalidate()
+    geofences.get(db)
+    with_fences = ingest_latency(db, 55)
+    print(f"  insert_rows, lot de 100 points : {without:6.2f} ms sans zone, {with_fences:6.2f} ms avec {n_fences} zones")
+    db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
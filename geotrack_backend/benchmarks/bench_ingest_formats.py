@@ -0,0 +1,67 @@
+"""Coût du décodage d'un lot JSON et du format binaire compact.
+
+Usage : python -m benchmarks.bench_ingest_formats [5000]
+
+Mesure, pour un lot d'un appareil à 1 point par seconde, la taille du corps
+de requête et le temps CPU de décodage + validation (ce que fait POST
+/data/batch avant l'insertion), hors base de données.
+"""
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from app.binary import decode_batch, encode_batch, encode_block  # noqa: E402
+from app.schemas import GPSDataBatchRequest, GPSDataRequest  # noqa: E402
+
+ATTEMPTS = 20
+
+
+def timed(fn):
+    durations = []
+    for _ in range(ATTEMPTS):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+def decode_json(body):
+    batch = GPSDataBatchRequest.model_validate_json(body)
+    return [GPSDataRequest.model_validate(item) for item in batch.points]
+
+
+def bench(n_points):
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    times = [start + timedelta(seconds=i) for i in range(n_points)]
+    lats = [48.85 + i * 1e-5 for i in range(n_points)]
+    lons = [2.35 + i * 1e-5 for i in range(n_points)]
+
+    json_body = json.dumps({"points": [
+        {"device_id": "bench-device-0001", "lat": lat, "lon": lon, "timestamp": ts.isoformat()}
+        for ts, lat, lon in zip(times, lats, lons)
+    ]}).encode()
+    binary_body = encode_batch([encode_block("bench-device-0001", times, lats, lons)])
+
+    json_ms = timed(lambda: decode_json(json_body))
+    binary_ms = timed(lambda: decode_batch(binary_body))
+    print(
+        f"{n_points} points\n"
+        f"  JSON    : {len(json_body) / 1024:7.1f} Ko (gzip {len(gzip.compress(json_body)) / 1024:6.1f} Ko)"
+        f" | décodage + validation {json_ms:6.1f} ms\n"
+        f"  binaire : {len(binary_body) / 1024:7.1f} Ko (gzip {len(gzip.compress(binary_body)) / 1024:6.1f} Ko)"
+        f" | décodage {binary_ms:6.1f} ms (x{json_ms / binary_ms:.1f})"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5000]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,84 @@
+"""Latence de connexion en fonction du nombre d'utilisateurs.
+
+Usage : python -m benchmarks.bench_login [10000 100000]
+
+Compare la recherche par empreinte indexée (auth.authenticate_user) au
+parcours de tous les comptes de l'ancienne implémentation. Le parcours est
+estimé (coût d'une vérification sha256_crypt x N/2) : l'exécuter réellement
+prendrait plusieurs minutes par tentative à 100k comptes.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.auth import authenticate_user, get_pin_hash, get_pin_lookup, verify_pin  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import User  # noqa: E402
+
+ATTEMPTS = 20
+
+
+def populate(db, n_users):
+    db.query(User).delete()
+    # Un seul hachage partagé : seul le coût de la recherche nous intéresse ici
+    shared_hash = get_pin_hash("000000")
+    rows = [
+        {
+            "email": f"user{i}@example.com",
+            "hashed_pin": shared_hash,
+            "pin_lookup": get_pin_lookup(f"{i:06d}"),
+        }
+        for i in range(n_users)
+    ]
+    db.execute(insert(User.__table__), rows)
+    target = db.query(User).filter(User.email == f"user{n_users - 1}@example.com").first()
+    target.hashed_pin = get_pin_hash(f"{n_users - 1:06d}")
+    db.commit()
+    return f"{n_users - 1:06d}"
+
+
+def bench(n_users):
+    db = SessionLocal()
+    pin = populate(db, n_users)
+
+    lookups = []
+    for _ in range(ATTEMPTS):
+        start = time.perf_counter()
+        db.query(User).filter(User.pin_lookup == get_pin_lookup(pin)).order_by(User.id).first()
+        lookups.append(time.perf_counter() - start)
+
+    logins = []
+    for _ in range(ATTEMPTS):
+        start = time.perf_counter()
+        assert authenticate_user(db, pin) is not None
+        logins.append(time.perf_counter() - start)
+
+    shared_hash = get_pin_hash("000000")
+    verify_cost = []
+    for _ in range(ATTEMPTS):
+        start = time.perf_counter()
+        verify_pin("nope", shared_hash)
+        verify_cost.append(time.perf_counter() - start)
+    db.close()
+
+    lookup_ms = statistics.median(lookups) * 1000
+    login_ms = statistics.median(logins) * 1000
+    scan_s = statistics.median(verify_cost) * n_users / 2
+    print(
+        f"{n_users:>7} utilisateurs | recherche p50 {lookup_ms:6.2f} ms"
+        f" | connexion p50 {login_ms:7.1f} ms | parcours estimé {scan_s:8.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,77 @@
+"""Coût de sérialisation de GET /data/ : objets ORM + Pydantic contre tuples + orjson.
+
+Usage : python -m benchmarks.bench_serialization [1000 10000]
+
+Compare, pour une page de N points, l'ancien chemin (instances GPSData,
+validation GPSDataResponse, json.dumps) et le chemin actuel (lignes
+tuples, dictionnaires, orjson), ainsi que la taille du corps avant et
+après gzip.
+"""
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+import orjson  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import GPSData  # noqa: E402
+from app.routes.data import GPS_DATA_COLUMNS, _point_rows  # noqa: E402
+from app.schemas import GPSDataResponse  # noqa: E402
+
+ATTEMPTS = 10
+DEVICE = "bench-serialization"
+
+
+def timed(fn):
+    durations = []
+    for _ in range(ATTEMPTS):
+        start = time.perf_counter()
+        body = fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000, body
+
+
+def orm_pydantic(db, limit):
+    rows = db.query(GPSData).filter(GPSData.device_id == DEVICE).limit(limit).all()
+    return json.dumps([GPSDataResponse.model_validate(row).model_dump(mode="json") for row in rows]).encode()
+
+
+def tuples_orjson(db, limit):
+    rows = db.query(*GPS_DATA_COLUMNS).filter(GPSData.device_id == DEVICE).limit(limit).all()
+    return orjson.dumps(_point_rows(rows))
+
+
+def bench(db, limit):
+    old_ms, old_body = timed(lambda: orm_pydantic(db, limit))
+    new_ms, new_body = timed(lambda: tuples_orjson(db, limit))
+    print(
+        f"{limit} points\n"
+        f"  ORM + Pydantic + json : {old_ms:7.1f} ms\n"
+        f"  tuples + orjson       : {new_ms:7.1f} ms (x{old_ms / new_ms:.1f})\n"
+        f"  corps : {len(new_body) / 1024:7.1f} Ko, gzip {len(gzip.compress(new_body, 6)) / 1024:6.1f} Ko"
+    )
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10_000]
+    db = SessionLocal()
+    start = datetime(2024, 3, 1)
+    db.execute(insert(GPSData.__table__), [
+        {"device_id": DEVICE, "lat": 48.85 + i * 1e-5, "lon": 2.35 + i * 1e-5,
+         "timestamp": start + timedelta(seconds=i), "synced": True}
+        for i in range(max(sizes))
+    ])
+    db.commit()
+    for size in sizes:
+        bench(db, size)
+    db.close()
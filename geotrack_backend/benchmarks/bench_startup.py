@@ -0,0 +1,114 @@
+"""Temps de démarrage à froid d'un worker.
+
+Usage : python -m benchmarks.bench_startup [--repeat 10] [--app-dir DIR]
+
+Chaque mesure lance un interpréteur neuf (comme un nouveau worker ou une
+nouvelle instance) sur une base SQLite temporaire dont le schéma existe
+déjà : import de app.main, construction de l'application, démarrage du
+lifespan, puis première requête GET /health et première requête
+authentifiée. Avec --app-dir, compare avec une autre version du code
+(accès à app.main:app, valable avant et après create_app()).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Exécuté dans le worker mesuré ; les durées sont cumulées depuis le lancement
+WORKER = r"""
+import time
+start = time.perf_counter()
+import asyncio, json
+import httpx
+marks = {}
+import app.main as main
+marks["import"] = time.perf_counter() - start
+application = main.app
+marks["app"] = time.perf_counter() - start
+
+async def serve():
+    async with application.router.lifespan_context(application):
+        marks["lifespan"] = time.perf_counter() - start
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            assert (await client.get("/health")).status_code == 200
+            marks["first_request"] = time.perf_counter() - start
+            from app.auth import create_access_token
+            token = create_access_token({"sub": "bench@example.com"})
+            response = await client.get("/data/", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200, response.text
+            marks["first_auth_request"] = time.perf_counter() - start
+
+asyncio.run(serve())
+print(json.dumps(marks))
+"""
+
+PHASES = ("import", "app", "lifespan", "first_request", "first_auth_request")
+
+
+def prepare_database(app_dir):
+    db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+    database_url = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+    # Schéma créé une fois, comme en production avant le démarrage des workers
+    subprocess.run(
+        [sys.executable, "-c", "import app.main as m; from app.database import Base, engine; "
+                               "import app.models; Base.metadata.create_all(bind=engine)"],
+        cwd=app_dir, env=dict(os.environ, DATABASE_URL=database_url), check=True,
+    )
+    return database_url
+
+
+def run_worker(app_dir, env):
+    begin = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", WORKER], cwd=app_dir, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    marks = json.loads(output.strip().splitlines()[-1])
+    marks["process"] = time.perf_counter() - begin
+    return marks
+
+
+def measure(configs, database_url, repeat):
+    # Configurations alternées à chaque répétition : la dérive de la machine
+    # touche toutes les configurations de la même façon
+    runs = {label: [] for label in configs}
+    for _ in range(repeat):
+        for label, (app_dir, extra_env) in configs.items():
+            env = dict(os.environ, DATABASE_URL=database_url, ANALYTICS_REFRESH_INTERVAL_S="0", **extra_env)
+            runs[label].append(run_worker(app_dir, env))
+    return {
+        label: {phase: statistics.median(run[phase] for run in label_runs) * 1000 for phase in PHASES + ("process",)}
+        for label, label_runs in runs.items()
+    }
+
+
+def report(label, timings):
+    phases = "  ".join(f"{phase} {timings[phase]:6.0f}" for phase in PHASES)
+    print(f"{label:28s} {phases}  processus {timings['process']:6.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--app-dir")
+    args = parser.parse_args()
+
+    database_url = prepare_database(BACKEND_DIR)
+    configs = {
+        "ce backend": (BACKEND_DIR, {}),
+        "  + AUTO_CREATE_SCHEMA=true": (BACKEND_DIR, {"AUTO_CREATE_SCHEMA": "true"}),
+    }
+    if args.app_dir:
+        configs[os.path.abspath(args.app_dir)[-28:]] = (args.app_dir, {})
+    print("Durées médianes cumulées depuis le lancement de l'interpréteur (ms)")
+    for label, timings in measure(configs, database_url, args.repeat).items():
+        report(label, timings)
+
+
+if __name__ == "__main__":
+    main()
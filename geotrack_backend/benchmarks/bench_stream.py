@@ -0,0 +1,111 @@
+"""Diffusion temps réel : coût du hub pour N abonnés à un débit donné.
+
+Usage : python -m benchmarks.bench_stream [--subscribers 1000] [--rate 5000]
+                                           [--devices 1000] [--all-devices 0.1]
+
+Simule l'ingestion (lots de points publiés toutes les 10 ms, comme une
+file d'ingestion) et des abonnés qui consomment comme le générateur SSE de
+GET /data/stream. Une partie des abonnés (--all-devices) suit toute la
+flotte, les autres un seul appareil. Mesure la latence publication ->
+réception, le temps passé dans publish() (pris sur la boucle d'ingestion)
+et les messages abandonnés.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from app.pubsub import Hub, dropped  # noqa: E402
+from app.schemas import GPSDataRequest  # noqa: E402
+
+TICK_S = 0.01
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def consumer(subscription, latencies, received, stop):
+    while not stop.is_set():
+        messages = await subscription.get(0.1)
+        now = time.perf_counter()
+        for message in messages:
+            # Le premier événement du message porte l'instant de publication
+            sent_at = float(message[message.index('"lat": ') + 7:message.index(",", message.index('"lat": '))])
+            latencies.append(now - sent_at)
+            received[0] += message.count("data: ")
+
+
+async def run(subscribers, rate, devices, all_devices, duration):
+    hub = Hub()
+    latencies, received = [], [0]
+    stop = asyncio.Event()
+    device_ids = [f"stream-{i}" for i in range(devices)]
+    n_all = int(subscribers * all_devices)
+    subscriptions = [hub.subscribe() for _ in range(n_all)]
+    subscriptions += [hub.subscribe([device_ids[i % devices]]) for i in range(subscribers - n_all)]
+    consumers = [asyncio.create_task(consumer(s, latencies, received, stop)) for s in subscriptions]
+
+    per_tick = max(1, int(rate * TICK_S))
+    timestamp = datetime(2024, 1, 1)
+    publish_time = 0.0
+    published = 0
+    dropped_before = dropped.value
+    start = time.perf_counter()
+    next_tick = start
+    while time.perf_counter() - start < duration:
+        points = []
+        sent_at = time.perf_counter()
+        for _ in range(per_tick):
+            timestamp += timedelta(milliseconds=1)
+            # lat = instant d'envoi, relu par les consommateurs
+            points.append(GPSDataRequest(device_id=random.choice(device_ids), lat=sent_at, lon=0.0, timestamp=timestamp))
+        t0 = time.perf_counter()
+        hub.publish(points)
+        publish_time += time.perf_counter() - t0
+        published += len(points)
+        next_tick += TICK_S
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.2)
+    stop.set()
+    await asyncio.gather(*consumers)
+
+    return {
+        "subscribers": subscribers,
+        "all_device_subscribers": n_all,
+        "target_points_per_s": rate,
+        "published_points_per_s": round(published / elapsed),
+        "delivered_events_per_s": round(received[0] / elapsed),
+        "publish_cpu_share": round(publish_time / elapsed, 3),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "latency_mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "dropped_messages": dropped.value - dropped_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--rate", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--all-devices", type=float, default=0.1)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.subscribers, args.rate, args.devices, args.all_devices, args.duration))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Taille et coût de GET /data/track par rapport à la liste brute des points.
+
+Usage : python -m benchmarks.bench_track [86400]
+
+Une journée de trace à 1 Hz (véhicule en ville : lignes droites, virages,
+bruit GPS de quelques mètres) est comparée sous trois formes : la liste
+GPSDataResponse de GET /data/, la trace JSON compacte et la polyligne
+encodée, pour plusieurs tolérances de simplification.
+"""
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import GPSData  # noqa: E402
+from app.routes.data import _build_track  # noqa: E402
+from app.schemas import GPSDataResponse  # noqa: E402
+
+DEVICE = "bench-track"
+
+
+def populate(db, n_points):
+    random.seed(0)
+    lat, lon, heading = 48.85, 2.35, 0.0
+    start = datetime(2024, 3, 1)
+    rows = []
+    for i in range(n_points):
+        if i % 120 == 0:
+            heading += random.choice([-90, 0, 90])  # virage toutes les 2 minutes
+        speed = 8.0  # m/s
+        lat += speed * math.cos(math.radians(heading)) / 111_000
+        lon += speed * math.sin(math.radians(heading)) / (111_000 * math.cos(math.radians(lat)))
+        rows.append({
+            "device_id": DEVICE,
+            "lat": lat + random.gauss(0, 2e-5),
+            "lon": lon + random.gauss(0, 2e-5),
+            "timestamp": start + timedelta(seconds=i),
+            "synced": True,
+        })
+    db.execute(insert(GPSData.__table__), rows)
+    db.commit()
+
+
+def bench(n_points):
+    db = SessionLocal()
+    populate(db, n_points)
+
+    raw = [GPSDataResponse.model_validate(row) for row in db.query(GPSData).filter(GPSData.device_id == DEVICE)]
+    raw_size = len(json.dumps([r.model_dump(mode="json") for r in raw]))
+    print(f"{n_points} points | GET /data/ : {raw_size / 1024:8.0f} Ko")
+
+    runs = [("-", 0)] + [(algorithm, tolerance) for algorithm in ("dp", "vw") for tolerance in (2, 5, 10)]
+    for algorithm, tolerance in runs:
+        for encoding in ("json", "polyline"):
+            start = time.perf_counter()
+            track = _build_track(db, DEVICE, None, None, tolerance, algorithm if tolerance else "dp", encoding)
+            elapsed = (time.perf_counter() - start) * 1000
+            size = len(track.model_dump_json(exclude_none=True))
+            print(
+                f"  {algorithm} {tolerance:>2} m {encoding:<8} | {track.count:>6} points"
+                f" | {size / 1024:7.1f} Ko (x{raw_size / size:6.1f}) | {elapsed:6.0f} ms"
+            )
+    db.close()
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [86_400]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,96 @@
+"""Latence de GET /data/within en fonction du volume de points.
+
+Usage : python -m benchmarks.bench_within [1000000]
+
+Remplit une base SQLite temporaire avec des traces réparties sur la France
+métropolitaine (un point par minute et par appareil), puis mesure une
+recherche par rectangle de quelques kilomètres et par rayon de 1 km sur une
+journée, comparée au parcours complet par lat/lon sans index spatial.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from sqlalchemy import and_, insert  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.geo import encode, radius_boxes  # noqa: E402
+from app.models import GPSData  # noqa: E402
+from app.routes.data import _points_within  # noqa: E402
+
+ATTEMPTS = 20
+INSERT_BATCH = 50_000
+BBOX = (48.84, 2.33, 48.87, 2.37)  # Paris centre
+DAY = (datetime(2024, 3, 3), datetime(2024, 3, 4))
+
+
+def populate(db, n_points):
+    random.seed(0)
+    devices = max(1, n_points // 10_000)
+    per_device = n_points // devices
+    start = datetime(2024, 3, 1)
+    rows = []
+    for d in range(devices):
+        lat, lon = random.uniform(43.0, 50.0), random.uniform(-1.0, 7.0)
+        in_paris = d % 20 == 0  # quelques appareils circulent dans Paris
+        for i in range(per_device):
+            if in_paris:
+                lat, lon = random.uniform(48.83, 48.88), random.uniform(2.30, 2.40)
+            else:
+                lat += random.uniform(-0.001, 0.001)
+                lon += random.uniform(-0.001, 0.001)
+            rows.append({
+                "device_id": f"bench-{d}",
+                "lat": lat,
+                "lon": lon,
+                "timestamp": start + timedelta(minutes=i),
+                "synced": True,
+                "geohash": encode(lat, lon),
+            })
+            if len(rows) >= INSERT_BATCH:
+                db.execute(insert(GPSData.__table__), rows)
+                rows = []
+    if rows:
+        db.execute(insert(GPSData.__table__), rows)
+    db.commit()
+
+
+def timed(fn):
+    durations = []
+    for _ in range(ATTEMPTS):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000, result
+
+
+def bench(n_points):
+    db = SessionLocal()
+    populate(db, n_points)
+
+    bbox_ms, (rows, _) = timed(lambda: _points_within(db, [BBOX], None, *DAY, None, 1000))
+    circle = (48.855, 2.35, 1000)
+    radius_ms, _ = timed(lambda: _points_within(db, radius_boxes(*circle), circle, *DAY, None, 1000))
+    scan_ms, _ = timed(lambda: db.query(GPSData).filter(and_(
+        GPSData.lat.between(BBOX[0], BBOX[2]), GPSData.lon.between(BBOX[1], BBOX[3]),
+        GPSData.timestamp >= DAY[0], GPSData.timestamp < DAY[1],
+    )).order_by(GPSData.timestamp).limit(1001).all())
+    db.close()
+    print(
+        f"{n_points:>9} points | rectangle p50 {bbox_ms:7.1f} ms ({len(rows)} lignes)"
+        f" | rayon p50 {radius_ms:7.1f} ms | sans index spatial {scan_ms:7.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,140 @@
+"""Test de charge : N appareils simultanés qui envoient et relisent leurs points.
+
+Usage :
+    python -m benchmarks.load_ingest --concurrency 200 --duration 15
+    python -m benchmarks.load_ingest --url http://localhost:8000
+    python -m benchmarks.load_ingest --workers 4
+
+Sans --url, un serveur uvicorn est lancé sur une base SQLite temporaire à
+partir du répertoire --app-dir (par défaut ce backend), ce qui permet de
+comparer deux versions du code sur la même machine. Avec --workers, le
+serveur est lancé par python -m app.serve (schéma puis N workers).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from app.auth import create_access_token
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app_dir, database_url=None, workers=None):
+    port = free_port()
+    if database_url is None:
+        db_dir = tempfile.mkdtemp(prefix="geotrack-load-")
+        database_url = f"sqlite:///{os.path.join(db_dir, 'load.db')}"
+    env = dict(os.environ, DATABASE_URL=database_url, LOG_LEVEL="WARNING", AUTO_CREATE_SCHEMA="true")
+    if workers is None:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "app.serve", "--workers", str(workers), "--host", "127.0.0.1",
+                   "--port", str(port)]
+    process = subprocess.Popen(command, cwd=app_dir, env=env)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/health", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Le serveur n'a pas démarré")
+
+
+async def device_loop(client, device_id, headers, deadline, latencies, errors):
+    timestamp = datetime(2024, 1, 1)
+    sent = 0
+    while time.perf_counter() < deadline:
+        timestamp += timedelta(seconds=5)
+        start = time.perf_counter()
+        try:
+            if sent % 5 == 4:
+                response = await client.get("/data/", params={"device_id": device_id, "limit": 20}, headers=headers)
+            else:
+                response = await client.post("/data/", headers=headers, json={
+                    "device_id": device_id,
+                    "lat": 48.85,
+                    "lon": 2.35,
+                    "timestamp": timestamp.isoformat(),
+                })
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        sent += 1
+
+
+async def run(url, concurrency, duration):
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'load@example.com'})}"}
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*[
+            device_loop(client, f"load-device-{i}", headers, deadline, latencies, errors)
+            for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "req_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url")
+    parser.add_argument("--app-dir", default=BACKEND_DIR)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.app_dir, workers=args.workers)
+    try:
+        print(json.dumps(asyncio.run(run(url, args.concurrency, args.duration))))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Micro-benchmarks pytest-benchmark des chemins critiques, sans serveur HTTP.
+
+Usage :
+    python -m pytest benchmarks/micro.py --benchmark-autosave
+    python -m pytest benchmarks/micro.py --benchmark-compare --benchmark-compare-fail=median:20%
+
+Chaque test mesure une fonction appelée par une route (insertion, page de
+GET /data/ et sa sérialisation, connexion, relecture de config) sur une
+base SQLite temporaire. Les tailles de table croissent d'un paramètre à
+l'autre : la base est complétée, jamais vidée, d'où l'ordre croissant.
+--benchmark-compare-fail fait échouer la session si la médiane d'un test
+dépasse de 20 % celle de la dernière sauvegarde (.benchmarks/).
+"""
+import itertools
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="geotrack-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+import orjson  # noqa: E402
+import pytest  # noqa: E402
+
+from app.auth import authenticate_user, create_access_token, verify_token  # noqa: E402
+from app.binary import decode_batch, encode_batch, encode_block  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.ingest import insert_points  # noqa: E402
+from app.models import User  # noqa: E402
+from app.routes.config import _read_config, config_etag  # noqa: E402
+from app.routes.data import _list_points, _point_rows  # noqa: E402
+from app.schemas import GPSDataRequest  # noqa: E402
+
+from .suite import LIST_DEVICES, email_for, pin_for, seed_points, seed_users  # noqa: E402
+
+TABLE_SIZES = (10_000, 100_000)
+USER_COUNTS = (1_000, 10_000)
+
+
+@pytest.fixture(scope="module")
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def point_factory(device_id):
+    start = datetime(2025, 1, 1)
+    counter = itertools.count()
+
+    def make(n):
+        return [
+            GPSDataRequest(device_id=device_id, lat=48.85, lon=2.35, timestamp=start + timedelta(seconds=next(counter)))
+            for _ in range(n)
+        ]
+    return make
+
+
+def test_ingest_single(benchmark, db):
+    make = point_factory("micro-single")
+    benchmark(lambda: (insert_points(db, make(1)), db.commit()))
+
+
+def test_ingest_batch(benchmark, db):
+    make = point_factory("micro-batch")
+    benchmark(lambda: (insert_points(db, make(100)), db.commit()))
+
+
+def test_decode_binary_batch(benchmark):
+    start = datetime(2025, 1, 1)
+    payload = encode_batch([encode_block(
+        "micro-binary",
+        [start + timedelta(seconds=i) for i in range(1000)],
+        [48.85 + i * 1e-5 for i in range(1000)],
+        [2.35] * 1000,
+    )])
+    benchmark(decode_batch, payload)
+
+
+@pytest.mark.parametrize("size", TABLE_SIZES)
+def test_list_points(benchmark, db, size):
+    seed_points(engine, size)
+    device_ids = itertools.cycle([f"bench-list-{i}" for i in range(LIST_DEVICES)])
+    benchmark(lambda: _list_points(db, next(device_ids), None, None, 100))
+
+
+def test_serialize_page(benchmark, db):
+    seed_points(engine, TABLE_SIZES[0])
+    rows, _ = _list_points(db, "bench-list-0", None, None, 100)
+    benchmark(lambda: orjson.dumps(_point_rows(rows)))
+
+
+@pytest.mark.parametrize("count", USER_COUNTS)
+def test_login(benchmark, db, count):
+    seed_users(engine, count)
+    benchmark.pedantic(authenticate_user, args=(db, pin_for(0)), rounds=10)
+
+
+def test_verify_token_cached(benchmark):
+    token = create_access_token({"sub": email_for(0)})
+    verify_token(token)
+    benchmark(verify_token, token)
+
+
+def test_read_config(benchmark, db):
+    seed_users(engine, 1)
+    user_id = db.query(User.id).filter(User.email == email_for(0)).scalar()
+    benchmark(lambda: config_etag(_read_config(db, user_id)))
@@ -0,0 +1,68 @@
+"""Comparaison de résultats de benchmarks.suite à une référence.
+
+Usage : python -m benchmarks.regression results.json baseline.json [--max-regression 0.2]
+
+Un scénario régresse si sa latence p95 dépasse celle de la référence de
+plus de --max-regression (20 % par défaut), si son débit baisse d'autant,
+ou s'il renvoie des erreurs alors que la référence n'en avait pas. Les
+écarts de latence inférieurs à MIN_LATENCY_DELTA_MS sont ignorés (bruit
+de mesure sur les requêtes très courtes). La référence doit être mesurée
+sur la même machine et la même base que les résultats comparés. Code de
+sortie 1 en cas de régression.
+"""
+import argparse
+import json
+import sys
+from typing import List
+
+LATENCY_METRICS = ("p95_ms",)
+THROUGHPUT_METRICS = ("req_per_s",)
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> List[str]:
+    failures = []
+    if current["meta"].get("database") != baseline["meta"].get("database"):
+        failures.append(
+            f"bases différentes : {current['meta'].get('database')} contre {baseline['meta'].get('database')}"
+        )
+        return failures
+
+    for name, reference in baseline["results"].items():
+        result = current["results"].get(name)
+        if result is None:
+            continue
+        for metric in LATENCY_METRICS:
+            limit = reference[metric] * (1 + max_regression)
+            if result[metric] > limit and result[metric] - reference[metric] > MIN_LATENCY_DELTA_MS:
+                failures.append(f"{name} {metric} : {result[metric]} > {limit:.2f} (référence {reference[metric]})")
+        for metric in THROUGHPUT_METRICS:
+            limit = reference[metric] * (1 - max_regression)
+            if result[metric] < limit:
+                failures.append(f"{name} {metric} : {result[metric]} < {limit:.1f} (référence {reference[metric]})")
+        if result["errors"] and not reference["errors"]:
+            failures.append(f"{name} : {result['errors']} erreurs")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("results")
+    parser.add_argument("baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.results) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failures = compare(current, baseline, args.max_regression)
+    for failure in failures:
+        print(f"RÉGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"{len(baseline['results'])} scénarios sans régression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# Base SQLite jetable : les tests ne doivent pas écrire dans nexor_geotrack.db
+_db_dir = tempfile.mkdtemp(prefix="geotrack-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+
+# Active le profilage sur demande (en-tête X-Profile) et GET /admin/*
+os.environ.setdefault("DIAGNOSTICS_TOKEN", "test-diagnostics-token")
+
+# Les tests n'ouvrent pas le lifespan (TestClient sans `with`) : schéma créé
+# une fois pour toute la session, comme python -m app.migrate
+from app.migrate import create_schema  # noqa: E402
+
+create_schema()
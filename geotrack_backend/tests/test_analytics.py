@@ -0,0 +1,195 @@
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+from app.analytics import rebuild_daily, rebuild_segments, segment
+from app.database import SessionLocal
+from app.models import DeviceAnalyticsState, DeviceDailySummary, Stop, Trip
+
+client = TestClient(app)
+
+START = datetime(2024, 9, 2, 8, 0, 0)
+STEP_S = 10
+# 10 m/s vers le nord : 1 degré de latitude ~ 111 195 m
+MOVE_DEG = 10 * STEP_S / 111_195
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def drive(plan, start=START, lat=45.0, lon=5.0):
+    # plan : [(nombre d'intervalles, en mouvement ?)] -> points toutes les STEP_S secondes
+    points = [(start, lat, lon)]
+    for steps, moving in plan:
+        for _ in range(steps):
+            lat += MOVE_DEG if moving else 0.0
+            points.append((points[-1][0] + timedelta(seconds=STEP_S), lat, lon))
+    return points
+
+def as_arrays(points):
+    t = np.array([(ts - START).total_seconds() for ts, _, _ in points])
+    return t, np.array([p[1] for p in points]), np.array([p[2] for p in points])
+
+def post(device_id, points, headers):
+    response = client.post("/data/batch", json={"points": [
+        {"device_id": device_id, "lat": lat, "lon": lon, "timestamp": ts.isoformat()}
+        for ts, lat, lon in points
+    ]}, headers=headers)
+    assert response.status_code == 200
+
+def test_segment_stop_trip_stop():
+    # 10 min arrêté, 10 min à 10 m/s, 10 min arrêté
+    segments = segment(*as_arrays(drive([(60, False), (60, True), (60, False)])))
+    assert [s["kind"] for s in segments] == ["stop", "trip", "stop"]
+    stop, trip, _ = segments
+    assert (stop["first"], stop["last"], trip["first"], trip["last"]) == (0, 60, 60, 120)
+    assert trip["distance_m"] == pytest.approx(6000, rel=1e-3)
+    assert trip["moving_s"] == 600
+    assert trip["max_speed_mps"] == pytest.approx(10, rel=1e-3)
+
+def test_short_pause_stays_inside_trip():
+    # Feu rouge de 2 minutes : moins que STOP_MIN_DWELL_S
+    segments = segment(*as_arrays(drive([(60, False), (30, True), (12, False), (30, True), (60, False)])))
+    assert [s["kind"] for s in segments] == ["stop", "trip", "stop"]
+    assert segments[1]["moving_s"] == 600
+
+def test_daily_report_and_incremental_refresh(auth_headers):
+    device = "analytics-device"
+    points = drive([(60, False), (60, True), (60, False), (60, True), (60, False)])
+    # Premier envoi jusqu'au milieu du second trajet, puis le reste
+    post(device, points[:200], auth_headers)
+    daily = client.get(f"/devices/{device}/daily", headers=auth_headers).json()
+    assert len(daily) == 1
+    assert (daily[0]["trip_count"], daily[0]["stop_count"]) == (2, 2)
+
+    post(device, points[200:], auth_headers)
+    daily = client.get(f"/devices/{device}/daily", headers=auth_headers).json()
+    assert daily[0]["day"] == "2024-09-02"
+    assert (daily[0]["trip_count"], daily[0]["stop_count"]) == (2, 3)
+    assert daily[0]["distance_m"] == pytest.approx(12000, rel=1e-3)
+    assert daily[0]["moving_s"] == 1200
+    assert daily[0]["stopped_s"] == 1800
+
+    trips = client.get(f"/devices/{device}/trips", headers=auth_headers).json()
+    assert [t["start_time"] for t in trips] == ["2024-09-02T08:10:00", "2024-09-02T08:30:00"]
+    stops = client.get(f"/devices/{device}/stops", params={"start": "2024-09-02T08:15:00"}, headers=auth_headers).json()
+    assert [s["start_time"] for s in stops] == ["2024-09-02T08:20:00", "2024-09-02T08:40:00"]
+
+    # Le calcul incrémental donne le même résultat qu'un recalcul complet
+    def snapshot(db):
+        return (
+            [(t.start_time, t.end_time, round(t.distance_m, 3)) for t in db.query(Trip).filter_by(device_id=device).order_by(Trip.start_time)],
+            [(s.start_time, s.end_time) for s in db.query(Stop).filter_by(device_id=device).order_by(Stop.start_time)],
+            [(d.day, d.trip_count, d.stop_count) for d in db.query(DeviceDailySummary).filter_by(device_id=device)],
+        )
+    db = SessionLocal()
+    try:
+        incremental = snapshot(db)
+        rebuild_segments(db, device, None)
+        rebuild_daily(db, device, None)
+        db.commit()
+        assert snapshot(db) == incremental
+    finally:
+        db.close()
+
+def test_replayed_batch_does_not_mark_device(auth_headers):
+    device = "analytics-replay"
+    points = drive([(60, False), (60, True)], start=datetime(2024, 9, 3, 8, 0, 0))
+    post(device, points, auth_headers)
+    client.get(f"/devices/{device}/daily", headers=auth_headers)
+
+    post(device, points, auth_headers)
+    db = SessionLocal()
+    try:
+        assert db.get(DeviceAnalyticsState, device).dirty_since is None
+    finally:
+        db.close()
+
+def test_late_points_are_reprocessed(auth_headers):
+    device = "analytics-late"
+    start = datetime(2024, 9, 4, 8, 0, 0)
+    points = drive([(60, False), (60, True), (60, False), (60, True), (60, False)], start=start)
+    # Le premier trajet arrive après le reste (appareil resté hors ligne)
+    missing = points[61:120]
+    post(device, [p for p in points if p not in missing], auth_headers)
+    post(device, missing, auth_headers)
+
+    trips = client.get(f"/devices/{device}/trips", headers=auth_headers).json()
+    assert [t["start_time"] for t in trips] == ["2024-09-04T08:10:00", "2024-09-04T08:30:00"]
+    assert trips[0]["distance_m"] == pytest.approx(6000, rel=1e-3)
+
+def test_chunked_stream_matches_single_pass(auth_headers, monkeypatch):
+    import app.analytics as analytics
+    device = "analytics-chunks"
+    post(device, drive([(60, False), (60, True), (12, False), (60, True), (60, False)],
+                       start=datetime(2024, 9, 5, 8, 0, 0)), auth_headers)
+
+    def segments():
+        db = SessionLocal()
+        try:
+            rebuild_segments(db, device, None)
+            db.commit()
+            return [(t.start_time, t.end_time, round(t.distance_m, 3)) for t in db.query(Trip).filter_by(device_id=device)], \
+                   [(s.start_time, s.end_time) for s in db.query(Stop).filter_by(device_id=device)]
+        finally:
+            db.close()
+
+    single = segments()
+    monkeypatch.setattr(analytics, "ANALYTICS_CHUNK_POINTS", 7)
+    assert segments() == single
+    assert len(single[0]) == 1 and len(single[1]) == 2
+
+def test_long_backlog_is_left_to_background_refresh(auth_headers, monkeypatch):
+    import app.routes.devices as devices
+    from app.analytics import refresh_dirty
+    device = "analytics-backlog"
+    post(device, drive([(60, False), (60, True), (60, False)], start=datetime(2024, 9, 6, 8, 0, 0)), auth_headers)
+
+    # Trop de points à relire : le rapport sert les agrégats enregistrés
+    monkeypatch.setattr(devices, "ANALYTICS_INLINE_MAX_POINTS", 100)
+    assert client.get(f"/devices/{device}/trips", headers=auth_headers).json() == []
+    db = SessionLocal()
+    try:
+        assert db.get(DeviceAnalyticsState, device).dirty_since is not None
+    finally:
+        db.close()
+
+    assert refresh_dirty()[device] == 181
+    assert len(client.get(f"/devices/{device}/trips", headers=auth_headers).json()) == 1
+
+def test_daily_summary_splits_segments_at_midnight():
+    # Arrêt du vendredi 18:00 au lundi 08:00, puis trajet de nuit lundi 23:00 - mardi 01:00
+    device = "analytics-midnight"
+    friday = datetime(2024, 9, 6)
+    db = SessionLocal()
+    try:
+        db.add(Stop(device_id=device, start_time=friday + timedelta(hours=18), end_time=friday + timedelta(days=3, hours=8),
+                    lat=45.0, lon=5.0, point_count=100))
+        db.add(Trip(device_id=device, start_time=friday + timedelta(days=3, hours=23), end_time=friday + timedelta(days=4, hours=1),
+                    start_lat=45.0, start_lon=5.0, end_lat=45.1, end_lon=5.0,
+                    distance_m=7200.0, moving_s=7200.0, max_speed_mps=2.0, point_count=100))
+        db.flush()
+
+        def summary():
+            return [
+                (row.day.day, row.stopped_s, row.stop_count, row.distance_m, row.moving_s, row.trip_count)
+                for row in db.query(DeviceDailySummary).filter_by(device_id=device).order_by(DeviceDailySummary.day)
+            ]
+
+        rebuild_daily(db, device, None)
+        expected = [
+            (6, 6 * 3600, 1, 0, 0, 0),
+            (7, 86400, 0, 0, 0, 0),
+            (8, 86400, 0, 0, 0, 0),
+            (9, 8 * 3600, 0, 3600, 3600, 1),
+            (10, 0, 0, 3600, 3600, 0),
+        ]
+        assert summary() == expected
+        # Recalcul à partir du dimanche : l'arrêt commencé vendredi y est toujours réparti
+        rebuild_daily(db, device, friday + timedelta(days=2, hours=12))
+        assert summary() == expected
+    finally:
+        db.rollback()
+        db.close()
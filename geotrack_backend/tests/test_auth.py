@@ -5,22 +5,58 @@ from app.auth import create_access_token
 
 client = TestClient(app)
 
+def register_user(email, pin):
+    response = client.post("/auth/register", json={"email": email, "pin": pin})
+    assert response.status_code in (200, 400)
+
 def test_login_success():
+    register_user("admin@example.com", "1234")
     response = client.post(
         "/auth/login",
-        json={"username": "admin", "password": "1234"}
+        json={"pin": "1234"}
     )
     assert response.status_code == 200
     assert "access_token" in response.json()
     assert response.json()["token_type"] == "bearer"
 
+def test_login_with_email():
+    register_user("admin@example.com", "1234")
+    response = client.post(
+        "/auth/login",
+        json={"email": "admin@example.com", "pin": "1234"}
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        "/auth/login",
+        json={"email": "admin@example.com", "pin": "9999"}
+    )
+    assert response.status_code == 401
+
 def test_login_failure():
     response = client.post(
         "/auth/login",
-        json={"username": "admin", "password": "wrongpassword"}
+        json={"pin": "wrongpin"}
     )
     assert response.status_code == 401
-    assert response.json()["detail"] == "Incorrect username or password"
+    assert response.json()["detail"] == "PIN incorrect"
+
+def test_login_backfills_pin_lookup_for_legacy_users():
+    from app.auth import get_pin_hash
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    db.add(User(email="legacy@example.com", hashed_pin=get_pin_hash("4321")))
+    db.commit()
+
+    response = client.post("/auth/login", json={"pin": "4321"})
+    assert response.status_code == 200
+
+    db.expire_all()
+    user = db.query(User).filter(User.email == "legacy@example.com").first()
+    assert user.pin_lookup is not None
+    db.close()
 
 def test_token_endpoint():
     response = client.post(
@@ -29,4 +65,26 @@ def test_token_endpoint():
     )
     assert response.status_code == 200
     assert "access_token" in response.json()
-    assert response.json()["token_type"] == "bearer"
\ No newline at end of file
+    assert response.json()["token_type"] == "bearer"
+
+def test_verify_token_is_cached_until_expiry():
+    from datetime import timedelta
+    from app.auth import token_cache, verify_token
+
+    token = create_access_token({"sub": "cached@example.com"})
+    assert verify_token(token) == "cached@example.com"
+    assert token_cache.get(token) == "cached@example.com"
+
+    expired = create_access_token({"sub": "cached@example.com"}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(Exception):
+        verify_token(expired)
+    assert token_cache.get(expired) is None
+
+def test_protected_route_rejects_invalid_token():
+    response = client.get("/data/", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+def test_config_requires_existing_user():
+    token = create_access_token({"sub": "ghost@example.com"})
+    response = client.get("/config/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
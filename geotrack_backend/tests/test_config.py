@@ -0,0 +1,50 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+
+client = TestClient(app)
+
+@pytest.fixture
+def auth_headers():
+    client.post("/auth/register", json={"email": "config@example.com", "pin": "2468"})
+    token = create_access_token({"sub": "config@example.com"})
+    return {"Authorization": f"Bearer {token}"}
+
+def test_get_config_is_cached(auth_headers):
+    from app.routes.config import config_cache
+    config_cache.clear()
+
+    first = client.get("/config/", headers=auth_headers)
+    assert first.status_code == 200
+    hits = client.get("/metrics", headers={"Accept": "application/json"}).json()["config_cache_hits_total"]
+
+    second = client.get("/config/", headers=auth_headers)
+    assert second.json() == first.json()
+    assert client.get("/metrics", headers={"Accept": "application/json"}).json()["config_cache_hits_total"] == hits + 1
+
+def test_update_config_refreshes_cache(auth_headers):
+    client.get("/config/", headers=auth_headers)
+    response = client.put("/config/", json={"x_parameter": 7}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["x_parameter"] == 7
+
+    response = client.patch("/config/", json={"y_parameter": 20}, headers=auth_headers)
+    assert response.json()["x_parameter"] == 7
+
+    response = client.get("/config/", headers=auth_headers)
+    assert response.json()["x_parameter"] == 7
+    assert response.json()["y_parameter"] == 20
+
+def test_get_config_etag(auth_headers):
+    response = client.get("/config/", headers=auth_headers)
+    etag = response.headers["ETag"]
+
+    response = client.get("/config/", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.put("/config/", json={"device_id": "new-device"}, headers=auth_headers)
+    response = client.get("/config/", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["device_id"] == "new-device"
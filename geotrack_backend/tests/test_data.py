@@ -29,4 +29,277 @@ def test_get_gps_data(auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
     response = client.get("/data/", headers=headers)
     assert response.status_code == 200
-    assert isinstance(response.json(), list)
\ No newline at end of file
+    assert isinstance(response.json(), list)
+
+def test_create_gps_data_batch(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {
+            "device_id": "batch-device",
+            "lat": 48.85 + i * 0.001,
+            "lon": 2.35,
+            "timestamp": f"2024-01-01T10:{i:02d}:00"
+        }
+        for i in range(50)
+    ]
+    response = client.post("/data/batch", json={"points": points}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 50
+    assert body["rejected"] == 0
+    assert all(r["status"] == "accepted" for r in body["results"])
+
+    response = client.get("/data/?device_id=batch-device", headers=headers)
+    assert len(response.json()) == 50
+
+def test_create_gps_data_batch_rejects_invalid_items(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {"device_id": "batch-device-2", "lat": 1.0, "lon": 2.0, "timestamp": "2024-01-01T10:00:00"},
+        {"device_id": "batch-device-2", "lat": "north", "lon": 2.0, "timestamp": "2024-01-01T10:01:00"},
+        {"device_id": "batch-device-2", "lon": 2.0, "timestamp": "2024-01-01T10:02:00"},
+    ]
+    response = client.post("/data/batch", json={"points": points}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 1
+    assert body["rejected"] == 2
+    assert [r["status"] for r in body["results"]] == ["accepted", "rejected", "rejected"]
+    assert body["results"][1]["detail"].startswith("lat")
+
+def test_create_gps_data_batch_too_large(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    from app.routes.data import MAX_BATCH_SIZE
+    points = [{"device_id": "d", "lat": 0, "lon": 0, "timestamp": "2024-01-01T00:00:00"}] * (MAX_BATCH_SIZE + 1)
+    response = client.post("/data/batch", json={"points": points}, headers=headers)
+    assert response.status_code == 413
+
+def test_create_gps_data_is_idempotent(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    gps_data = {
+        "device_id": "retry-device",
+        "lat": 48.8566,
+        "lon": 2.3522,
+        "timestamp": "2024-02-01T08:00:00"
+    }
+    first = client.post("/data/", json=gps_data, headers=headers)
+    second = client.post("/data/", json=gps_data, headers=headers)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert first.json()["id"] == second.json()["id"]
+
+    response = client.get("/data/?device_id=retry-device", headers=headers)
+    assert len(response.json()) == 1
+
+def test_create_gps_data_batch_drops_duplicates(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {"device_id": "dup-device", "lat": 1.0, "lon": 2.0, "timestamp": f"2024-03-01T10:0{i}:00"}
+        for i in range(3)
+    ]
+    first = client.post("/data/batch", json={"points": points}, headers=headers).json()
+    assert first["duplicates"] == 0
+
+    # Rejeu du même lot avec un point nouveau et un doublon interne
+    replay = points + [
+        {"device_id": "dup-device", "lat": 1.0, "lon": 2.0, "timestamp": "2024-03-01T10:05:00"},
+        {"device_id": "dup-device", "lat": 1.0, "lon": 2.0, "timestamp": "2024-03-01T10:05:00"},
+    ]
+    second = client.post("/data/batch", json={"points": replay}, headers=headers).json()
+    assert second["accepted"] == 5
+    assert second["duplicates"] == 4
+
+    response = client.get("/data/?device_id=dup-device", headers=headers)
+    assert len(response.json()) == 4
+
+    metrics = client.get("/metrics", headers={"Accept": "application/json"}).json()
+    assert metrics["gps_duplicates_dropped_total"] >= 4
+
+def test_get_gps_data_keyset_pagination(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {"device_id": "paged-device", "lat": 1.0, "lon": 2.0, "timestamp": f"2024-04-01T10:{i:02d}:00"}
+        for i in range(25)
+    ]
+    client.post("/data/batch", json={"points": points}, headers=headers)
+
+    seen = []
+    params = {"device_id": "paged-device", "limit": 10}
+    while True:
+        response = client.get("/data/", params=params, headers=headers)
+        assert response.status_code == 200
+        seen += [row["timestamp"] for row in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        params["before"] = cursor
+
+    assert len(seen) == 25
+    assert seen == sorted(seen, reverse=True)
+
+    # Parcours chronologique à partir d'un curseur `after`
+    response = client.get(
+        "/data/",
+        params={"device_id": "paged-device", "after": "2024-04-01T10:19:00", "limit": 10},
+        headers=headers
+    )
+    assert [row["timestamp"][11:16] for row in response.json()] == ["10:20", "10:21", "10:22", "10:23", "10:24"]
+    assert "X-Next-Cursor" not in response.headers
+
+    # Requête d'un navigateur : l'en-tête du curseur doit lui être exposé
+    response = client.get("/data/", params=params, headers={**headers, "Origin": "https://app.example.com"})
+    assert "x-next-cursor" in response.headers["access-control-expose-headers"].lower()
+
+def test_get_gps_data_limit_is_capped(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    from app.routes.data import MAX_PAGE_SIZE
+    response = client.get("/data/", params={"limit": MAX_PAGE_SIZE + 1}, headers=headers)
+    assert response.status_code == 422
+
+def test_export_gps_data(auth_token):
+    import csv
+    import io
+    import json
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {"device_id": "export-a", "lat": 1.0 + i, "lon": 2.0, "timestamp": f"2024-05-01T1{i}:00:00"}
+        for i in range(3)
+    ] + [{"device_id": "export-b", "lat": 5.0, "lon": 6.0, "timestamp": "2024-05-01T10:00:00"}]
+    client.post("/data/batch", json={"points": points}, headers=headers)
+    params = {"start": "2024-05-01T00:00:00", "end": "2024-05-02T00:00:00"}
+
+    response = client.get("/data/export", params={**params, "format": "ndjson"}, headers=headers)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["device_id"] for line in lines] == ["export-a"] * 3 + ["export-b"]
+
+    response = client.get("/data/export", params={**params, "format": "csv", "device_id": "export-a"}, headers=headers)
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["device_id", "lat", "lon", "timestamp"]
+    assert len(rows) == 4
+
+    response = client.get("/data/export", params={**params, "format": "geojson"}, headers=headers)
+    collection = response.json()
+    geometries = {f["properties"]["device_id"]: f["geometry"] for f in collection["features"]}
+    assert geometries["export-a"] == {"type": "LineString", "coordinates": [[2.0, 1.0], [2.0, 2.0], [2.0, 3.0]]}
+    assert geometries["export-b"] == {"type": "Point", "coordinates": [6.0, 5.0]}
+
+    response = client.get("/data/export", params={"format": "geojson", "device_id": "nobody"}, headers=headers)
+    assert response.json() == {"type": "FeatureCollection", "features": []}
+
+def test_gps_data_within_bbox_and_radius(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {"device_id": "zone-a", "lat": -33.8700, "lon": 151.2100, "timestamp": "2024-07-01T10:00:00"},
+        {"device_id": "zone-b", "lat": -33.8710, "lon": 151.2090, "timestamp": "2024-07-01T11:00:00"},
+        # Dans le rectangle mais hors du cercle de 500 m
+        {"device_id": "zone-c", "lat": -33.8650, "lon": 151.2150, "timestamp": "2024-07-01T12:00:00"},
+        {"device_id": "zone-far", "lat": -33.9500, "lon": 151.1000, "timestamp": "2024-07-01T10:00:00"},
+    ]
+    client.post("/data/batch", json={"points": points}, headers=headers)
+
+    bbox = {"min_lat": -33.88, "min_lon": 151.20, "max_lat": -33.86, "max_lon": 151.22}
+    response = client.get("/data/within", params=bbox, headers=headers)
+    assert response.status_code == 200
+    assert [row["device_id"] for row in response.json()] == ["zone-a", "zone-b", "zone-c"]
+
+    response = client.get("/data/within", params={**bbox, "start": "2024-07-01T10:30:00", "end": "2024-07-01T11:30:00"}, headers=headers)
+    assert [row["device_id"] for row in response.json()] == ["zone-b"]
+
+    response = client.get("/data/within", params={**bbox, "limit": 2}, headers=headers)
+    assert len(response.json()) == 2
+    assert response.headers["X-Truncated"] == "true"
+
+    circle = {"lat": -33.8705, "lon": 151.2095, "radius_m": 500}
+    response = client.get("/data/within", params=circle, headers=headers)
+    assert [row["device_id"] for row in response.json()] == ["zone-a", "zone-b"]
+
+    response = client.get("/data/within", params={"lat": 1.0, "radius_m": 10}, headers=headers)
+    assert response.status_code == 400
+
+def test_gps_data_within_across_antimeridian(auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    points = [
+        {"device_id": "fiji-east", "lat": -17.0, "lon": 179.999, "timestamp": "2024-07-02T10:00:00"},
+        {"device_id": "fiji-west", "lat": -17.0, "lon": -179.999, "timestamp": "2024-07-02T10:01:00"},
+    ]
+    client.post("/data/batch", json={"points": points}, headers=headers)
+
+    response = client.get("/data/within", params={"lat": -17.0, "lon": 180.0, "radius_m": 1000}, headers=headers)
+    assert [row["device_id"] for row in response.json()] == ["fiji-east", "fiji-west"]
+
+    bbox = {"min_lat": -17.5, "min_lon": 179.5, "max_lat": -16.5, "max_lon": -179.5}
+    response = client.get("/data/within", params=bbox, headers=headers)
+    assert [row["device_id"] for row in response.json()] == ["fiji-east", "fiji-west"]
+
+def test_track_simplified_and_encoded(auth_token):
+    import numpy as np
+    from app.track import encode_polyline
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    # Ligne droite vers le nord avec un seul détour de ~300 m (un point
+    # toutes les 10 s, sous INGEST_MAX_SPEED_MPS)
+    points = [
+        {"device_id": "track-device", "lat": 45.0 + i * 0.0001, "lon": 5.0 + (0.004 if i == 50 else 0.0),
+         "timestamp": f"2024-10-01T10:{i * 10 // 60:02d}:{i * 10 % 60:02d}Z"}
+        for i in range(101)
+    ]
+    client.post("/data/batch", json={"points": points}, headers=headers)
+    params = {"device_id": "track-device", "start": "2024-10-01T00:00:00Z", "end": "2024-10-02T00:00:00Z"}
+
+    raw = client.get("/data/track", params={**params, "encoding": "json"}, headers=headers).json()
+    assert raw["raw_count"] == raw["count"] == 101
+    assert raw["points"][0] == [45.0, 5.0, 1727776800.0]
+
+    for algorithm in ("dp", "vw"):
+        response = client.get("/data/track", params={**params, "encoding": "json", "tolerance_m": 10, "algorithm": algorithm}, headers=headers)
+        kept = response.json()["points"]
+        assert [p[1] for p in kept] == [5.0, 5.0, 5.004, 5.0, 5.0]
+
+    encoded = client.get("/data/track", params={**params, "tolerance_m": 10}, headers=headers).json()
+    assert encoded["count"] == 5
+    assert "points" not in encoded
+    assert encoded["polyline"] == encode_polyline(np.array([p[0] for p in kept]), np.array([p[1] for p in kept]))
+
+def test_polyline_encoding_reference():
+    import numpy as np
+    from app.track import encode_polyline
+    # Exemple de la documentation Google
+    lat = np.array([38.5, 40.7, 43.252])
+    lon = np.array([-120.2, -120.95, -126.453])
+    assert encode_polyline(lat, lon) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+def test_create_gps_data_batch_binary(auth_token):
+    from datetime import timedelta, timezone
+    from app.binary import BINARY_MEDIA_TYPE, encode_batch, encode_block
+    headers = {"Authorization": f"Bearer {auth_token}", "Content-Type": BINARY_MEDIA_TYPE}
+    start = datetime(2024, 11, 1, 8, 0, tzinfo=timezone.utc)
+    times = [start + timedelta(seconds=5 * i) for i in range(3)]
+    payload = encode_batch([
+        encode_block("binary-a", times, [48.8566, 48.8567, 48.8565], [2.3522, 2.3524, 2.3521]),
+        encode_block("binary-b", times[:1], [-33.87], [151.21]),
+    ])
+    # En-tête, puis par appareil : nom, base (20 octets) et 12 octets par point
+    assert len(payload) == 4 + (9 + 20 + 3 * 12) + (9 + 20 + 12)
+
+    response = client.post("/data/batch", content=payload, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 4
+    assert response.json()["duplicates"] == 0
+
+    rows = client.get("/data/", params={"device_id": "binary-a", "after": "2024-11-01T00:00:00Z"}, headers={"Authorization": headers["Authorization"]}).json()
+    assert [(row["lat"], row["lon"]) for row in rows] == [(48.8566, 2.3522), (48.8567, 2.3524), (48.8565, 2.3521)]
+    assert rows[1]["timestamp"].startswith("2024-11-01T08:00:05")
+
+    # Renvoi du même lot : doublons ignorés
+    response = client.post("/data/batch", content=payload, headers=headers)
+    assert response.json()["duplicates"] == 4
+
+def test_create_gps_data_batch_binary_malformed(auth_token):
+    from app.binary import BINARY_MEDIA_TYPE, encode_batch
+    headers = {"Authorization": f"Bearer {auth_token}", "Content-Type": BINARY_MEDIA_TYPE}
+    response = client.post("/data/batch", content=b"XX\x01\x00", headers=headers)
+    assert response.status_code == 400
+    # Bloc annonçant plus de points qu'il n'en contient
+    truncated = encode_batch([b"\x01a" + (1000).to_bytes(4, "little") + bytes(16)])
+    response = client.post("/data/batch", content=truncated, headers=headers)
+    assert response.status_code == 400
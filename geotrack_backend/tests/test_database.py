@@ -0,0 +1,30 @@
+from sqlalchemy import text
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import engine, create_db_engine
+
+client = TestClient(app)
+
+def test_sqlite_pragmas_are_applied():
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+def test_in_memory_sqlite_uses_a_single_connection():
+    memory_engine = create_db_engine("sqlite://")
+    with memory_engine.connect() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        connection.commit()
+    with memory_engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM t")).scalar() == 0
+
+def test_pool_metrics_are_exposed(tmp_path):
+    # Un autre moteur (scripts, tests) ne remplace pas les jauges de celui de l'application
+    other = create_db_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    with engine.connect():
+        metrics = client.get("/metrics", headers={"Accept": "application/json"}).json()
+    assert metrics["db_pool_checked_out"] >= 1
+    assert 0 < metrics["db_pool_saturation"] <= 1
+    assert metrics["db_pool_checkout_seconds_count"] >= 1
+    other.dispose()
@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+
+client = TestClient(app)
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def positions(headers):
+    from app.routes.devices import positions_cache
+    positions_cache.clear()
+    response = client.get("/devices/positions", headers=headers)
+    assert response.status_code == 200
+    return {row["device_id"]: row for row in response.json()}
+
+def test_last_position_follows_newest_point(auth_headers):
+    points = [
+        {"device_id": "fleet-a", "lat": 1.0, "lon": 1.0, "timestamp": "2024-08-01T10:00:00"},
+        {"device_id": "fleet-a", "lat": 3.0, "lon": 3.0, "timestamp": "2024-08-01T12:00:00"},
+        {"device_id": "fleet-a", "lat": 2.0, "lon": 2.0, "timestamp": "2024-08-01T11:00:00"},
+        {"device_id": "fleet-b", "lat": 5.0, "lon": 5.0, "timestamp": "2024-08-01T09:00:00"},
+    ]
+    client.post("/data/batch", json={"points": points}, headers=auth_headers)
+
+    fleet = positions(auth_headers)
+    assert (fleet["fleet-a"]["lat"], fleet["fleet-a"]["timestamp"]) == (3.0, "2024-08-01T12:00:00")
+    assert fleet["fleet-b"]["lat"] == 5.0
+
+def test_late_arrival_does_not_move_position_back(auth_headers):
+    client.post("/data/", json={"device_id": "fleet-late", "lat": 10.0, "lon": 10.0, "timestamp": "2024-08-02T12:00:00"}, headers=auth_headers)
+    # Rejeu hors ligne d'un point plus ancien
+    client.post("/data/", json={"device_id": "fleet-late", "lat": 9.0, "lon": 9.0, "timestamp": "2024-08-02T08:00:00"}, headers=auth_headers)
+    assert positions(auth_headers)["fleet-late"]["lat"] == 10.0
+
+    client.post("/data/", json={"device_id": "fleet-late", "lat": 11.0, "lon": 11.0, "timestamp": "2024-08-02T13:00:00"}, headers=auth_headers)
+    assert positions(auth_headers)["fleet-late"]["lat"] == 11.0
+
+def test_positions_served_from_snapshot(auth_headers):
+    positions(auth_headers)
+    client.post("/data/", json={"device_id": "fleet-new", "lat": 1.0, "lon": 1.0, "timestamp": "2024-08-03T10:00:00"}, headers=auth_headers)
+
+    # Instantané encore valide : le nouvel appareil n'apparaît qu'après expiration
+    response = client.get("/devices/positions", headers=auth_headers)
+    assert "fleet-new" not in {row["device_id"] for row in response.json()}
+    assert "fleet-new" in positions(auth_headers)
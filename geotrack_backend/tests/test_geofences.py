@@ -0,0 +1,171 @@
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+from app.geofence import GeofenceIndex
+
+client = TestClient(app)
+
+START = datetime(2024, 10, 1, 8, 0, 0)
+# Zones loin des points des autres tests (Le Cap)
+DEPOT = [[-33.90, 18.40], [-33.90, 18.42], [-33.92, 18.42], [-33.92, 18.40]]
+# Zone en L (concave) : le coin sud-est est à l'extérieur
+SITE = [[-33.95, 18.45], [-33.95, 18.47], [-33.96, 18.47], [-33.96, 18.46], [-33.97, 18.46], [-33.97, 18.45]]
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+@pytest.fixture
+def fences(auth_headers):
+    created = []
+    for name, polygon in (("depot", DEPOT), ("site", SITE)):
+        response = client.post("/geofences/", json={"name": name, "polygon": polygon}, headers=auth_headers)
+        assert response.status_code == 201
+        created.append(response.json()["id"])
+    yield created
+    for fence_id in created:
+        client.delete(f"/geofences/{fence_id}", headers=auth_headers)
+
+def post(device_id, points, headers):
+    response = client.post("/data/batch", json={"points": [
+        {"device_id": device_id, "lat": lat, "lon": lon, "timestamp": (START + timedelta(minutes=minute)).isoformat()}
+        for minute, lat, lon in points
+    ]}, headers=headers)
+    assert response.status_code == 200
+
+def events(device_id, headers):
+    response = client.get("/geofences/events", params={"device_id": device_id}, headers=headers)
+    assert response.status_code == 200
+    return [(e["geofence_id"], e["event"], e["timestamp"][:16]) for e in response.json()]
+
+def ray_cast(lat, lon, polygon):
+    # Référence point par point, sans index ni NumPy
+    inside = False
+    for (lat1, lon1), (lat2, lon2) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+            inside = not inside
+    return inside
+
+def test_index_concave_polygon():
+    index = GeofenceIndex([(7, SITE)])
+    lat = [-33.955, -33.955, -33.965, -33.965, -33.98]
+    lon = [18.455, 18.465, 18.455, 18.465, 18.455]
+    assert index.locate(lat, lon) == [{7}, {7}, {7}, set(), set()]
+
+def test_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    polygons = []
+    for _ in range(300):
+        lat0, lon0 = rng.uniform(45, 46), rng.uniform(5, 6)
+        # 3 à 40 sommets : plusieurs largeurs de matrices d'arêtes
+        vertices = int(rng.integers(3, 41))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+        radius = rng.uniform(0.001, 0.05, vertices)
+        polygons.append(np.column_stack((lat0 + radius * np.sin(angles), lon0 + radius * np.cos(angles))).tolist())
+    # Une zone plus grande que GEOFENCE_MAX_CELLS cellules, gardée hors de la grille
+    polygons.append([[44.9, 4.9], [44.9, 6.1], [46.1, 6.1], [46.1, 4.9]])
+    index = GeofenceIndex(enumerate(polygons), cell_deg=0.01, max_cells=256)
+    lat, lon = rng.uniform(44.8, 46.2, 2000), rng.uniform(4.8, 6.2, 2000)
+
+    expected = [
+        {fence_id for fence_id, polygon in enumerate(polygons) if ray_cast(y, x, polygon)}
+        for y, x in zip(lat.tolist(), lon.tolist())
+    ]
+    assert index.locate(lat, lon) == expected
+    assert index.locate(lat[:1], lon[:1]) == expected[:1]
+
+def test_geofence_crud_and_validation(auth_headers):
+    response = client.post("/geofences/", json={"name": "bad", "polygon": [[0, 0], [1, 1]]}, headers=auth_headers)
+    assert response.status_code == 422
+    response = client.post("/geofences/", json={"name": "bad", "polygon": [[0, 0], [1, 1], [91, 0]]},
+                           headers=auth_headers)
+    assert response.status_code == 422
+
+    response = client.post("/geofences/", json={"name": "crud", "polygon": DEPOT}, headers=auth_headers)
+    fence_id = response.json()["id"]
+    assert client.get(f"/geofences/{fence_id}", headers=auth_headers).json()["polygon"] == DEPOT
+    response = client.put(f"/geofences/{fence_id}", json={"name": "renamed", "polygon": SITE}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["name"] == "renamed"
+    assert fence_id in [f["id"] for f in client.get("/geofences/", headers=auth_headers).json()]
+
+    assert client.delete(f"/geofences/{fence_id}", headers=auth_headers).status_code == 204
+    assert client.get(f"/geofences/{fence_id}", headers=auth_headers).status_code == 404
+    assert client.delete(f"/geofences/{fence_id}", headers=auth_headers).status_code == 404
+
+def test_enter_exit_events_on_ingest(auth_headers, fences):
+    depot, site = fences
+    device = "geofence-device"
+    # Dans le dépôt, puis dehors, puis sur le site (lot dans le désordre)
+    post(device, [
+        (2, -33.93, 18.43),
+        (0, -33.93, 18.43),
+        (1, -33.91, 18.41),
+        (3, -33.955, 18.455),
+    ], auth_headers)
+    assert events(device, auth_headers) == [
+        (depot, "enter", "2024-10-01T08:01"),
+        (depot, "exit", "2024-10-01T08:02"),
+        (site, "enter", "2024-10-01T08:03"),
+    ]
+
+    # Un seul point : recherche dans l'index et état relu en base
+    post(device, [(4, -33.965, 18.465)], auth_headers)
+    assert events(device, auth_headers)[-1] == (site, "exit", "2024-10-01T08:04")
+
+    # Point en retard (antérieur au dernier changement) : aucun événement
+    post(device, [(1.5, -33.955, 18.455)], auth_headers)
+    assert len(events(device, auth_headers)) == 4
+
+def test_late_point_after_last_change_is_ignored(auth_headers, fences):
+    depot, _ = fences
+    device = "geofence-late"
+    for minute in (0, 10, 20):
+        post(device, [(minute, -33.91, 18.41)], auth_headers)
+    # Dehors à 08:05, reçu après le point de 08:20 : plus ancien que le
+    # dernier point évalué, il ne produit ni sortie ni nouvelle entrée
+    post(device, [(5, -33.91, 18.425)], auth_headers)
+    post(device, [(30, -33.91, 18.41)], auth_headers)
+    assert events(device, auth_headers) == [(depot, "enter", "2024-10-01T08:00")]
+
+def test_indexed_gauge_follows_application_registry(auth_headers, fences):
+    from app import metrics
+    from app.geofence import GeofenceRegistry, geofences
+
+    post("geofence-gauge", [(0, -33.91, 18.41)], auth_headers)
+    # Un registre créé à part ne remplace pas celui de l'application
+    GeofenceRegistry()
+    assert metrics.snapshot()["geofences_indexed"] == len(geofences) >= 2
+
+def test_deleted_fence_is_forgotten(auth_headers, fences):
+    depot, _ = fences
+    device = "geofence-deleted"
+    post(device, [(0, -33.91, 18.41)], auth_headers)
+    assert events(device, auth_headers) == [(depot, "enter", "2024-10-01T08:00")]
+
+    client.delete(f"/geofences/{depot}", headers=auth_headers)
+    post(device, [(1, -33.93, 18.43)], auth_headers)
+    assert events(device, auth_headers) == []
+
+def test_missing_state_is_created_before_locking(auth_headers, fences):
+    # FOR UPDATE ne verrouille que des lignes existantes : l'état d'un nouvel
+    # appareil est inséré (ON CONFLICT DO NOTHING) avant d'être relu
+    from sqlalchemy import event
+    from app.database import get_engine
+    engine = get_engine()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "device_geofence_state" in statement:
+            statements.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        post("geofence-new-device", [(0, -33.91, 18.41)], auth_headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert statements[:2] == ["INSERT", "SELECT"]
+    assert events("geofence-new-device", auth_headers) == [(fences[0], "enter", "2024-10-01T08:00")]
@@ -0,0 +1,104 @@
+import os
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import SessionLocal
+from app.ingest import insert_points
+from app.maintenance import ensure_partitions, run_maintenance
+from app.models import GPSData, GPSDataMinute
+from app.schemas import GPSDataRequest
+
+client = TestClient(app)
+
+# Date de référence antérieure aux points des autres tests, qui ne doivent
+# pas être purgés
+NOW = datetime(2000, 6, 15, 12, 0, tzinfo=timezone.utc)
+
+def store(device_id, timestamps, lat=10.0):
+    db = SessionLocal()
+    try:
+        insert_points(db, [
+            GPSDataRequest(device_id=device_id, lat=lat + i, lon=20.0, timestamp=ts)
+            for i, ts in enumerate(timestamps)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def minutes(device_id):
+    db = SessionLocal()
+    try:
+        return [
+            (row.bucket, row.lat, row.point_count)
+            for row in db.query(GPSDataMinute).filter(GPSDataMinute.device_id == device_id).order_by(GPSDataMinute.bucket)
+        ]
+    finally:
+        db.close()
+
+def raw_count(device_id):
+    db = SessionLocal()
+    try:
+        return db.query(GPSData).filter(GPSData.device_id == device_id).count()
+    finally:
+        db.close()
+
+def test_old_points_rolled_up_per_minute_then_purged():
+    store("retention-device", [
+        "2000-01-10T08:00:05", "2000-01-10T08:00:35", "2000-01-10T08:01:10",  # expirés
+        "2000-06-14T08:00:00",  # récent, conservé tel quel
+    ])
+
+    result = run_maintenance(NOW)
+    assert result["points_compacted"] >= 3
+    assert raw_count("retention-device") == 1
+
+    rows = minutes("retention-device")
+    assert [(bucket.replace(tzinfo=None), lat, count) for bucket, lat, count in rows] == [
+        (datetime(2000, 1, 10, 8, 0), 10.5, 2),
+        (datetime(2000, 1, 10, 8, 1), 12.0, 1),
+    ]
+
+def test_late_point_merged_into_existing_minute():
+    store("late-device", ["2000-01-11T09:00:00"], lat=10.0)
+    run_maintenance(NOW)
+    # Point renvoyé hors ligne après la première passe, même minute
+    store("late-device", ["2000-01-11T09:00:30"], lat=13.0)
+    run_maintenance(NOW)
+
+    (bucket, lat, count), = minutes("late-device")
+    assert count == 2
+    assert lat == 11.5
+    assert raw_count("late-device") == 0
+
+def test_rollups_past_retention_are_purged():
+    store("expired-device", ["1999-01-01T00:00:00"])
+    run_maintenance(NOW)
+    assert minutes("expired-device") == []
+    assert raw_count("expired-device") == 0
+
+@pytest.mark.skipif(not os.getenv("POSTGRES_URL"), reason="POSTGRES_URL non défini")
+def test_partition_created_over_rows_in_default_partition():
+    # Mois manqué : ses points sont déjà dans la partition par défaut
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import Session
+    engine = create_engine(os.environ["POSTGRES_URL"])
+    schema = f"geotrack_test_{os.getpid()}"
+    with Session(engine) as db:
+        db.execute(text(f"CREATE SCHEMA {schema}"))
+        db.execute(text(f"SET search_path TO {schema}"))
+        try:
+            db.execute(text(
+                "CREATE TABLE gps_data (id SERIAL, device_id TEXT NOT NULL, lat FLOAT, lon FLOAT, "
+                "timestamp TIMESTAMPTZ NOT NULL) PARTITION BY RANGE (timestamp)"
+            ))
+            db.execute(text("CREATE TABLE gps_data_default PARTITION OF gps_data DEFAULT"))
+            db.execute(text("INSERT INTO gps_data (device_id, lat, lon, timestamp) VALUES ('a', 1, 2, '2000-06-20T10:00:00Z')"))
+
+            assert ensure_partitions(db, NOW, months_ahead=1) == ["gps_data_2000_06", "gps_data_2000_07"]
+            assert db.execute(text("SELECT count(*) FROM gps_data_2000_06")).scalar() == 1
+            assert db.execute(text("SELECT count(*) FROM gps_data_default")).scalar() == 0
+        finally:
+            db.rollback()
+            db.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            db.commit()
@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+from app.metrics import Histogram, PROMETHEUS_CONTENT_TYPE
+
+client = TestClient(app)
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def json_metrics():
+    return client.get("/metrics", headers={"Accept": "application/json"}).json()
+
+def test_prometheus_exposition():
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == f"{PROMETHEUS_CONTENT_TYPE}; charset=utf-8"
+    lines = response.text.splitlines()
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    assert any(line.startswith('http_request_duration_seconds_count{method="GET",route="/health",status="200"} ') for line in lines)
+    # La requête /metrics elle-même est en cours
+    assert "http_requests_in_flight 1" in lines
+
+def test_unmatched_paths_share_a_label():
+    client.get("/nope/123")
+    client.get("/nope/456")
+    metrics = json_metrics()
+    assert metrics['http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'] >= 2
+    assert not any("/nope/" in key for key in metrics)
+
+def test_db_queries_are_counted_per_route(auth_headers):
+    client.get("/data/", params={"device_id": "metrics-device"}, headers=auth_headers)
+    metrics = json_metrics()
+    assert metrics['http_request_db_queries_count{method="GET",route="/data/"}'] >= 1
+    assert metrics['http_request_db_queries_sum{method="GET",route="/data/"}'] >= 1
+    assert metrics['db_query_duration_seconds_count{operation="SELECT",table="gps_data"}'] >= 1
+
+def test_sync_logs_are_counted(auth_headers):
+    key = 'sync_logs_total{status="success"}'
+    before = json_metrics().get(key, 0)
+    client.post("/data/", json={
+        "device_id": "metrics-device",
+        "lat": 1.0,
+        "lon": 2.0,
+        "timestamp": "2024-11-01T10:00:00",
+    }, headers=auth_headers)
+    assert json_metrics()[key] == before + 1
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test", ("path",), buckets=(0.1, 1.0))
+    child = histogram.labels('a"b')
+    for value in (0.05, 0.5, 0.5, 5.0):
+        child.observe(value)
+    samples = dict(histogram.samples())
+    assert samples['test_seconds_bucket{path="a\\"b",le="0.1"}'] == 1
+    assert samples['test_seconds_bucket{path="a\\"b",le="1.0"}'] == 3
+    assert samples['test_seconds_bucket{path="a\\"b",le="+Inf"}'] == 4
+    assert samples['test_seconds_count{path="a\\"b"}'] == 4
+    assert samples['test_seconds_sum{path="a\\"b"}'] == pytest.approx(6.05)
@@ -0,0 +1,50 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from app.main import app
+from app.auth import create_access_token
+from app.middleware import CompressionMiddleware
+
+client = TestClient(app)
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def test_large_list_is_gzipped(auth_headers):
+    points = [
+        {"device_id": "gzip-device", "lat": 1.0, "lon": 2.0, "timestamp": f"2024-12-01T10:{i // 60:02d}:{i % 60:02d}"}
+        for i in range(200)
+    ]
+    client.post("/data/batch", json={"points": points}, headers=auth_headers)
+
+    response = client.get("/data/", params={"device_id": "gzip-device", "limit": 200}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    rows = response.json()
+    assert len(rows) == 200
+    assert set(rows[0]) == {"id", "device_id", "lat", "lon", "timestamp", "synced", "created_at"}
+
+def test_small_response_not_compressed():
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+def test_event_stream_not_compressed():
+    async def events(request):
+        async def body():
+            yield "data: " + "x" * 2000 + "\n\n"
+            yield "data: y\n\n"
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    async def text(request):
+        return PlainTextResponse("x" * 2000)
+
+    local_app = Starlette(routes=[Route("/events", events), Route("/text", text)])
+    local_app.add_middleware(CompressionMiddleware, minimum_size=500)
+    local_client = TestClient(local_app)
+
+    response = local_client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.text.endswith("data: y\n\n")
+    assert local_client.get("/text", headers={"Accept-Encoding": "gzip"}).headers["Content-Encoding"] == "gzip"
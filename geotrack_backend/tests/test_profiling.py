@@ -0,0 +1,56 @@
+import pytest
+import anyio.to_thread
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+from app import database
+
+client = TestClient(app)
+
+ADMIN_HEADERS = {"X-Admin-Token": "test-diagnostics-token"}
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def test_admin_requires_token():
+    assert client.get("/admin/diagnostics").status_code == 403
+    assert client.get("/admin/diagnostics", headers={"X-Admin-Token": "nope"}).status_code == 403
+    assert client.get("/admin/diagnostics", headers=ADMIN_HEADERS).status_code == 200
+
+def test_profile_on_demand_includes_threadpool_work(auth_headers):
+    response = client.get("/data/", params={"device_id": "profiled-device"},
+                          headers={**auth_headers, "X-Profile": "test-diagnostics-token"})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    listing = client.get("/admin/diagnostics", headers=ADMIN_HEADERS).json()
+    entry = next(p for p in listing["profiles"] if str(p["id"]) == profile_id)
+    assert entry["path"] == "/data/"
+    assert entry["status"] == 200
+    assert "report" not in entry
+
+    report = client.get(f"/admin/profiles/{profile_id}", headers=ADMIN_HEADERS).text
+    # _list_points s'exécute dans le pool de threads
+    assert "_list_points" in report
+    # Seuls les appels de l'application sont profilés : anyio n'est pas modifié
+    assert anyio.to_thread.run_sync.__module__ == "anyio.to_thread"
+
+def test_profile_header_needs_the_token(auth_headers):
+    response = client.get("/data/", headers={**auth_headers, "X-Profile": "1"})
+    assert "X-Profile-Id" not in response.headers
+
+def test_unknown_profile():
+    assert client.get("/admin/profiles/999999", headers=ADMIN_HEADERS).status_code == 404
+
+def test_slow_queries_are_logged_with_plan(auth_headers, monkeypatch):
+    client.delete("/admin/diagnostics", headers=ADMIN_HEADERS)
+    monkeypatch.setattr(database, "SLOW_QUERY_MS", 1e-6)
+    client.get("/data/", params={"device_id": "slow-device"}, headers=auth_headers)
+    monkeypatch.undo()
+
+    slow = client.get("/admin/diagnostics", headers=ADMIN_HEADERS).json()["slow_queries"]
+    entry = next(q for q in slow if "FROM gps_data" in q["statement"])
+    assert entry["path"] == "/data/"
+    assert any("gps_data" in line for line in entry["plan"])
+    assert "slow-device" not in str(entry)
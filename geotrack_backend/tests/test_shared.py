@@ -0,0 +1,182 @@
+import asyncio
+import math
+import os
+import time
+import orjson
+import pytest
+from sqlalchemy import create_engine, inspect
+from app import cache
+from app.cache import TTLCache
+from app.migrate import create_schema
+from app.pubsub import SUBSCRIBERS_KEY, Hub
+from app.schemas import ConfigResponse, GPSDataRequest
+from app.shared import MemoryBackend, RedisBackend
+
+class DictBackend(MemoryBackend):
+    # Backend partagé minimal, en mémoire : mêmes opérations que RedisBackend,
+    # messages et valeurs sérialisés comme ils le seraient sur le réseau
+    remote = True
+
+    def __init__(self):
+        super().__init__()
+        self.values = {}
+
+    def get_many(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def set_many(self, items, ttl):
+        self.values.update(items)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        for key in [key for key in self.values if key.startswith(prefix)]:
+            del self.values[key]
+
+    def publish(self, channel, message):
+        super().publish(channel, orjson.loads(orjson.dumps(message)))
+
+def make_point(device_id, second=0):
+    return GPSDataRequest(device_id=device_id, lat=1.0, lon=2.0, timestamp=f"2024-09-01T10:00:{second:02d}")
+
+def drain(subscription):
+    return asyncio.run(subscription.get(0.01))
+
+def test_memory_counters_and_leases():
+    backend = MemoryBackend()
+    # Fenêtre fixe : le délai part du premier incrément
+    assert [backend.incr("hits", ttl=0.05) for _ in range(3)] == [1, 2, 3]
+    time.sleep(0.06)
+    assert backend.incr("hits", ttl=0.05) == 1
+    assert backend.incr("subscribers", -1) == -1
+
+    assert backend.acquire("job", ttl=60)
+    assert not backend.acquire("job", ttl=60)
+    backend.release("job")
+    assert backend.acquire("job", ttl=60)
+
+def test_cache_get_many_and_set_many():
+    local = TTLCache("test_local", maxsize=3, ttl=60)
+    local.set_many({"a": 1, "b": 2})
+    local.set("c", 3, ttl=0)
+    assert local.get_many(["a", "b", "c", "d"]) == {"a": 1, "b": 2}
+    # "c" expiré est retiré à la lecture ; au-delà de maxsize, le moins récent part
+    assert len(local) == 2
+    local.set_many({"d": 4, "e": 5})
+    assert local.get_many(["a", "b", "d", "e"]) == {"b": 2, "d": 4, "e": 5}
+
+def test_shared_cache_between_workers(monkeypatch):
+    backend = DictBackend()
+    monkeypatch.setattr(cache, "shared_state", backend)
+    # Deux workers : deux instances du même cache sur un même backend
+    first = TTLCache("test_shared", ttl=60, shared=True)
+    second = TTLCache("test_shared", ttl=60, shared=True)
+    unshared = TTLCache("test_unshared", ttl=60)
+
+    first.set("device", (1.0, 45.0, 5.0, math.nan))
+    unshared.set("device", 1)
+    # JSON : tuple relu comme une liste, NaN comme None
+    assert second.get("device") == [1.0, 45.0, 5.0, None]
+    assert list(backend.values) == ["cache:test_shared:device"]
+
+    second.delete("device")
+    assert first.get_many(["device"]) == {}
+    first.set_many({"a": 1, "b": 2})
+    second.clear()
+    assert backend.values == {}
+
+def test_shared_cache_codecs(monkeypatch):
+    backend = DictBackend()
+    monkeypatch.setattr(cache, "shared_state", backend)
+    configs = TTLCache(
+        "test_config", ttl=60, shared=True,
+        dumps=lambda config: config.model_dump_json().encode(),
+        loads=ConfigResponse.model_validate_json,
+    )
+    bodies = TTLCache("test_body", ttl=60, shared=True, dumps=bytes, loads=bytes)
+
+    config = ConfigResponse(x_parameter=5, y_parameter=15, device_id="a")
+    configs.set("user", config)
+    bodies.set("all", b'[{"device_id":"a"}]')
+    assert configs.get("user") == config
+    assert bodies.get("all") == b'[{"device_id":"a"}]'
+    assert all(isinstance(value, bytes) for value in backend.values.values())
+
+def test_hub_delivers_across_workers():
+    backend = DictBackend()
+    publisher, listener = Hub(backend=backend), Hub(backend=backend)
+    assert not publisher.active
+
+    subscription = listener.subscribe(["a"])
+    # Abonné dans l'autre worker : compteur partagé mis à jour puis relu par
+    # les tâches de fond des deux workers
+    asyncio.run(listener._sync_subscribers())
+    assert not publisher.active
+    asyncio.run(publisher._sync_subscribers())
+    assert publisher.active
+    publisher.publish([make_point("a", 1), make_point("b", 2)])
+    (chunk,) = drain(subscription)
+    assert chunk.count("data: ") == 1 and "10:00:01" in chunk
+
+    listener.unsubscribe(subscription)
+    asyncio.run(listener._sync_subscribers())
+    asyncio.run(publisher._sync_subscribers())
+    assert not publisher.active
+
+def test_hub_stop_withdraws_its_subscribers():
+    backend = DictBackend()
+    hub = Hub(backend=backend)
+
+    async def run():
+        await hub.start()
+        hub.subscribe()
+        hub.subscribe(["a"])
+        for _ in range(50):
+            if hub._remote_subscribers == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert backend.incr(SUBSCRIBERS_KEY, 0) == 2
+        await hub.stop()
+
+    asyncio.run(run())
+    # Arrêt du worker : ses abonnés ne comptent plus pour les autres
+    assert backend.incr(SUBSCRIBERS_KEY, 0) == 0
+
+def test_create_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    tables = create_schema(engine)
+    assert {"gps_data", "devices", "sync_logs"} <= set(tables)
+    assert set(tables) <= set(inspect(engine).get_table_names())
+    # Idempotent : relancé à chaque déploiement
+    assert create_schema(engine) == tables
+
+@pytest.mark.skipif(not os.getenv("REDIS_URL"), reason="REDIS_URL non défini")
+def test_redis_backend():
+    pytest.importorskip("redis")
+    backend = RedisBackend(os.environ["REDIS_URL"], prefix=f"geotrack-test-{os.getpid()}:")
+    backend.set_many({"k": b"v"}, ttl=60)
+    assert backend.get_many(["k", "missing"]) == [b"v", None]
+    backend.delete_prefix("")
+    assert backend.get_many(["k"]) == [None]
+    assert backend.incr("n", 2, ttl=60) == 2
+    assert backend.acquire("lease", 60) and not backend.acquire("lease", 60)
+    backend.release("lease")
+    backend.delete("n")
+
+    received = []
+
+    async def roundtrip():
+        backend.subscribe("channel", received.append)
+        await backend.start()
+        await asyncio.sleep(0.1)
+        backend.publish("channel", {"a": ["x"]})
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.02)
+        await backend.stop()
+
+    asyncio.run(roundtrip())
+    assert received == [{"a": ["x"]}]
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app import metrics
+from app.main import app
+from app.auth import create_access_token
+from app.binary import BINARY_MEDIA_TYPE, encode_batch, encode_block
+from app.pubsub import Hub, hub
+from app.schemas import GPSDataRequest
+
+client = TestClient(app)
+
+def make_point(device_id, second=0):
+    return GPSDataRequest(device_id=device_id, lat=1.0, lon=2.0, timestamp=f"2024-09-01T10:00:{second:02d}")
+
+def drain(subscription):
+    return asyncio.run(subscription.get(0.01))
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def test_hub_filters_by_device():
+    local_hub = Hub(buffer_size=10)
+    everything = local_hub.subscribe()
+    only_a = local_hub.subscribe(["a"])
+    # La jauge suit le hub de l'application, pas ce hub de test
+    assert metrics.snapshot()["stream_subscribers"] == 0
+
+    local_hub.publish([make_point("a", 1), make_point("b", 2), make_point("a", 3)])
+
+    # Un message par lot, contenant les événements du lot qui concernent l'abonné
+    (chunk,) = drain(only_a)
+    assert chunk.count("data: ") == 2 and '"b"' not in chunk
+    (chunk,) = drain(everything)
+    assert chunk.count("data: ") == 3
+
+    local_hub.unsubscribe(only_a)
+    local_hub.unsubscribe(everything)
+    assert local_hub.subscriber_count() == 0
+
+def test_slow_subscriber_drops_oldest():
+    local_hub = Hub(buffer_size=3)
+    subscription = local_hub.subscribe(["slow"])
+    for second in range(5):
+        local_hub.publish([make_point("slow", second)])
+
+    messages = drain(subscription)
+    assert len(messages) == 3
+    assert "10:00:02" in messages[0] and "10:00:04" in messages[-1]
+    assert drain(subscription) == []
+
+def test_ingest_publishes_new_points_only(auth_headers):
+    subscription = hub.subscribe(["stream-device"])
+    try:
+        point = {"device_id": "stream-device", "lat": 1.0, "lon": 2.0, "timestamp": "2024-09-01T12:00:00"}
+        client.post("/data/", json=point, headers=auth_headers)
+        client.post("/data/", json=point, headers=auth_headers)  # renvoi : non diffusé
+        client.post("/data/batch", json={"points": [{**point, "timestamp": "2024-09-01T12:00:05"}]}, headers=auth_headers)
+
+        messages = drain(subscription)
+        assert len(messages) == 2
+        assert "12:00:00" in messages[0] and "12:00:05" in messages[1]
+
+        # Lot mêlant un renvoi, un doublon interne et un point avec fuseau :
+        # seuls les points nouveaux sont diffusés, une fois chacun
+        new = {**point, "timestamp": "2024-09-01T12:00:10"}
+        batch = [{**point, "timestamp": "2024-09-01T12:00:05"}, new, new, {**point, "timestamp": "2024-09-01T14:00:15+02:00"}]
+        client.post("/data/batch", json={"points": batch}, headers=auth_headers)
+        (chunk,) = drain(subscription)
+        assert chunk.count("data: ") == 2 and "12:00:10" in chunk and "14:00:15" in chunk
+
+        # Format binaire : même règle
+        payload = encode_batch([encode_block(
+            "stream-device",
+            [datetime(2024, 9, 1, 12, 0, 10, tzinfo=timezone.utc), datetime(2024, 9, 1, 12, 0, 20, tzinfo=timezone.utc)],
+            [1.0, 1.0], [2.0, 2.0],
+        )])
+        client.post("/data/batch", content=payload, headers={**auth_headers, "Content-Type": BINARY_MEDIA_TYPE})
+        (chunk,) = drain(subscription)
+        assert chunk.count("data: ") == 1 and "12:00:20" in chunk
+    finally:
+        hub.unsubscribe(subscription)
+
+def test_stream_requires_token():
+    response = client.get("/data/stream")
+    assert response.status_code == 403
+
+def test_insert_rows_returns_stored_points_in_another_timezone():
+    # PostgreSQL lit un horodatage sans fuseau dans le fuseau de la session :
+    # simulé sur SQLite en décalant l'heure envoyée par l'INSERT (UTC+2)
+    from sqlalchemy import event
+    from app.database import SessionLocal, get_engine
+    from app.ingest import insert_rows
+
+    def shift(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO gps_data "):
+            parameters = tuple(
+                "2024-09-02 08:00:00.000000" if value == "2024-09-02 10:00:00.000000" else value
+                for value in parameters
+            )
+        return statement, parameters
+
+    engine = get_engine()
+    event.listen(engine, "before_cursor_execute", shift, retval=True)
+    db = SessionLocal()
+    try:
+        created = insert_rows(db, [
+            {"device_id": "stream-tz", "lat": 1.0, "lon": 2.0, "timestamp": datetime(2024, 9, 2, 10, 0)},
+        ])
+        db.commit()
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", shift)
+
+    # Point relu tel qu'enregistré, sans KeyError sur l'horodatage
+    assert [(row["device_id"], row["lat"], row["timestamp"]) for row in created] == [
+        ("stream-tz", 1.0, datetime(2024, 9, 2, 8, 0)),
+    ]
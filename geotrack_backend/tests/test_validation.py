@@ -0,0 +1,116 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from fastapi.testclient import TestClient
+from app.main import app
+from app.auth import create_access_token
+from app.database import SessionLocal
+from app.models import SyncLog
+from app.validation import last_points, validate_rows
+
+client = TestClient(app)
+
+START = datetime(2024, 11, 4, 8, 0, 0)
+# ~11 m entre deux points à 0.0001 degré de latitude
+STEP_DEG = 0.0001
+
+@pytest.fixture
+def auth_headers():
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+def point(device_id, seconds, lat, lon=5.0):
+    return {"device_id": device_id, "lat": lat, "lon": lon, "timestamp": (START + timedelta(seconds=seconds)).isoformat()}
+
+def last_log(device_id):
+    with SessionLocal() as db:
+        return db.query(SyncLog).filter(SyncLog.device_id == device_id).order_by(SyncLog.id.desc()).first()
+
+def test_batch_rejections(auth_headers):
+    device = "validation-batch"
+    future = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    points = [
+        point(device, 0, 45.0),
+        point(device, 10, 95.0),
+        point(device, 20, 0.0, 0.0),
+        {"device_id": device, "lat": 45.0, "lon": 5.0, "timestamp": future},
+        {"device_id": device, "lat": 45.0, "lon": 5.0, "timestamp": "1990-01-01T00:00:00"},
+        point(device, 30, 45.0 + STEP_DEG),
+        # Pic isolé de ~11 km en 10 s
+        point(device, 40, 45.1),
+        point(device, 50, 45.0 + 2 * STEP_DEG),
+        {"device_id": device, "lat": "nord"},
+    ]
+    response = client.post("/data/batch", json={"points": points}, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["accepted"], data["rejected"]) == (3, 6)
+    details = [r["detail"] for r in data["results"]]
+    assert [r["index"] for r in data["results"]] == list(range(9))
+    assert details[:8] == [
+        None, "coordonnées hors limites", "position (0, 0)", "horodatage dans le futur",
+        "horodatage trop ancien", None, "déplacement impossible depuis le point précédent", None,
+    ]
+    assert details[8] is not None
+
+    message = last_log(device).error_message
+    assert message.startswith("6 point(s) rejeté(s) sur 9 (")
+    assert "position (0, 0) : 1" in message
+    assert "format invalide : 1" in message
+
+def test_speed_checked_against_last_point(auth_headers):
+    device = "validation-last-point"
+    response = client.post("/data/batch", json={"points": [point(device, 0, 45.0)]}, headers=auth_headers)
+    assert response.json()["accepted"] == 1
+
+    # Premier point du lot suivant comparé au dernier point connu, en cache
+    # puis relu en base (device_last_position)
+    for clear in (False, True):
+        if clear:
+            last_points.clear()
+        response = client.post("/data/batch", json={"points": [point(device, 60, 46.0)]}, headers=auth_headers)
+        assert response.json()["rejected"] == 1
+
+    response = client.post("/data/batch", json={"points": [point(device, 60, 45.0 + STEP_DEG)]}, headers=auth_headers)
+    assert response.json()["accepted"] == 1
+
+def test_single_point_rejected(auth_headers):
+    device = "validation-single"
+    response = client.post("/data/", json=point(device, 0, 0.0, 0.0), headers=auth_headers)
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Point rejeté : position (0, 0)"
+    log = last_log(device)
+    assert (log.status, log.error_message) == ("error", "1 point(s) rejeté(s) sur 1 (position (0, 0) : 1)")
+
+    response = client.post("/data/", json=point(device, 0, 45.0), headers=auth_headers)
+    assert response.status_code == 200
+
+def test_kalman_smoothing():
+    device = "validation-kalman"
+    rows = [
+        {"device_id": device, "lat": 45.0 + (0.0002 if i % 2 else 0.0), "lon": 5.0,
+         "timestamp": START + timedelta(seconds=i)}
+        for i in range(20)
+    ]
+    with SessionLocal() as db:
+        assert validate_rows(db, rows, filters=["kalman"]) == [None] * 20
+    # Premier point inchangé, puis une oscillation de ~22 m fortement atténuée
+    assert rows[0]["lat"] == 45.0
+    spread = max(r["lat"] for r in rows[10:]) - min(r["lat"] for r in rows[10:])
+    assert spread < 0.0001
+    assert all(45.0 <= r["lat"] <= 45.0002 for r in rows)
+
+def test_last_point_is_remembered_after_commit_only():
+    device = "validation-rollback"
+
+    def rows(seconds):
+        return [{"device_id": device, "lat": 45.0, "lon": 5.0, "timestamp": START + timedelta(seconds=seconds)}]
+
+    with SessionLocal() as db:
+        # Lot annulé : il ne sert pas de référence au contrôle de vitesse
+        validate_rows(db, rows(0))
+        db.rollback()
+        assert last_points.get(device) is None
+
+        validate_rows(db, rows(10))
+        assert last_points.get(device) is None
+        db.commit()
+    assert last_points.get(device)[0] == (START + timedelta(seconds=10)).replace(tzinfo=timezone.utc).timestamp()